@@ -0,0 +1,642 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager, ExitStack, AsyncExitStack
+from queue import Queue
+from threading import Thread
+from typing import Dict, List, Any, Tuple, Callable, Set
+
+from toll_booth import tasks
+from toll_booth.obj.batching import PushPlan, generate_skipped_result
+from toll_booth.obj.concurrency import AimdController, ConcurrencyGate, AsyncConcurrencyGate, classify_push_result
+from toll_booth.obj.partitioning import find_partition_keys, assign_partition
+from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
+
+_NOT_PUSHED = object()
+
+
+@contextmanager
+def _no_push_session(num_workers, **kwargs):
+    yield {}
+
+
+@asynccontextmanager
+async def _no_async_push_session(max_in_flight, **kwargs):
+    yield {}
+
+
+def _register_session_report(reports: Dict[str, Callable], name: str, session_kwargs: Dict) -> Dict:
+    session_kwargs = dict(session_kwargs)
+    session_report = session_kwargs.pop('session_report', None)
+    if session_report is not None and reports is not None:
+        reports[name] = session_report
+    return session_kwargs
+
+
+def _get_pusher(push_type: str):
+    pusher = getattr(tasks, f'{push_type}_handler', None)
+    if pusher is None:
+        raise RuntimeError(f'do not know how to push object for {push_type}')
+    return pusher
+
+
+def _requires_endpoints(push_type: str) -> bool:
+    return getattr(tasks, f'{push_type}_requires_endpoints', False)
+
+
+def _order_push_targets(push_targets: List[Dict]) -> List[List[Dict]]:
+    """groups the push targets into waves, each target in a wave depends only on targets in earlier waves
+
+    Args:
+        push_targets: the push targets of the event, each with a push_type and optionally push_kwargs,
+            a name (defaults to the push_type) and depends_on, the names of the targets which must be pushed first
+
+    Returns:
+        the waves of push targets, with the name and depends_on of each target filled in
+    """
+    push_targets = [{'name': x['push_type'], 'push_kwargs': {}, 'depends_on': [], **x} for x in push_targets]
+    names = [x['name'] for x in push_targets]
+    if len(set(names)) != len(names):
+        raise RuntimeError(f'push target names must be unique, got: {names}')
+    for push_target in push_targets:
+        unknown = [x for x in push_target['depends_on'] if x not in names]
+        if unknown:
+            raise RuntimeError(f'push target {push_target["name"]} depends on unknown targets: {unknown}')
+    waves, ordered = [], set()
+    while len(ordered) < len(push_targets):
+        wave = [x for x in push_targets if x['name'] not in ordered and set(x['depends_on']) <= ordered]
+        if not wave:
+            raise RuntimeError(f'the dependencies between the push targets form a cycle: {push_targets}')
+        waves.append(wave)
+        ordered.update(x['name'] for x in wave)
+    return waves
+
+
+def _parse_leech_result(leech_result: Dict, push_kwargs: Dict):
+    push_kwargs = dict(push_kwargs)
+    source_vertex = InputVertex.from_arguments(leech_result['source_vertex'])
+    if leech_result.get('edge'):
+        push_kwargs['edge'] = InputEdge.from_arguments(leech_result['edge'])
+    if leech_result.get('other_vertex'):
+        push_kwargs['target_vertex'] = InputVertex.from_arguments(leech_result['other_vertex'])
+    return source_vertex, push_kwargs
+
+
+def _deadline_passed(deadline: float = None) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def _split_results(results: List[Any]) -> Tuple[List[Any], List[int]]:
+    unpushed = [position for position, x in enumerate(results) if x is _NOT_PUSHED]
+    for position in unpushed:
+        results[position] = None
+    return results, unpushed
+
+
+def _push_parsed(pusher, source_vertex: InputVertex, push_kwargs: Dict):
+    try:
+        return pusher(source_vertex, **push_kwargs)
+    except Exception as e:
+        return e.args
+
+
+def _push_leech_result(pusher, push_kwargs: Dict, leech_result: Dict):
+    logging.info(f'processing leech_result: {leech_result}')
+    try:
+        source_vertex, push_kwargs = _parse_leech_result(leech_result, push_kwargs)
+    except Exception as e:
+        return e.args
+    return _push_parsed(pusher, source_vertex, push_kwargs)
+
+
+def _unwrap_object_result(push_result):
+    if isinstance(push_result, dict):
+        return push_result['source_vertex']
+    return push_result
+
+
+def _push_object(pusher, push_kwargs: Dict, object_data: Tuple[type, Dict], failed_ids: Set[str] = None):
+    scalar_class, object_arguments = object_data
+    logging.info(f'processing object: {object_arguments}')
+    if failed_ids:
+        skipped_result = generate_skipped_result(object_arguments, failed_ids)
+        if skipped_result is not None:
+            return skipped_result
+    try:
+        scalar = scalar_class.from_arguments(object_arguments)
+    except Exception as e:
+        return e.args
+    return _unwrap_object_result(_push_parsed(pusher, scalar, push_kwargs))
+
+
+def _skip_fan_out_targets(waves: List[List[Dict]], object_arguments: Dict, failed_ids: Dict[str, Set[str]] = None):
+    skipped_results = {}
+    for wave in waves:
+        for push_target in wave:
+            skipped_result = generate_skipped_result(object_arguments, (failed_ids or {}).get(push_target['name'], ()))
+            if skipped_result is not None:
+                skipped_results[push_target['name']] = skipped_result
+    return skipped_results
+
+
+def _fan_out_object(waves: List[List[Dict]],
+                    executor: ThreadPoolExecutor,
+                    object_data: Tuple[type, Dict],
+                    failed_ids: Dict[str, Set[str]] = None):
+    scalar_class, object_arguments = object_data
+    logging.info(f'processing object: {object_arguments}')
+    try:
+        scalar = scalar_class.from_arguments(object_arguments)
+    except Exception as e:
+        return {x['name']: e.args for wave in waves for x in wave}
+    fan_out_results = _skip_fan_out_targets(waves, object_arguments, failed_ids)
+    for wave in waves:
+        pushes = [
+            (x['name'], executor.submit(_push_parsed, x['pusher'], scalar, x['push_kwargs']))
+            for x in wave if x['name'] not in fan_out_results
+        ]
+        for name, push in pushes:
+            fan_out_results[name] = _unwrap_object_result(push.result())
+    return fan_out_results
+
+
+def _transpose_fan_out(waves: List[List[Dict]], results: List[Any]) -> List[Any]:
+    transposed = []
+    for result in results:
+        if isinstance(result, tuple):
+            result = {x['name']: result for wave in waves for x in wave}
+        elif result is not None:
+            result = {x['name']: {y: z[x['name']] for y, z in result.items()} for wave in waves for x in wave}
+        transposed.append(result)
+    return transposed
+
+
+def _fan_out_leech_result(waves: List[List[Dict]], executor: ThreadPoolExecutor, leech_result: Dict):
+    logging.info(f'processing leech_result: {leech_result}')
+    try:
+        source_vertex, parsed_kwargs = _parse_leech_result(leech_result, {})
+    except Exception as e:
+        return {x['name']: e.args for wave in waves for x in wave}
+    fan_out_results = {}
+    for wave in waves:
+        pushes = [
+            (x['name'],
+             executor.submit(_push_parsed, x['pusher'], source_vertex, {**x['push_kwargs'], **parsed_kwargs}))
+            for x in wave
+        ]
+        for name, push in pushes:
+            fan_out_results[name] = push.result()
+    return fan_out_results
+
+
+def _run_worker(work_queue: Queue,
+                push: Callable[[Dict], Any],
+                results: List,
+                gate: ConcurrencyGate = None,
+                deadline: float = None):
+    while True:
+        task = work_queue.get()
+        if task is None:
+            return
+        position, leech_result = task
+        if gate is not None:
+            gate.acquire()
+        if _deadline_passed(deadline):
+            if gate is not None:
+                gate.abandon()
+            work_queue.task_done()
+            continue
+        started = time.monotonic()
+        results[position] = push(leech_result)
+        if gate is not None:
+            gate.release(time.monotonic() - started, classify_push_result(results[position]))
+        work_queue.task_done()
+
+
+def _run_workers(push: Callable[[Dict], Any],
+                 leech_results: List[Dict],
+                 num_workers: int,
+                 gate: ConcurrencyGate = None,
+                 deadline: float = None,
+                 partition: bool = False) -> Tuple[List[Any], List[int]]:
+    work_queues = [Queue() for _ in range(num_workers if partition else 1)]
+    results = [_NOT_PUSHED for _ in leech_results]
+    workers = []
+    for pointer in range(num_workers):
+        work_queue = work_queues[pointer % len(work_queues)]
+        worker = Thread(target=_run_worker, args=(work_queue, push, results, gate, deadline))
+        worker.start()
+        workers.append((worker, work_queue))
+    partition_keys = find_partition_keys(leech_results) if partition else [None for _ in leech_results]
+    for position, (leech_result, partition_key) in enumerate(zip(leech_results, partition_keys)):
+        work_queue = work_queues[assign_partition(partition_key, position, len(work_queues))]
+        work_queue.put((position, leech_result))
+    for _, work_queue in workers:
+        work_queue.put(None)
+    for worker, _ in workers:
+        worker.join()
+    return _split_results(results)
+
+
+def _find_failed_ids(plan: PushPlan, requires_endpoints: bool, vertex_results: List[Any]) -> Set[str]:
+    if not requires_endpoints:
+        return set()
+    return plan.find_failed_vertex_ids(vertex_results)
+
+
+def _find_fan_out_failed_ids(plan: PushPlan, waves: List[List[Dict]], vertex_results: List[Any]):
+    return {
+        x['name']: plan.find_failed_vertex_ids([None if y is None else y[x['name']] for y in vertex_results])
+        for wave in waves for x in wave if _requires_endpoints(x['push_type'])
+    }
+
+
+def _run_plan(run: Callable,
+              push_object: Callable[..., Any],
+              plan: PushPlan,
+              find_failed_ids: Callable[[List[Any]], Any]):
+    vertex_run = run(push_object, plan.vertexes)
+    failed_ids = find_failed_ids(vertex_run[0])
+    edge_run = run(functools.partial(push_object, failed_ids=failed_ids), plan.edges)
+    return plan.assemble(vertex_run, edge_run)
+
+
+def run_threaded(push_type: str,
+                 leech_results: List[Dict],
+                 push_kwargs: Dict,
+                 num_workers: int,
+                 controller: AimdController = None,
+                 deadline: float = None,
+                 plan: PushPlan = None,
+                 reports: Dict[str, Callable] = None,
+                 partition: bool = False) -> Tuple[List[Any], List[int]]:
+    """pushes the leech results from a pool of worker threads
+
+        without a controller, all num_workers threads push at once. with one, a thread is started for
+        each of the controller's max_limit, but only as many as its current limit push at any moment.
+        once the deadline passes, workers stop taking up new leech results, but finish the ones in hand.
+        with a plan, each distinct vertex is pushed once, then each distinct edge, instead of leech result by
+        leech result.
+        for pushers which declare toll_booth.tasks.{push_type}_requires_endpoints, an edge whose endpoint vertex failed
+        anywhere in the batch is skipped.
+        when partitioned, every worker has its own queue, and each push goes to the queue picked by hashing the vertex
+        it writes to which is most referenced in the batch. the writes which pile onto a hub vertex then run one after
+        another on a single worker, rather than colliding in the graph, while unrelated writes still run side by side
+
+    Args:
+        push_type: the name of the pusher, as found in toll_booth.tasks
+        leech_results: the parsed leech results to push
+        push_kwargs: the keyword arguments passed along to the pusher for every leech result
+        num_workers: the number of worker threads
+        controller: adjusts the number of concurrent pushes from the outcome of each one, if provided
+        deadline: the time.monotonic() value after which no new pushes are started, if any
+        plan: the distinct objects of the leech results, if they are to be pushed object by object
+        reports: collects the session_report callable of each push session which offers one, keyed by push type
+            or target name, to be called once the push is done
+        partition: send the pushes which write to the same vertex through the same worker, one at a time
+
+    Returns:
+        the push result of each leech result, in the same order as the leech results, with None for those never
+        pushed, and the positions of the leech results which were never pushed
+    """
+    pusher = _get_pusher(push_type)
+    push_session = getattr(tasks, f'{push_type}_session', _no_push_session)
+    gate = None
+    if controller is not None:
+        gate = ConcurrencyGate(controller)
+        num_workers = controller.max_limit
+    with push_session(num_workers, **push_kwargs) as session_kwargs:
+        session_kwargs = _register_session_report(reports, push_type, session_kwargs)
+        push_kwargs = {**push_kwargs, **session_kwargs}
+        if plan is not None:
+            run = functools.partial(
+                _run_workers, num_workers=num_workers, gate=gate, deadline=deadline, partition=partition)
+            find_failed_ids = functools.partial(_find_failed_ids, plan, _requires_endpoints(push_type))
+            return _run_plan(run, functools.partial(_push_object, pusher, push_kwargs), plan, find_failed_ids)
+        push = functools.partial(_push_leech_result, pusher, push_kwargs)
+        return _run_workers(push, leech_results, num_workers, gate, deadline, partition)
+
+
+def run_fan_out(push_targets: List[Dict],
+                leech_results: List[Dict],
+                num_workers: int,
+                controller: AimdController = None,
+                deadline: float = None,
+                plan: PushPlan = None,
+                reports: Dict[str, Callable] = None,
+                partition: bool = False) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """parses each leech result once, then pushes it to every push target, from a pool of worker threads
+
+        the targets of a leech result which do not depend on one another are pushed at the same time, a target
+        is only pushed once the targets it depends on have finished with that leech result. a dependency orders the
+        pushes, it does not gate them, the result of the earlier target is reported but not checked.
+        concurrency, the deadline, the plan and partitioning apply as in run_threaded
+
+    Args:
+        push_targets: the push targets, each with a push_type and optionally push_kwargs, a name and depends_on
+        leech_results: the parsed leech results to push
+        num_workers: the number of worker threads
+        controller: adjusts the number of concurrent pushes from the outcome of each one, if provided
+        deadline: the time.monotonic() value after which no new pushes are started, if any
+        plan: the distinct objects of the leech results, if they are to be pushed object by object
+        reports: collects the session_report callable of each push session which offers one, keyed by push type
+            or target name, to be called once the push is done
+        partition: send the pushes which write to the same vertex through the same worker, one at a time
+
+    Returns:
+        for each leech result, the push result of every target keyed by target name, with None for leech results
+        never pushed, and the positions of the leech results which were never pushed
+    """
+    waves = _order_push_targets(push_targets)
+    gate = None
+    if controller is not None:
+        gate = ConcurrencyGate(controller)
+        num_workers = controller.max_limit
+    widest_wave = max(len(x) for x in waves)
+    with ExitStack() as sessions, ThreadPoolExecutor(max_workers=num_workers * widest_wave) as executor:
+        for wave in waves:
+            for push_target in wave:
+                push_session = getattr(tasks, f'{push_target["push_type"]}_session', _no_push_session)
+                session_kwargs = sessions.enter_context(push_session(num_workers, **push_target['push_kwargs']))
+                session_kwargs = _register_session_report(reports, push_target['name'], session_kwargs)
+                push_target['pusher'] = _get_pusher(push_target['push_type'])
+                push_target['push_kwargs'] = {**push_target['push_kwargs'], **session_kwargs}
+        if plan is not None:
+            run = functools.partial(
+                _run_workers, num_workers=num_workers, gate=gate, deadline=deadline, partition=partition)
+            find_failed_ids = functools.partial(_find_fan_out_failed_ids, plan, waves)
+            results, unpushed = _run_plan(
+                run, functools.partial(_fan_out_object, waves, executor), plan, find_failed_ids)
+            return _transpose_fan_out(waves, results), unpushed
+        push = functools.partial(_fan_out_leech_result, waves, executor)
+        return _run_workers(push, leech_results, num_workers, gate, deadline, partition)
+
+
+async def _push_parsed_async(pusher, async_pusher, source_vertex: InputVertex, push_kwargs: Dict):
+    loop = asyncio.get_running_loop()
+    try:
+        if async_pusher is None:
+            return await loop.run_in_executor(None, functools.partial(pusher, source_vertex, **push_kwargs))
+        return await async_pusher(source_vertex, **push_kwargs)
+    except Exception as e:
+        return e.args
+
+
+async def _push_leech_result_async(pusher, async_pusher, push_kwargs: Dict, leech_result: Dict):
+    logging.info(f'processing leech_result: {leech_result}')
+    loop = asyncio.get_running_loop()
+    try:
+        source_vertex, push_kwargs = await loop.run_in_executor(
+            None, _parse_leech_result, leech_result, push_kwargs)
+    except Exception as e:
+        return e.args
+    return await _push_parsed_async(pusher, async_pusher, source_vertex, push_kwargs)
+
+
+async def _push_object_async(pusher,
+                             async_pusher,
+                             push_kwargs: Dict,
+                             object_data: Tuple[type, Dict],
+                             failed_ids: Set[str] = None):
+    scalar_class, object_arguments = object_data
+    logging.info(f'processing object: {object_arguments}')
+    if failed_ids:
+        skipped_result = generate_skipped_result(object_arguments, failed_ids)
+        if skipped_result is not None:
+            return skipped_result
+    loop = asyncio.get_running_loop()
+    try:
+        scalar = await loop.run_in_executor(None, scalar_class.from_arguments, object_arguments)
+    except Exception as e:
+        return e.args
+    return _unwrap_object_result(await _push_parsed_async(pusher, async_pusher, scalar, push_kwargs))
+
+
+async def _fan_out_object_async(waves: List[List[Dict]],
+                                object_data: Tuple[type, Dict],
+                                failed_ids: Dict[str, Set[str]] = None):
+    scalar_class, object_arguments = object_data
+    logging.info(f'processing object: {object_arguments}')
+    loop = asyncio.get_running_loop()
+    try:
+        scalar = await loop.run_in_executor(None, scalar_class.from_arguments, object_arguments)
+    except Exception as e:
+        return {x['name']: e.args for wave in waves for x in wave}
+    fan_out_results = _skip_fan_out_targets(waves, object_arguments, failed_ids)
+    for wave in waves:
+        wave = [x for x in wave if x['name'] not in fan_out_results]
+        wave_results = await asyncio.gather(*(
+            _push_parsed_async(x['pusher'], x['async_pusher'], scalar, x['push_kwargs']) for x in wave
+        ))
+        fan_out_results.update({x['name']: _unwrap_object_result(y) for x, y in zip(wave, wave_results)})
+    return fan_out_results
+
+
+async def _fan_out_leech_result_async(waves: List[List[Dict]], leech_result: Dict):
+    logging.info(f'processing leech_result: {leech_result}')
+    loop = asyncio.get_running_loop()
+    try:
+        source_vertex, parsed_kwargs = await loop.run_in_executor(None, _parse_leech_result, leech_result, {})
+    except Exception as e:
+        return {x['name']: e.args for wave in waves for x in wave}
+    fan_out_results = {}
+    for wave in waves:
+        wave_results = await asyncio.gather(*(
+            _push_parsed_async(x['pusher'], x['async_pusher'], source_vertex, {**x['push_kwargs'], **parsed_kwargs})
+            for x in wave
+        ))
+        fan_out_results.update({x['name']: y for x, y in zip(wave, wave_results)})
+    return fan_out_results
+
+
+async def _gather_pushes(push: Callable[[Dict], Any],
+                         leech_results: List[Dict],
+                         max_in_flight: int,
+                         controller: AimdController = None,
+                         deadline: float = None,
+                         partition: bool = False) -> Tuple[List[Any], List[int]]:
+    semaphore = asyncio.Semaphore(max_in_flight)
+    gate = None
+    if controller is not None:
+        gate = AsyncConcurrencyGate(controller)
+    partition_keys = find_partition_keys(leech_results) if partition else [None for _ in leech_results]
+    partition_locks = {x: asyncio.Lock() for x in partition_keys if x is not None}
+
+    async def _push(leech_result):
+        if gate is None:
+            async with semaphore:
+                if _deadline_passed(deadline):
+                    return _NOT_PUSHED
+                return await push(leech_result)
+        await gate.acquire()
+        if _deadline_passed(deadline):
+            await gate.abandon()
+            return _NOT_PUSHED
+        started = time.monotonic()
+        push_result = None
+        try:
+            push_result = await push(leech_result)
+            return push_result
+        finally:
+            await gate.release(time.monotonic() - started, classify_push_result(push_result))
+
+    async def _push_in_partition(leech_result, partition_key):
+        if partition_key is None:
+            return await _push(leech_result)
+        async with partition_locks[partition_key]:
+            return await _push(leech_result)
+
+    results = await asyncio.gather(*(_push_in_partition(x, y) for x, y in zip(leech_results, partition_keys)))
+    return _split_results(results)
+
+
+async def _run_plan_async(run: Callable,
+                          push_object: Callable[..., Any],
+                          plan: PushPlan,
+                          find_failed_ids: Callable[[List[Any]], Any]):
+    vertex_run = await run(push_object, plan.vertexes)
+    failed_ids = find_failed_ids(vertex_run[0])
+    edge_run = await run(functools.partial(push_object, failed_ids=failed_ids), plan.edges)
+    return plan.assemble(vertex_run, edge_run)
+
+
+async def _run_asyncio(push_type: str,
+                       leech_results: List[Dict],
+                       push_kwargs: Dict,
+                       max_in_flight: int,
+                       num_workers: int,
+                       controller: AimdController = None,
+                       deadline: float = None,
+                       plan: PushPlan = None,
+                       reports: Dict[str, Callable] = None,
+                       partition: bool = False) -> Tuple[List[Any], List[int]]:
+    pusher = _get_pusher(push_type)
+    async_pusher = getattr(tasks, f'{push_type}_handler_async', None)
+    push_session = getattr(tasks, f'{push_type}_async_session', _no_async_push_session)
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=num_workers))
+    if controller is not None:
+        max_in_flight = controller.max_limit
+    async with push_session(max_in_flight, **push_kwargs) as session_kwargs:
+        session_kwargs = _register_session_report(reports, push_type, session_kwargs)
+        push_kwargs = {**push_kwargs, **session_kwargs}
+        if plan is not None:
+            run = functools.partial(
+                _gather_pushes, max_in_flight=max_in_flight, controller=controller, deadline=deadline,
+                partition=partition)
+            find_failed_ids = functools.partial(_find_failed_ids, plan, _requires_endpoints(push_type))
+            return await _run_plan_async(
+                run, functools.partial(_push_object_async, pusher, async_pusher, push_kwargs), plan, find_failed_ids)
+        push = functools.partial(_push_leech_result_async, pusher, async_pusher, push_kwargs)
+        return await _gather_pushes(push, leech_results, max_in_flight, controller, deadline, partition)
+
+
+def run_asyncio(push_type: str,
+                leech_results: List[Dict],
+                push_kwargs: Dict,
+                max_in_flight: int,
+                num_workers: int,
+                controller: AimdController = None,
+                deadline: float = None,
+                plan: PushPlan = None,
+                reports: Dict[str, Callable] = None,
+                partition: bool = False) -> Tuple[List[Any], List[int]]:
+    """pushes the leech results from an event loop, with up to max_in_flight pushes running at once
+
+        pushers with an async version (toll_booth.tasks.{push_type}_handler_async) run on the loop,
+        anything else, along with the blocking parts of leech result parsing and the AWS SDK calls,
+        runs on a pool of num_workers threads. with a controller, its current limit takes the place of max_in_flight.
+        once the deadline passes, no new pushes are started, but those already running are finished.
+        a plan is pushed as in run_threaded. when partitioned, the pushes which share an owning vertex wait on a lock
+        for that vertex, so they run one at a time
+
+    Args:
+        push_type: the name of the pusher, as found in toll_booth.tasks
+        leech_results: the parsed leech results to push
+        push_kwargs: the keyword arguments passed along to the pusher for every leech result
+        max_in_flight: the most leech results being pushed at once
+        num_workers: the number of threads available for blocking calls
+        controller: adjusts the number of concurrent pushes from the outcome of each one, if provided
+        deadline: the time.monotonic() value after which no new pushes are started, if any
+        plan: the distinct objects of the leech results, if they are to be pushed object by object
+        reports: collects the session_report callable of each push session which offers one, keyed by push type
+            or target name, to be called once the push is done
+        partition: send the pushes which write to the same vertex through the same worker, one at a time
+
+    Returns:
+        the push result of each leech result, in the same order as the leech results, with None for those never
+        pushed, and the positions of the leech results which were never pushed
+    """
+    return asyncio.run(_run_asyncio(
+        push_type, leech_results, push_kwargs, max_in_flight, num_workers, controller, deadline, plan, reports,
+        partition))
+
+
+async def _run_fan_out_asyncio(push_targets: List[Dict],
+                               leech_results: List[Dict],
+                               max_in_flight: int,
+                               num_workers: int,
+                               controller: AimdController = None,
+                               deadline: float = None,
+                               plan: PushPlan = None,
+                               reports: Dict[str, Callable] = None,
+                               partition: bool = False) -> Tuple[List[Dict[str, Any]], List[int]]:
+    waves = _order_push_targets(push_targets)
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=num_workers))
+    if controller is not None:
+        max_in_flight = controller.max_limit
+    async with AsyncExitStack() as sessions:
+        for wave in waves:
+            for push_target in wave:
+                push_type = push_target['push_type']
+                push_session = getattr(tasks, f'{push_type}_async_session', _no_async_push_session)
+                session_kwargs = await sessions.enter_async_context(
+                    push_session(max_in_flight, **push_target['push_kwargs']))
+                session_kwargs = _register_session_report(reports, push_target['name'], session_kwargs)
+                push_target['pusher'] = _get_pusher(push_type)
+                push_target['async_pusher'] = getattr(tasks, f'{push_type}_handler_async', None)
+                push_target['push_kwargs'] = {**push_target['push_kwargs'], **session_kwargs}
+        if plan is not None:
+            run = functools.partial(
+                _gather_pushes, max_in_flight=max_in_flight, controller=controller, deadline=deadline,
+                partition=partition)
+            find_failed_ids = functools.partial(_find_fan_out_failed_ids, plan, waves)
+            results, unpushed = await _run_plan_async(
+                run, functools.partial(_fan_out_object_async, waves), plan, find_failed_ids)
+            return _transpose_fan_out(waves, results), unpushed
+        push = functools.partial(_fan_out_leech_result_async, waves)
+        return await _gather_pushes(push, leech_results, max_in_flight, controller, deadline, partition)
+
+
+def run_fan_out_asyncio(push_targets: List[Dict],
+                        leech_results: List[Dict],
+                        max_in_flight: int,
+                        num_workers: int,
+                        controller: AimdController = None,
+                        deadline: float = None,
+                        plan: PushPlan = None,
+                        reports: Dict[str, Callable] = None,
+                        partition: bool = False) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """the event loop counterpart of run_fan_out, with up to max_in_flight leech results being pushed at once
+
+    Args:
+        push_targets: the push targets, each with a push_type and optionally push_kwargs, a name and depends_on
+        leech_results: the parsed leech results to push
+        max_in_flight: the most leech results being pushed at once
+        num_workers: the number of threads available for blocking calls
+        controller: adjusts the number of concurrent pushes from the outcome of each one, if provided
+        deadline: the time.monotonic() value after which no new pushes are started, if any
+        plan: the distinct objects of the leech results, if they are to be pushed object by object
+        reports: collects the session_report callable of each push session which offers one, keyed by push type
+            or target name, to be called once the push is done
+        partition: send the pushes which write to the same vertex through the same worker, one at a time
+
+    Returns:
+        for each leech result, the push result of every target keyed by target name, with None for leech results
+        never pushed, and the positions of the leech results which were never pushed
+    """
+    return asyncio.run(_run_fan_out_asyncio(
+        push_targets, leech_results, max_in_flight, num_workers, controller, deadline, plan, reports, partition))
@@ -1,73 +1,114 @@
 import logging
 import os
-from collections import deque
-from queue import Queue
-from threading import Thread
+import time
 
-import boto3
 from algernon import ajson, rebuild_event
 from algernon.aws import lambda_logged
 
-from toll_booth import tasks
-from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
+from toll_booth.engines import run_threaded, run_asyncio, run_fan_out, run_fan_out_asyncio
+from toll_booth.obj.batching import PushPlan
+from toll_booth.obj.concurrency import AimdController
+from toll_booth.obj.config import ConfigurationCache
 
+_configuration = ConfigurationCache(
+    ['INDEX_TABLE_NAME', 'GRAPH_DB_ENDPOINT', 'GRAPH_DB_READER_ENDPOINT', 'LEECH_BUCKET', 'SENSITIVES_TABLE_NAME'],
+    float(os.getenv('CONFIG_TTL_SECONDS', 300))
+)
 
-def _load_config(variable_names):
-    client = boto3.client('ssm')
-    response = client.get_parameters(Names=[x for x in variable_names])
-    results = [(x['Name'], x['Value']) for x in response['Parameters']]
-    for entry in results:
-        os.environ[entry[0]] = entry[1]
 
+def _load_config(config_version=None):
+    if _configuration.load(config_version):
+        logging.info(f'loaded configuration from SSM, parameter versions: {_configuration.parameter_versions}')
 
-def _run_handler(work_queue, results):
-    while True:
-        task = work_queue.get()
-        if task is None:
-            return
-        logging.info(f'processing task: {task}')
-        leech_result = task['leech_result']
-        push_type = task['push_type']
-        push_kwargs = task.get('push_kwargs', {})
-        source_vertex = InputVertex.from_arguments(leech_result['source_vertex'])
-        if leech_result.get('edge'):
-            push_kwargs['edge'] = InputEdge.from_arguments(leech_result['edge'])
-        if leech_result.get('other_vertex'):
-            push_kwargs['target_vertex'] = InputVertex.from_arguments(leech_result['other_vertex'])
-        pusher = getattr(tasks, f'{push_type}_handler', None)
-        if pusher is None:
-            raise RuntimeError(f'do not know how to push object for {push_type}')
-        try:
-            push_results = pusher(source_vertex, **push_kwargs)
-        except Exception as e:
-            push_results = e.args
-        results.append(push_results)
-        work_queue.task_done()
+
+def _build_controller(adaptive_concurrency, initial_limit):
+    if not adaptive_concurrency:
+        return None
+    if adaptive_concurrency is True:
+        adaptive_concurrency = {}
+    initial_limit = adaptive_concurrency.get('initial_limit', initial_limit)
+    return AimdController(
+        initial_limit,
+        min_limit=adaptive_concurrency.get('min_limit', int(os.getenv('ADAPTIVE_MIN_LIMIT', 1))),
+        max_limit=adaptive_concurrency.get('max_limit', max(initial_limit, int(os.getenv('ADAPTIVE_MAX_LIMIT', 50)))),
+        increase=adaptive_concurrency.get('increase', 1),
+        decrease_factor=adaptive_concurrency.get('decrease_factor', 0.5),
+        latency_tolerance=adaptive_concurrency.get('latency_tolerance', 2.0)
+    )
+
+
+def _calculate_deadline(context, deadline_margin_ms):
+    """converts the time left in the invocation into a time.monotonic() value, less a margin for draining"""
+    get_remaining_time = getattr(context, 'get_remaining_time_in_millis', None)
+    if get_remaining_time is None:
+        return None
+    return time.monotonic() + (get_remaining_time() - deadline_margin_ms) / 1000
+
+
+def _collect_target_results(push_targets, results):
+    """turns the fan out results of each leech result into the results of each target, for each leech result"""
+    target_names = [x.get('name', x['push_type']) for x in push_targets]
+    return {x: [None if y is None else y[x] for y in results] for x in target_names}
+
+
+def _generate_continuation(event, leech_results, unpushed):
+    continuation = {x: y for x, y in event.items() if x != 'aio'}
+    continuation['aio'] = [leech_results[x] for x in unpushed]
+    return continuation
 
 
 @lambda_logged
 def handler(event, context):
     event = rebuild_event(event)
     logging.info(f'received a call to push an object to persistence: {event}/{context}')
-    config_variables = [
-        'INDEX_TABLE_NAME', 'GRAPH_DB_ENDPOINT', 'GRAPH_DB_READER_ENDPOINT', 'LEECH_BUCKET', 'SENSITIVES_TABLE_NAME'
-    ]
-    _load_config(config_variables)
-    work_queue = Queue()
-    results = deque()
-    push_type = event['push_type']
+    _load_config(event.get('config_version'))
+    push_targets = event.get('push_targets')
+    push_type = event.get('push_type')
     leech_results = event['aio']
     push_kwargs = event.get('push_kwargs', {})
-    workers = []
     num_workers = event.get('num_workers', 5)
-    for _ in range(num_workers):
-        worker = Thread(target=_run_handler, args=(work_queue, results))
-        worker.start()
-        workers.append(worker)
-    for entry in leech_results:
-        work_queue.put({'leech_result': entry, 'push_type': push_type, 'push_kwargs': push_kwargs})
-    for _ in workers:
-        work_queue.put(None)
-    for worker in workers:
-        worker.join()
-    return {'push_type': push_type, 'results': [x for x in results]}
+    engine = event.get('engine', 'threaded')
+    max_in_flight = event.get('max_in_flight', 100)
+    deadline = _calculate_deadline(
+        context, float(event.get('deadline_margin_ms', os.getenv('DEADLINE_MARGIN_MS', 10000))))
+    schedule = event.get('schedule', 'batch' if event.get('deduplicate', False) else 'leech_result')
+    if schedule not in ('batch', 'leech_result'):
+        raise RuntimeError(f'do not know how to schedule the push with: {schedule}')
+    plan = PushPlan(leech_results) if schedule == 'batch' else None
+    session_reports = {}
+    controller = _build_controller(
+        event.get('adaptive_concurrency'), num_workers if engine == 'threaded' else max_in_flight)
+    if engine not in ('threaded', 'asyncio'):
+        raise RuntimeError(f'do not know how to run the push with engine: {engine}')
+    partition = event.get('partition', False)
+    if push_targets:
+        if engine == 'threaded':
+            results, unpushed = run_fan_out(
+                push_targets, leech_results, num_workers, controller, deadline, plan, session_reports, partition)
+        else:
+            results, unpushed = run_fan_out_asyncio(
+                push_targets, leech_results, max_in_flight, num_workers, controller, deadline, plan, session_reports,
+                partition)
+        push_results = {'push_targets': push_targets, 'results': _collect_target_results(push_targets, results)}
+    elif engine == 'threaded':
+        results, unpushed = run_threaded(
+            push_type, leech_results, push_kwargs, num_workers, controller, deadline, plan, session_reports, partition)
+        push_results = {'push_type': push_type, 'results': results}
+    else:
+        results, unpushed = run_asyncio(
+            push_type, leech_results, push_kwargs, max_in_flight, num_workers, controller, deadline, plan,
+            session_reports, partition)
+        push_results = {'push_type': push_type, 'results': results}
+    if session_reports:
+        push_results['reports'] = {x: y() for x, y in session_reports.items()}
+    if plan is not None:
+        logging.info(f'scheduled the leech results as a batch, deduplicated: {plan.summary}')
+        push_results['deduplication'] = plan.summary
+    if controller is not None:
+        concurrency = controller.summary()
+        logging.info(f'adaptive concurrency for the push: {concurrency}')
+        push_results['concurrency'] = concurrency
+    if unpushed:
+        logging.warning(f'ran short of time, {len(unpushed)} of {len(leech_results)} leech results were not pushed')
+        push_results['continuation'] = _generate_continuation(event, leech_results, unpushed)
+    return push_results
@@ -0,0 +1,130 @@
+import hashlib
+import json
+from typing import Dict, List, Any, Tuple, Set, Optional
+
+from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
+
+_OPTIONAL_SLOTS = (
+    ('other_vertex', 'target_vertex', InputVertex),
+    ('edge', 'edge', InputEdge)
+)
+
+
+def _generate_object_key(object_data: Dict) -> Tuple[str, str]:
+    content = json.dumps(object_data, sort_keys=True, default=str)
+    return object_data['internal_id'], hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def _is_failed(object_result: Any) -> bool:
+    if object_result is None or isinstance(object_result, tuple):
+        return True
+    return isinstance(object_result, dict) and object_result.get('status') == 'failed'
+
+
+def generate_skipped_result(edge_arguments: Dict, failed_ids: Set[str]) -> Optional[Dict]:
+    """checks the endpoints of an edge against the vertexes which failed to push
+
+    Args:
+        edge_arguments: the arguments the edge is built from
+        failed_ids: the internal_ids of the vertexes in the batch which were not pushed successfully
+
+    Returns:
+        a skipped result for the edge if either endpoint failed, otherwise None
+    """
+    endpoints = [edge_arguments.get('source_vertex_internal_id'), edge_arguments.get('target_vertex_internal_id')]
+    failed_endpoints = [x for x in endpoints if x in failed_ids]
+    if not failed_endpoints:
+        return None
+    return {
+        'status': 'skipped',
+        'operation': 'push_edge',
+        'details': {
+            'message': f'did not push edge {edge_arguments["internal_id"]}, '
+                       f'its endpoints failed to push: {failed_endpoints}'
+        }
+    }
+
+
+class PushPlan:
+    """The distinct vertexes and edges of a batch of leech results, and which leech results refer to each of them
+
+        two references are to the same object when they share an internal_id and the rest of their content is
+        identical, an object which appears with different content in different leech results is kept once for each
+        version. each distinct object is pushed once, and its result is copied to every leech result which refers to it.
+        all the vertexes of the batch are pushed before any of the edges, so an edge can be checked against the
+        results of its endpoints, wherever in the batch they came from
+    """
+    def __init__(self, leech_results: List[Dict]):
+        self._positions = {}
+        self._vertexes = []
+        self._edges = []
+        self._references = []
+        for leech_result in leech_results:
+            try:
+                self._references.append(self._add_leech_result(leech_result))
+            except Exception as e:
+                self._references.append(e.args)
+
+    @property
+    def vertexes(self) -> List[Tuple[type, Dict]]:
+        """the distinct vertexes, as the scalar class and the arguments to build it from"""
+        return self._vertexes
+
+    @property
+    def edges(self) -> List[Tuple[type, Dict]]:
+        """the distinct edges, as the scalar class and the arguments to build it from"""
+        return self._edges
+
+    @property
+    def summary(self) -> Dict[str, int]:
+        references = sum(len(x) for x in self._references if isinstance(x, list))
+        objects = len(self._vertexes) + len(self._edges)
+        return {'references': references, 'objects': objects, 'collapsed': references - objects}
+
+    def find_failed_vertex_ids(self, vertex_results: List[Any]) -> Set[str]:
+        """the internal_ids of the vertexes which failed, or were never pushed, in any of their versions"""
+        return {x[1]['internal_id'] for x, y in zip(self._vertexes, vertex_results) if _is_failed(y)}
+
+    def assemble(self,
+                 vertex_run: Tuple[List[Any], List[int]],
+                 edge_run: Tuple[List[Any], List[int]]) -> Tuple[List[Any], List[int]]:
+        """copies the results of the distinct objects back onto the leech results which referred to them
+
+        Args:
+            vertex_run: the results of pushing the vertexes, and the positions of those never pushed
+            edge_run: the results of pushing the edges, and the positions of those never pushed
+
+        Returns:
+            the push result of each leech result, keyed by slot, with None for leech results which were not
+            completely pushed, and the positions of those leech results
+        """
+        object_results = {
+            InputVertex: vertex_run[0],
+            InputEdge: edge_run[0]
+        }
+        unpushed_objects = {(InputVertex, x) for x in vertex_run[1]} | {(InputEdge, x) for x in edge_run[1]}
+        results, unpushed = [], []
+        for position, references in enumerate(self._references):
+            if isinstance(references, tuple):
+                results.append(references)
+            elif any(x[1] in unpushed_objects for x in references):
+                results.append(None)
+                unpushed.append(position)
+            else:
+                results.append({slot: object_results[x[0]][x[1]] for slot, x in references})
+        return results, unpushed
+
+    def _add_leech_result(self, leech_result: Dict) -> List[Tuple[str, Tuple[type, int]]]:
+        references = [('source_vertex', self._add_object(InputVertex, leech_result['source_vertex']))]
+        for leech_name, slot, scalar_class in _OPTIONAL_SLOTS:
+            if leech_result.get(leech_name):
+                references.append((slot, self._add_object(scalar_class, leech_result[leech_name])))
+        return references
+
+    def _add_object(self, scalar_class: type, object_data: Dict) -> Tuple[type, int]:
+        key = (scalar_class, _generate_object_key(object_data))
+        if key not in self._positions:
+            scalars = self._edges if scalar_class is InputEdge else self._vertexes
+            self._positions[key] = (scalar_class, len(scalars))
+            scalars.append((scalar_class, object_data))
+        return self._positions[key]
@@ -0,0 +1,81 @@
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+
+class ClientRegistry:
+    """Hands out boto3 clients and resources which live for the life of the container
+
+        clients are thread-safe, so each service gets a single client shared by every thread.
+        resources are not, so each thread is given its own resource per service. the worker threads of an
+        invocation do not outlive it, so the resource of a finished thread is handed on to the next thread which
+        asks, and a warm container only ever builds as many resources as it has run threads at once.
+        everything is built from one session, with the same connection pool size and retry behaviour
+    """
+    def __init__(self, max_pool_connections: int, retry_mode: str, max_attempts: int):
+        self._config = Config(
+            max_pool_connections=max_pool_connections,
+            retries={'mode': retry_mode, 'max_attempts': max_attempts}
+        )
+        self._session = None
+        self._clients = {}
+        self._resource_owners = {}
+        self._idle_resources = {}
+        self._thread_resources = threading.local()
+        self._lock = threading.Lock()
+
+    def client(self, service_name: str):
+        client = self._clients.get(service_name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(service_name)
+                if client is None:
+                    client = self._get_session().client(service_name, config=self._config)
+                    self._clients[service_name] = client
+        return client
+
+    def resource(self, service_name: str):
+        resources = getattr(self._thread_resources, 'resources', None)
+        if resources is None:
+            resources = {}
+            self._thread_resources.resources = resources
+        resource = resources.get(service_name)
+        if resource is None:
+            with self._lock:
+                resource = self._check_out_resource(service_name)
+            resources[service_name] = resource
+        return resource
+
+    def _check_out_resource(self, service_name: str):
+        resource_owners = self._resource_owners.setdefault(service_name, {})
+        idle_resources = self._idle_resources.setdefault(service_name, [])
+        for owner in [x for x in resource_owners if not x.is_alive()]:
+            idle_resources.append(resource_owners.pop(owner))
+        if idle_resources:
+            resource = idle_resources.pop()
+        else:
+            resource = self._get_session().resource(service_name, config=self._config)
+        resource_owners[threading.current_thread()] = resource
+        return resource
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = boto3.session.Session()
+        return self._session
+
+
+_client_registry = ClientRegistry(
+    int(os.getenv('AWS_MAX_POOL_CONNECTIONS', 25)),
+    os.getenv('AWS_RETRY_MODE', 'standard'),
+    int(os.getenv('AWS_MAX_ATTEMPTS', 5))
+)
+
+
+def get_client(service_name: str):
+    return _client_registry.client(service_name)
+
+
+def get_resource(service_name: str):
+    return _client_registry.resource(service_name)
@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+from typing import Any, Dict
+
+_THROTTLE_MARKERS = (
+    'Throttl', 'ProvisionedThroughputExceeded', 'ConcurrentModificationException', 'TooManyRequests',
+    'RequestLimitExceeded', 'SlowDown'
+)
+_ERROR_MARKERS = (
+    'InternalFailureException', 'InternalServerError', 'ServiceUnavailable', 'MemoryLimitExceededException',
+    'TimeoutError', 'timed out', 'ConnectionError'
+)
+
+
+def _find_failures(push_result: Any):
+    if isinstance(push_result, tuple):
+        yield True, str(push_result)
+    elif isinstance(push_result, dict):
+        if push_result.get('status') == 'failed':
+            yield False, str(push_result.get('details', {}).get('message', ''))
+            return
+        for entry in push_result.values():
+            yield from _find_failures(entry)
+
+
+def classify_push_result(push_result: Any) -> str:
+    """sorts a push result by what it says about the health of the backends
+
+        a pusher which raised leaves the exception args as its result, those count as errors unless they
+        describe a throttle. failed operations only count if their message names a throttle or a server side fault,
+        a logical failure, like an object which was already indexed, says nothing about backend health
+
+    Args:
+        push_result: the value returned by a pusher, or the args of the exception it raised, or a dict of either
+
+    Returns:
+        one of throttled, error or ok
+    """
+    failures = list(_find_failures(push_result))
+    if any(x in message for _, message in failures for x in _THROTTLE_MARKERS):
+        return 'throttled'
+    if any(raised or any(x in message for x in _ERROR_MARKERS) for raised, message in failures):
+        return 'error'
+    return 'ok'
+
+
+class AimdController:
+    """Adjusts a concurrency limit with additive increase and multiplicative decrease
+
+        every completed push is recorded with its latency and outcome. once a full limit's worth of pushes have
+        completed in good health, the limit grows by increase. a throttle or an error cuts the limit by
+        decrease_factor, at most once per limit's worth of completions, so one burst of failures from the pushes
+        already in flight counts as a single signal. while the smoothed latency sits above latency_tolerance times
+        the best smoothed latency seen, the limit holds instead of growing
+    """
+    def __init__(self,
+                 initial_limit: int,
+                 min_limit: int = 1,
+                 max_limit: int = 50,
+                 increase: int = 1,
+                 decrease_factor: float = 0.5,
+                 latency_tolerance: float = 2.0,
+                 max_decisions: int = 200):
+        self._limit = max(min_limit, min(initial_limit, max_limit))
+        self._initial_limit = self._limit
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._increase = increase
+        self._decrease_factor = decrease_factor
+        self._latency_tolerance = latency_tolerance
+        self._max_decisions = max_decisions
+        self._healthy_completions = 0
+        self._completions_since_decrease = None
+        self._smoothed_latency = None
+        self._best_latency = None
+        self._samples = 0
+        self._outcomes = {'ok': 0, 'throttled': 0, 'error': 0}
+        self._decisions = []
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def max_limit(self) -> int:
+        return self._max_limit
+
+    def record(self, latency: float, outcome: str):
+        with self._lock:
+            self._outcomes[outcome] += 1
+            if self._completions_since_decrease is not None:
+                self._completions_since_decrease += 1
+            if outcome != 'ok':
+                self._decrease(outcome)
+                return
+            self._record_latency(latency)
+            if not self._latency_is_healthy():
+                return
+            self._healthy_completions += 1
+            if self._healthy_completions >= self._limit and self._limit < self._max_limit:
+                self._change_limit(min(self._max_limit, self._limit + self._increase), 'increase')
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'initial_limit': self._initial_limit,
+                'final_limit': self._limit,
+                'min_limit': self._min_limit,
+                'max_limit': self._max_limit,
+                'outcomes': dict(self._outcomes),
+                'smoothed_latency_ms': None if self._smoothed_latency is None else self._smoothed_latency * 1000,
+                'decisions': list(self._decisions)
+            }
+
+    def _record_latency(self, latency: float):
+        self._samples += 1
+        if self._smoothed_latency is None:
+            self._smoothed_latency = latency
+        else:
+            self._smoothed_latency = 0.8 * self._smoothed_latency + 0.2 * latency
+        if self._samples >= 5 and (self._best_latency is None or self._smoothed_latency < self._best_latency):
+            self._best_latency = self._smoothed_latency
+
+    def _latency_is_healthy(self) -> bool:
+        if self._best_latency is None:
+            return True
+        return self._smoothed_latency <= self._best_latency * self._latency_tolerance
+
+    def _decrease(self, reason: str):
+        if self._completions_since_decrease is not None and self._completions_since_decrease < self._limit:
+            return
+        self._completions_since_decrease = 0
+        self._change_limit(max(self._min_limit, int(self._limit * self._decrease_factor)), reason)
+
+    def _change_limit(self, new_limit: int, reason: str):
+        self._healthy_completions = 0
+        if new_limit == self._limit:
+            return
+        self._limit = new_limit
+        if len(self._decisions) < self._max_decisions:
+            self._decisions.append({
+                'elapsed_ms': int((time.monotonic() - self._started_at) * 1000),
+                'limit': new_limit,
+                'reason': reason
+            })
+
+
+class ConcurrencyGate:
+    """Lets worker threads through while fewer than the controller's limit are busy"""
+    def __init__(self, controller: AimdController):
+        self._controller = controller
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= self._controller.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, latency: float, outcome: str):
+        self._controller.record(latency, outcome)
+        self.abandon()
+
+    def abandon(self):
+        """gives back a slot which was acquired but never used to push"""
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+
+class AsyncConcurrencyGate:
+    """The asyncio counterpart of ConcurrencyGate, for use on a single event loop"""
+    def __init__(self, controller: AimdController):
+        self._controller = controller
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self._controller.limit)
+            self._in_flight += 1
+
+    async def release(self, latency: float, outcome: str):
+        self._controller.record(latency, outcome)
+        await self.abandon()
+
+    async def abandon(self):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
@@ -0,0 +1,69 @@
+import logging
+import os
+import threading
+import time
+from typing import List, Dict, Any
+
+from toll_booth.obj.clients import get_client
+
+
+class ConfigurationCache:
+    """Keeps the SSM parameters the pushers need for the life of the container
+
+        parameters are fetched on first access and then reused until ttl seconds have passed, at which point the
+        next access fetches them again. loaded values are also written to os.environ, where the pushers read them.
+        a caller can pass a config_version, any version other than the one the cache was loaded under forces a reload
+    """
+    def __init__(self, variable_names: List[str], ttl: float):
+        self._variable_names = list(variable_names)
+        self._ttl = ttl
+        self._values = {}
+        self._parameter_versions = {}
+        self._config_version = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def parameter_versions(self) -> Dict[str, int]:
+        return dict(self._parameter_versions)
+
+    def get(self, variable_name: str, config_version: Any = None) -> str:
+        self.load(config_version)
+        return self._values.get(variable_name)
+
+    def load(self, config_version: Any = None) -> bool:
+        """makes sure the cached parameters are current
+
+        Args:
+            config_version: an opaque marker for the configuration the caller expects, None accepts any
+
+        Returns:
+            True if the parameters were fetched from SSM, False if the cached values were still good
+        """
+        with self._lock:
+            if not self._is_stale(config_version):
+                return False
+            self._fetch()
+            if config_version is not None:
+                self._config_version = config_version
+            return True
+
+    def invalidate(self):
+        with self._lock:
+            self._expires_at = 0.0
+
+    def _is_stale(self, config_version: Any) -> bool:
+        if time.monotonic() >= self._expires_at:
+            return True
+        return config_version is not None and config_version != self._config_version
+
+    def _fetch(self):
+        client = get_client('ssm')
+        response = client.get_parameters(Names=self._variable_names)
+        for entry in response['Parameters']:
+            self._values[entry['Name']] = entry['Value']
+            self._parameter_versions[entry['Name']] = entry.get('Version')
+            os.environ[entry['Name']] = entry['Value']
+        if response.get('InvalidParameters'):
+            logging.warning(f'could not load some configuration parameters: {response["InvalidParameters"]}')
+        self._expires_at = time.monotonic() + self._ttl
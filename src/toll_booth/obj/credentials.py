@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Any, Dict, Tuple
+
+from algernon.aws import Opossum
+
+
+class CachedCredential:
+    """A secret which is fetched once and reused until its time to live runs out
+
+        reads made within refresh_ahead seconds of expiry start a background refresh and return the current value,
+        so callers only wait on the remote lookup for the very first read, or after the value has fully expired
+    """
+    def __init__(self, fetch: Callable[[], Any], ttl: float, refresh_ahead: float):
+        self._fetch = fetch
+        self._ttl = ttl
+        self._refresh_ahead = min(refresh_ahead, ttl)
+        self._entry = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def get(self) -> Any:
+        entry = self._entry
+        now = time.monotonic()
+        if entry is not None and now < entry[1]:
+            if now >= entry[1] - self._refresh_ahead:
+                self._refresh_in_background()
+            return entry[0]
+        with self._lock:
+            entry = self._entry
+            if entry is not None and time.monotonic() < entry[1]:
+                return entry[0]
+            return self._refresh()
+
+    def invalidate(self):
+        with self._lock:
+            self._entry = None
+
+    def _refresh(self) -> Any:
+        value = self._fetch()
+        self._entry = (value, time.monotonic() + self._ttl)
+        return value
+
+    def _refresh_in_background(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        threading.Thread(target=self._run_background_refresh, daemon=True).start()
+
+    def _run_background_refresh(self):
+        try:
+            with self._lock:
+                self._refresh()
+        except Exception as e:
+            logging.warning(f'failed to refresh a cached credential ahead of expiry, will retry on next read: {e.args}')
+        finally:
+            self._refresh_lock.release()
+
+
+class CredentialCache:
+    """Holds every secret the pushers look up, shared by all threads for the life of the container"""
+    def __init__(self, ttl: float, refresh_ahead: float):
+        self._ttl = ttl
+        self._refresh_ahead = refresh_ahead
+        self._credentials = {}
+        self._lock = threading.Lock()
+
+    def get(self, credential_name: str, fetch: Callable[[], Any]) -> Any:
+        credential = self._credentials.get(credential_name)
+        if credential is None:
+            with self._lock:
+                credential = self._credentials.get(credential_name)
+                if credential is None:
+                    credential = CachedCredential(fetch, self._ttl, self._refresh_ahead)
+                    self._credentials[credential_name] = credential
+        return credential.get()
+
+    def invalidate(self, credential_name: str = None):
+        with self._lock:
+            if credential_name is None:
+                self._credentials = {}
+                return
+            self._credentials.pop(credential_name, None)
+
+
+_credential_cache = CredentialCache(
+    float(os.getenv('CREDENTIAL_TTL_SECONDS', 3600)),
+    float(os.getenv('CREDENTIAL_REFRESH_AHEAD_SECONDS', 300))
+)
+
+
+def get_trident_user_key() -> Tuple[str, str]:
+    return _credential_cache.get('trident_user_key', Opossum.get_trident_user_key)
+
+
+def get_secrets(secret_name: str) -> Dict[str, Any]:
+    return _credential_cache.get(f'secrets#{secret_name}', lambda: Opossum.get_secrets(secret_name))
+
+
+def invalidate_credentials(credential_name: str = None):
+    _credential_cache.invalidate(credential_name)
@@ -0,0 +1,202 @@
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple, Union, Any
+
+from toll_booth.obj.clients import get_client
+from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
+from toll_booth.obj.scalars.object_properties import ObjectProperty, LocalPropertyValue
+
+_BULK_LOAD_TYPES = {
+    'S': 'String',
+    'N': 'Double',
+    'B': 'Bool',
+    'DT': 'Date'
+}
+_VERTEX_SYSTEM_COLUMNS = ('~id', '~label')
+_EDGE_SYSTEM_COLUMNS = ('~id', '~from', '~to', '~label')
+
+
+def _format_date(property_value) -> str:
+    return datetime.fromtimestamp(float(property_value), tz=timezone.utc).isoformat()
+
+
+_VALUE_FORMATTERS = {
+    'Date': _format_date
+}
+
+
+def _derive_column(object_property: ObjectProperty) -> Tuple[str, str]:
+    """the bulk load column and the cell text for a property
+
+        local values are typed from their data_type, sensitive values are written as their pointer and stored values as
+        their storage uri, both as String, which is what the gremlin upserts store as the plain value of those properties
+    """
+    property_value = object_property.property_value
+    bulk_load_type = 'String'
+    if isinstance(property_value, LocalPropertyValue):
+        bulk_load_type = _BULK_LOAD_TYPES[property_value.data_type]
+    value_formatter = _VALUE_FORMATTERS.get(bulk_load_type, str)
+    return f'{object_property.property_name}:{bulk_load_type}', value_formatter(property_value.property_value)
+
+
+def _generate_row(scalar: Union[InputVertex, InputEdge]) -> Dict[str, str]:
+    row = {'~id': scalar.internal_id, '~label': scalar.object_type}
+    if isinstance(scalar, InputEdge):
+        row['~from'] = scalar.source_vertex_internal_id
+        row['~to'] = scalar.target_vertex_internal_id
+    for object_property in [*scalar.object_properties, scalar.id_value, scalar.identifier_stem]:
+        column, cell = _derive_column(object_property)
+        row[column] = cell
+    return row
+
+
+class _LocalStorage:
+    def __init__(self, root: str):
+        self._root = root
+
+    def write(self, key: str, body: bytes):
+        file_path = os.path.join(self._root, key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as output_file:
+            output_file.write(body)
+
+    def uri(self, key: str) -> str:
+        return os.path.join(self._root, key)
+
+
+class _S3Storage:
+    def __init__(self, bucket_name: str, prefix: str):
+        self._bucket_name = bucket_name
+        self._prefix = prefix.strip('/')
+
+    def write(self, key: str, body: bytes):
+        get_client('s3').put_object(Bucket=self._bucket_name, Key=self._generate_key(key), Body=body)
+
+    def uri(self, key: str) -> str:
+        return f's3://{self._bucket_name}/{self._generate_key(key)}'
+
+    def _generate_key(self, key: str) -> str:
+        if not self._prefix:
+            return key
+        return f'{self._prefix}/{key}'
+
+
+class BulkLoadWriter:
+    """Writes vertexes and edges into Neptune bulk loader CSV files
+
+        rows are held per label and written out as a file each time chunk_size of them have gathered, the header of
+        each file is the union of the columns of its rows. vertexes go under vertices/{label}/ and edges under
+        edges/{label}/, so a load can be run for all the vertexes before the edges. closing the writer flushes what is
+        left and writes manifest-{export_id}.json, which lists every file with its label and row count. the destination
+        is either a local directory or an s3://bucket/prefix uri, every file name carries the export_id so that many
+        exports can share a destination
+    """
+    def __init__(self, destination: str, chunk_size: int = 10000, export_id: str = None):
+        if export_id is None:
+            export_id = uuid.uuid4().hex
+        self._export_id = export_id
+        self._destination = destination
+        self._storage = self._build_storage(destination)
+        self._chunk_size = chunk_size
+        self._pending = {}
+        self._file_counts = {}
+        self._files = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _build_storage(cls, destination: str):
+        if destination.startswith('s3://'):
+            bucket_name, _, prefix = destination[len('s3://'):].partition('/')
+            return _S3Storage(bucket_name, prefix)
+        return _LocalStorage(destination)
+
+    @property
+    def export_id(self) -> str:
+        return self._export_id
+
+    @property
+    def files(self) -> List[Dict[str, Any]]:
+        return list(self._files)
+
+    def write(self, scalar: Union[InputVertex, InputEdge]) -> Tuple[str, str]:
+        """adds a vertex or edge to the pending rows of its label
+
+        Args:
+            scalar: the vertex or edge to write
+
+        Returns:
+            the kind (vertices or edges) and the label it was filed under
+        """
+        kind = 'edges' if isinstance(scalar, InputEdge) else 'vertices'
+        row = _generate_row(scalar)
+        partition = (kind, scalar.object_type)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('can not write to a BulkLoadWriter after it has been closed')
+            pending = self._pending.setdefault(partition, [])
+            pending.append(row)
+            if len(pending) >= self._chunk_size:
+                self._flush_partition(partition)
+        return partition
+
+    def flush(self):
+        with self._lock:
+            for partition in list(self._pending):
+                self._flush_partition(partition)
+
+    def close(self) -> Dict[str, Any]:
+        """flushes the pending rows and writes the manifest
+
+        Returns:
+            the manifest
+        """
+        with self._lock:
+            if self._closed:
+                return self._generate_manifest()
+            for partition in list(self._pending):
+                self._flush_partition(partition)
+            self._closed = True
+            manifest = self._generate_manifest()
+            manifest_key = f'manifest-{self._export_id}.json'
+            self._storage.write(manifest_key, json.dumps(manifest, indent=2).encode('utf-8'))
+            logging.info(f'closed a bulk load export to {self._destination}, {len(self._files)} files')
+            return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _flush_partition(self, partition: Tuple[str, str]):
+        rows = self._pending.pop(partition, [])
+        if not rows:
+            return
+        kind, label = partition
+        system_columns = _EDGE_SYSTEM_COLUMNS if kind == 'edges' else _VERTEX_SYSTEM_COLUMNS
+        property_columns = sorted({x for row in rows for x in row} - set(system_columns))
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=[*system_columns, *property_columns], lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+        file_number = self._file_counts.get(partition, 0)
+        self._file_counts[partition] = file_number + 1
+        key = f'{kind}/{label}/{self._export_id}-{file_number:05d}.csv'
+        self._storage.write(key, output.getvalue().encode('utf-8'))
+        self._files.append({'kind': kind, 'label': label, 'rows': len(rows), 'uri': self._storage.uri(key)})
+
+    def _generate_manifest(self) -> Dict[str, Any]:
+        return {
+            'export_id': self._export_id,
+            'format': 'csv',
+            'source': self._destination,
+            'vertex_files': [x for x in self._files if x['kind'] == 'vertices'],
+            'edge_files': [x for x in self._files if x['kind'] == 'edges']
+        }
@@ -1,6 +1,9 @@
+import hashlib
 import json
+import re
 from datetime import datetime
-from typing import List, Dict, Tuple
+from functools import lru_cache
+from typing import List, Dict, Tuple, Any, Iterable
 
 from algernon import ajson
 
@@ -9,44 +12,64 @@ from toll_booth.obj.scalars.object_properties import ObjectProperty, SensitivePr
 from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
 
 
-def _derive_object_properties(object_properties: List[ObjectProperty]) -> str:
-    property_commands = []
-    for entry in object_properties:
-        property_commands.append(_derive_property_value(entry))
-    return f".{'.'.join(property_commands)}"
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_VERTEX_OPENING = "g.V('"
+_VERTEX_LABEL = "').fold().coalesce(unfold(), addV('"
+_EDGE_OPENING = "g.E('"
+_EDGE_LABEL = "').fold().coalesce(unfold(), addE('"
+_EDGE_FROM = "').from(g.V('"
+_EDGE_TO = "')).to(g.V('"
+_EDGE_ID = "')).property(id, '"
+_OBJECT_ID = "').property(id, '"
+_OBJECT_ID_CLOSING = "')"
+_PROPERTY_VALUE = ".property("
+_PROPERTY_VALUE_SEPARATOR = ", "
+_PROPERTY_MAP = ").property("
+_PROPERTY_MAP_SEPARATOR = ", '"
+_PROPERTY_MAP_CLOSING = "')"
+_COMMAND_CLOSING = ')'
+PROPERTY_HASHES = '_property_hashes'
 
 
-def _derive_property_value(object_property: ObjectProperty) -> str:
-    property_name = object_property.property_name
-    stored_property_value, property_map = _derive_property_map(object_property)
-    commands = [
-        f"property('{property_name}', {stored_property_value})",
-        f"property('{property_name}', '{ajson.dumps(property_map)}')",
-    ]
-    command = '.'.join(commands)
-    return command
+def _collapse_whitespace(text: str) -> str:
+    """squeezes runs of whitespace to a single space, returning clean text untouched
+
+        every whitespace character other than the plain space is unprintable,
+        so text without a double space that is printable can not change
+    """
+    if '  ' not in text and text.isprintable():
+        return text
+    return _WHITESPACE_PATTERN.sub(' ', text)
+
+
+def _extend_property_fragments(fragments: List[str], object_properties: Iterable[ObjectProperty]):
+    for entry in object_properties:
+        property_name = _quote(_collapse_whitespace(entry.property_name))
+        stored_property_value, property_map = _derive_property_map(entry)
+        fragments.extend((
+            _PROPERTY_VALUE, property_name, _PROPERTY_VALUE_SEPARATOR, _collapse_whitespace(stored_property_value),
+            _PROPERTY_MAP, property_name, _PROPERTY_MAP_SEPARATOR, _collapse_whitespace(ajson.dumps(property_map)),
+            _PROPERTY_MAP_CLOSING
+        ))
 
 
 def _derive_property_map(object_property: ObjectProperty) -> Tuple[str, Dict]:
     property_value = object_property.property_value
-    property_type = type(property_value).__name__
-    if property_type == 'SensitivePropertyValue':
-        return _derive_sensitive_property_map(property_value)
-    if property_type == 'StoredPropertyValue':
-        return _derive_stored_property_map(property_value)
-    if property_type == 'LocalPropertyValue':
-        return _derive_local_property_map(property_value)
-    raise NotImplementedError(f'do not know how to parse object_property of type: {property_type}')
+    property_deriver = _PROPERTY_MAP_DERIVERS.get(type(property_value))
+    if property_deriver is None:
+        raise NotImplementedError(
+            f'do not know how to parse object_property of type: {type(property_value).__name__}')
+    return property_deriver(property_value)
 
 
 def _derive_sensitive_property_map(object_property: SensitivePropertyValue) -> Tuple[str, Dict]:
+    pointer = object_property.property_value
     property_map = {
         '__typename': 'SensitivePropertyValue',
         'data_type': object_property.data_type,
-        'pointer': object_property.property_value
+        'pointer': pointer
     }
-    property_value = f'"{object_property.property_value}"'
-    return property_value, property_map
+    return f'"{pointer}"', property_map
 
 
 def _derive_stored_property_map(object_property: StoredPropertyValue) -> Tuple[str, Dict]:
@@ -56,25 +79,35 @@ def _derive_stored_property_map(object_property: StoredPropertyValue) -> Tuple[s
         'storage_class': object_property.storage_class,
         'storage_uri': object_property.storage_uri
     }
-    property_value = f'"{object_property.property_value}"'
-    return property_value, property_map
+    return f'"{object_property.property_value}"', property_map
+
+
+def _format_datetime_value(property_value) -> str:
+    return f"datetime('{datetime.utcfromtimestamp(property_value).isoformat()}')"
 
 
 def _derive_local_property_map(object_property: LocalPropertyValue) -> Tuple[str, Dict]:
     property_value = object_property.property_value
     property_data_type = object_property.data_type
-    if property_data_type == 'S':
-        property_value = json.dumps(property_value)
-    if property_data_type == 'DT':
-        date_time_value = datetime.utcfromtimestamp(property_value)
-        graphed_datetime_value = date_time_value.isoformat()
-        property_value = f"datetime('{graphed_datetime_value}')"
+    value_formatter = _LOCAL_VALUE_FORMATTERS.get(property_data_type, str)
     property_map = {
         '__typename': 'LocalPropertyValue',
         'data_type': property_data_type,
-        'property_value': object_property.property_value
+        'property_value': property_value
     }
-    return property_value, property_map
+    return value_formatter(property_value), property_map
+
+
+_LOCAL_VALUE_FORMATTERS = {
+    'S': json.dumps,
+    'DT': _format_datetime_value
+}
+
+_PROPERTY_MAP_DERIVERS = {
+    SensitivePropertyValue: _derive_sensitive_property_map,
+    StoredPropertyValue: _derive_stored_property_map,
+    LocalPropertyValue: _derive_local_property_map
+}
 
 
 def create_edge_command(edge_internal_id: str,
@@ -84,20 +117,17 @@ def create_edge_command(edge_internal_id: str,
                         from_internal_id: str,
                         to_internal_id: str,
                         edge_properties: List[ObjectProperty] = None) -> str:
-    import re
-    if not edge_properties:
-        edge_properties = []
-    edge_properties.append(id_value)
-    edge_properties.append(identifier_stem)
-    command = f"g" \
-        f".E('{edge_internal_id}')" \
-        f".fold()" \
-        f".coalesce(unfold()," \
-        f" addE('{edge_label}').from(g.V('{from_internal_id}')).to(g.V('{to_internal_id}'))" \
-        f".property(id, '{edge_internal_id}')" \
-        f"{_derive_object_properties(edge_properties)})"
-    command = re.sub(r'\s+', ' ', command)
-    return command
+    edge_internal_id = _collapse_whitespace(str(edge_internal_id))
+    fragments = [
+        _EDGE_OPENING, edge_internal_id, _EDGE_LABEL, _collapse_whitespace(str(edge_label)),
+        _EDGE_FROM, _collapse_whitespace(str(from_internal_id)), _EDGE_TO, _collapse_whitespace(str(to_internal_id)),
+        _EDGE_ID, edge_internal_id, _OBJECT_ID_CLOSING
+    ]
+    if edge_properties:
+        _extend_property_fragments(fragments, edge_properties)
+    _extend_property_fragments(fragments, (id_value, identifier_stem))
+    fragments.append(_COMMAND_CLOSING)
+    return ''.join(fragments)
 
 
 def create_vertex_command(vertex_internal_id: str,
@@ -105,20 +135,16 @@ def create_vertex_command(vertex_internal_id: str,
                           id_value: ObjectProperty,
                           identifier_stem: ObjectProperty,
                           vertex_properties: List[ObjectProperty] = None) -> str:
-    import re
-    if not vertex_properties:
-        vertex_properties = []
-    vertex_properties.append(id_value)
-    vertex_properties.append(identifier_stem)
-    command = f"g" \
-        f".V('{vertex_internal_id}')" \
-        f".fold()" \
-        f".coalesce(unfold()," \
-        f" addV('{vertex_type}')" \
-        f".property(id, '{vertex_internal_id}')" \
-        f"{_derive_object_properties(vertex_properties)})"
-    command = re.sub(r'\s+', ' ', command)
-    return command
+    vertex_internal_id = _collapse_whitespace(str(vertex_internal_id))
+    fragments = [
+        _VERTEX_OPENING, vertex_internal_id, _VERTEX_LABEL, _collapse_whitespace(str(vertex_type)),
+        _OBJECT_ID, vertex_internal_id, _OBJECT_ID_CLOSING
+    ]
+    if vertex_properties:
+        _extend_property_fragments(fragments, vertex_properties)
+    _extend_property_fragments(fragments, (id_value, identifier_stem))
+    fragments.append(_COMMAND_CLOSING)
+    return ''.join(fragments)
 
 
 def create_vertex_command_from_scalar(vertex_scalar: InputVertex):
@@ -143,3 +169,232 @@ def create_edge_command_from_scalar(edge_scalar: InputEdge):
         'edge_properties': edge_scalar.edge_properties
     }
     return create_edge_command(**kwargs)
+
+
+_BINDING_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'|\b_b(\d+)\b")
+
+
+def _quote(literal: str) -> str:
+    escaped = literal.replace('\\', '\\\\').replace("'", "\\'")
+    return f"'{escaped}'"
+
+
+def _derive_bound_value(object_property: ObjectProperty) -> Tuple[Any, bool]:
+    property_value = object_property.property_value
+    if not isinstance(property_value, LocalPropertyValue):
+        return property_value.property_value, False
+    data_type = property_value.data_type
+    raw_value = property_value.property_value
+    if data_type == 'DT':
+        return datetime.utcfromtimestamp(raw_value).isoformat(), True
+    if data_type == 'N':
+        if raw_value == raw_value.to_integral_value():
+            return int(raw_value), False
+        return float(raw_value), False
+    if data_type == 'B':
+        return raw_value == 'true', False
+    return raw_value, False
+
+
+def _derive_property_bindings(object_properties: List[ObjectProperty], first_binding: int):
+    signature = []
+    bindings = {}
+    binding_number = first_binding
+    for entry in object_properties:
+        bound_value, is_datetime = _derive_bound_value(entry)
+        _, property_map = _derive_property_map(entry)
+        bindings[f'_b{binding_number}'] = bound_value
+        bindings[f'_b{binding_number + 1}'] = ajson.dumps(property_map)
+        binding_number += 2
+        signature.append((entry.property_name, is_datetime))
+    return tuple(signature), bindings
+
+
+def _derive_property_template(signature: Tuple[Tuple[str, bool]], first_binding: int) -> str:
+    property_commands = []
+    binding_number = first_binding
+    for property_name, is_datetime in signature:
+        value_binding = f'_b{binding_number}'
+        if is_datetime:
+            value_binding = f'datetime({value_binding})'
+        property_commands.append(f"property({_quote(property_name)}, {value_binding})")
+        property_commands.append(f"property({_quote(property_name)}, _b{binding_number + 1})")
+        binding_number += 2
+    return f".{'.'.join(property_commands)}"
+
+
+@lru_cache(maxsize=1024)
+def _get_vertex_template(vertex_type: str, signature: Tuple[Tuple[str, bool]]) -> str:
+    return f"g.V(_b0).fold().coalesce(unfold(), addV({_quote(vertex_type)}).property(id, _b0)" \
+        f"{_derive_property_template(signature, 1)})"
+
+
+@lru_cache(maxsize=1024)
+def _get_edge_template(edge_label: str, signature: Tuple[Tuple[str, bool]]) -> str:
+    return f"g.E(_b0).fold().coalesce(unfold(), addE({_quote(edge_label)}).from(g.V(_b1)).to(g.V(_b2))" \
+        f".property(id, _b0){_derive_property_template(signature, 3)})"
+
+
+def namespace_bindings(command: str, bindings: Dict[str, Any], namespace: int) -> Tuple[str, Dict[str, Any]]:
+    """renames the bindings of a parameterized command so it can share a request with other commands
+
+    Args:
+        command: the gremlin template, as generated by create_vertex_template or create_edge_template
+        bindings: the bindings for the template
+        namespace: a number unique to the command within the request
+
+    Returns:
+        the rewritten template and its renamed bindings
+    """
+    def _rename(match):
+        if match.group(1) is None:
+            return match.group(0)
+        return f'_b{namespace}_{match.group(1)}'
+    renamed_bindings = {f'_b{namespace}_{name[2:]}': value for name, value in bindings.items()}
+    return _BINDING_PATTERN.sub(_rename, command), renamed_bindings
+
+
+def create_vertex_template(vertex_internal_id: str,
+                           vertex_type: str,
+                           id_value: ObjectProperty,
+                           identifier_stem: ObjectProperty,
+                           vertex_properties: List[ObjectProperty] = None) -> Tuple[str, Dict[str, Any]]:
+    """generates a parameterized upsert for a vertex
+
+        the gremlin text depends only on the vertex type and the names and kinds of its properties,
+        so vertexes of the same shape share a single script in the server's script cache
+
+    Returns:
+        the gremlin template and the bindings to send with it
+    """
+    object_properties = list(vertex_properties or []) + [id_value, identifier_stem]
+    signature, bindings = _derive_property_bindings(object_properties, 1)
+    bindings['_b0'] = vertex_internal_id
+    return _get_vertex_template(vertex_type, signature), bindings
+
+
+def create_edge_template(edge_internal_id: str,
+                         edge_label: str,
+                         id_value: ObjectProperty,
+                         identifier_stem: ObjectProperty,
+                         from_internal_id: str,
+                         to_internal_id: str,
+                         edge_properties: List[ObjectProperty] = None) -> Tuple[str, Dict[str, Any]]:
+    """generates a parameterized upsert for an edge, keyed the same way as create_vertex_template
+
+    Returns:
+        the gremlin template and the bindings to send with it
+    """
+    object_properties = list(edge_properties or []) + [id_value, identifier_stem]
+    signature, bindings = _derive_property_bindings(object_properties, 3)
+    bindings.update({'_b0': edge_internal_id, '_b1': from_internal_id, '_b2': to_internal_id})
+    return _get_edge_template(edge_label, signature), bindings
+
+
+def create_vertex_template_from_scalar(vertex_scalar: InputVertex):
+    kwargs = {
+        'vertex_internal_id': vertex_scalar.internal_id,
+        'vertex_type': vertex_scalar.vertex_type,
+        'id_value': vertex_scalar.id_value,
+        'identifier_stem': vertex_scalar.identifier_stem,
+        'vertex_properties': vertex_scalar.vertex_properties
+    }
+    return create_vertex_template(**kwargs)
+
+
+def create_edge_template_from_scalar(edge_scalar: InputEdge):
+    kwargs = {
+        'edge_internal_id': edge_scalar.internal_id,
+        'edge_label': edge_scalar.edge_label,
+        'id_value': edge_scalar.id_value,
+        'identifier_stem': edge_scalar.identifier_stem,
+        'from_internal_id': edge_scalar.source_vertex_internal_id,
+        'to_internal_id': edge_scalar.target_vertex_internal_id,
+        'edge_properties': edge_scalar.edge_properties
+    }
+    return create_edge_template(**kwargs)
+
+
+def create_existence_probe(internal_ids: List[str]) -> str:
+    """a read traversal which returns which of the internal_ids already have a vertex in the graph"""
+    vertex_ids = ', '.join(_quote(_collapse_whitespace(str(x))) for x in internal_ids)
+    return f'g.V({vertex_ids}).id()'
+
+
+def project_id(command: str) -> str:
+    """ends a traversal with .id(), so only the id of the element it reaches is sent back"""
+    return f'{command}.id()'
+
+
+def _list_vertex_properties(vertex_scalar: InputVertex) -> List[ObjectProperty]:
+    return [*(vertex_scalar.vertex_properties or []), vertex_scalar.id_value, vertex_scalar.identifier_stem]
+
+
+def _generate_hashes_fragment(property_hashes: Dict[str, str]) -> str:
+    return f'.property(single, {_quote(PROPERTY_HASHES)}, {_quote(json.dumps(property_hashes, sort_keys=True))})'
+
+
+def generate_property_hashes(vertex_scalar: InputVertex) -> Dict[str, str]:
+    """a digest of the gremlin each property of a vertex is written with, keyed by property name
+
+        the digests are stored on the vertex under _property_hashes, so the properties which changed since the last
+        write can be found by reading that one value back
+    """
+    fragments_by_name = {}
+    for entry in _list_vertex_properties(vertex_scalar):
+        fragments = []
+        _extend_property_fragments(fragments, [entry])
+        fragments_by_name.setdefault(_collapse_whitespace(entry.property_name), []).append(''.join(fragments))
+    return {
+        x: hashlib.sha1(''.join(y).encode('utf-8')).hexdigest()[:16] for x, y in fragments_by_name.items()
+    }
+
+
+def generate_content_hash(vertex_type: str, property_hashes: Dict[str, str]) -> str:
+    """a digest of everything a vertex is written with, for telling whether it changed at all"""
+    content = json.dumps({'vertex_type': vertex_type, 'properties': property_hashes}, sort_keys=True)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def create_property_hash_probe(internal_ids: List[str]) -> str:
+    """a read traversal which returns, for each of the internal_ids found in the graph, its id and stored hashes"""
+    vertex_ids = ', '.join(_quote(_collapse_whitespace(str(x))) for x in internal_ids)
+    return f'g.V({vertex_ids}).local(union(id(), values({_quote(PROPERTY_HASHES)})).fold())'
+
+
+def create_vertex_update_command(vertex_scalar: InputVertex,
+                                 property_names: Iterable[str],
+                                 property_hashes: Dict[str, str]) -> str:
+    """generates a traversal which rewrites the named properties of an existing vertex and nothing else
+
+        each named property has its values dropped before the new ones are written, as the upsert writes every
+        property with two values, the plain value and the property map. a named property the vertex no longer has
+        is only dropped
+
+    Args:
+        vertex_scalar: the vertex, as it should now be
+        property_names: the names of the properties which changed or were removed
+        property_hashes: the digests of every property of the vertex, as generated by generate_property_hashes
+
+    Returns:
+        the gremlin text of the update
+    """
+    property_names = set(property_names)
+    fragments = [_VERTEX_OPENING, _collapse_whitespace(str(vertex_scalar.internal_id)), _OBJECT_ID_CLOSING]
+    for property_name in sorted(property_names):
+        fragments.append(f'.sideEffect(properties({_quote(property_name)}).drop())')
+    changed_properties = [
+        x for x in _list_vertex_properties(vertex_scalar) if _collapse_whitespace(x.property_name) in property_names
+    ]
+    _extend_property_fragments(fragments, changed_properties)
+    fragments.append(_generate_hashes_fragment(property_hashes))
+    return ''.join(fragments)
+
+
+def record_property_hashes(command: str, property_hashes: Dict[str, str]) -> str:
+    """extends a vertex upsert to store the property digests on the vertex it creates
+
+        the digests go inside the addV branch, so a vertex found by the upsert keeps the digests of the properties it
+        actually has
+    """
+    return f'{command[:-len(_COMMAND_CLOSING)]}{_generate_hashes_fragment(property_hashes)}{_COMMAND_CLOSING}'
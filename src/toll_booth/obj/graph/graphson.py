@@ -0,0 +1,87 @@
+import codecs
+import json
+import re
+from typing import Any, List
+
+_DATA_START = re.compile(
+    r'"result"\s*:\s*\{.*?"data"\s*:\s*(?:\{\s*"@type"\s*:\s*"g:List"\s*,\s*"@value"\s*:\s*)?\[', re.DOTALL)
+_SEPARATORS = ' \t\r\n,'
+_TERMINATORS = _SEPARATORS + ']'
+
+
+def _extract_elements(response_json: Any) -> List[Any]:
+    data = response_json['result']['data']
+    if isinstance(data, dict) and data.get('@type') == 'g:List':
+        return data['@value']
+    if isinstance(data, list):
+        return data
+    return [data]
+
+
+class GraphSONStreamDecoder:
+    """Decodes the data list of a gremlin http response one element at a time, as the body arrives
+
+        feed the body in as it is read, each call returns the elements completed by that chunk, and only the
+        undecoded tail of the body is held in memory. the elements are returned as raw GraphSON, the same as a
+        fully decoded response. a response whose data is not a list is decoded whole once the body is closed,
+        and returned as a single element
+    """
+    def __init__(self):
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._in_list = False
+        self._finished = False
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        self._buffer += self._text_decoder.decode(chunk)
+        return self._drain()
+
+    def close(self) -> List[Any]:
+        """decodes whatever is left of the body
+
+        Returns:
+            the remaining elements
+
+        Raises:
+            RuntimeError: the body ended before the data list did
+        """
+        self._buffer += self._text_decoder.decode(b'', final=True)
+        if not self._in_list and not self._finished:
+            self._finished = True
+            return _extract_elements(json.loads(self._buffer))
+        elements = self._drain()
+        if not self._finished:
+            raise RuntimeError('the response from the graph database ended before its data was complete')
+        return elements
+
+    def _drain(self) -> List[Any]:
+        if self._finished:
+            return []
+        if not self._in_list:
+            data_start = _DATA_START.search(self._buffer)
+            if data_start is None:
+                return []
+            self._buffer = self._buffer[data_start.end():]
+            self._in_list = True
+        elements = []
+        position = 0
+        buffer_length = len(self._buffer)
+        while True:
+            while position < buffer_length and self._buffer[position] in _SEPARATORS:
+                position += 1
+            if position >= buffer_length:
+                break
+            if self._buffer[position] == ']':
+                self._finished = True
+                break
+            try:
+                element, element_end = self._json_decoder.raw_decode(self._buffer, position)
+            except json.JSONDecodeError:
+                break
+            if element_end >= buffer_length or self._buffer[element_end] not in _TERMINATORS:
+                break
+            elements.append(element)
+            position = element_end
+        self._buffer = self._buffer[position:]
+        return elements
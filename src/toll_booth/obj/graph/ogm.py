@@ -1,54 +1,467 @@
-from toll_booth.obj.graph.generators import create_vertex_command_from_scalar, create_edge_command_from_scalar
-from toll_booth.obj.graph.trident_driver import TridentDriver
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from typing import List, Union, Dict, Any, Set, Tuple
+
+from toll_booth.obj.graph.generators import create_vertex_command_from_scalar, create_edge_command_from_scalar, \
+    create_vertex_template_from_scalar, create_edge_template_from_scalar, create_existence_probe, project_id, \
+    generate_property_hashes, generate_content_hash, create_property_hash_probe, create_vertex_update_command, \
+    record_property_hashes
+from toll_booth.obj.graph.trident_driver import TridentDriver, TridentWriteBuffer
+from toll_booth.obj.graph.vertex_cache import VertexExistenceCache
 from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
 
+_CONFLICT_MARKER = 'ConcurrentModificationException'
+
+
+def _generate_graph_result(operation: str,
+                           command: str,
+                           bindings: Dict[str, Any] = None,
+                           exception: Exception = None) -> Dict:
+    graph_result = {
+        'status': 'succeeded',
+        'operation': operation,
+        'details': {
+            'message': '',
+            'command': command
+        }
+    }
+    if bindings:
+        graph_result['details']['bindings'] = bindings
+    if exception is not None:
+        graph_result['status'] = 'failed'
+        graph_result['details']['message'] = exception.args
+    return graph_result
+
+
+def _generate_skipped_vertex_result(message: str = None) -> Dict:
+    if message is None:
+        message = 'the vertex is known to exist in the graph, the upsert was skipped'
+    return {
+        'status': 'succeeded',
+        'operation': 'graph_vertex',
+        'details': {
+            'message': message,
+            'skipped': True
+        }
+    }
+
+
+def _unwrap_list(graphson_value: Any) -> List[Any]:
+    if isinstance(graphson_value, dict):
+        return graphson_value.get('@value', [])
+    return graphson_value
+
+
+def _parse_property_hashes(stored_values) -> Dict[str, Dict[str, str]]:
+    stored_hashes = {}
+    for stored_value in stored_values:
+        internal_id, *property_hashes = _unwrap_list(stored_value)
+        stored_hashes[str(internal_id)] = json.loads(property_hashes[0]) if property_hashes else {}
+    return stored_hashes
+
+
+def _is_conflict(exception: Exception = None) -> bool:
+    return exception is not None and _CONFLICT_MARKER in str(exception.args)
+
+
+def _calculate_backoff(base_backoff: float, attempt: int) -> float:
+    return random.uniform(0, base_backoff * 2 ** attempt)
+
+
+def _generate_graph_command(scalar: Union[InputVertex, InputEdge], parameterized: bool = False, lean: bool = False):
+    if isinstance(scalar, InputEdge):
+        operation = 'graph_edge'
+        if parameterized:
+            command, bindings = create_edge_template_from_scalar(scalar)
+        else:
+            command, bindings = create_edge_command_from_scalar(scalar), None
+    else:
+        operation = 'graph_vertex'
+        if parameterized:
+            command, bindings = create_vertex_template_from_scalar(scalar)
+        else:
+            command, bindings = create_vertex_command_from_scalar(scalar), None
+    if lean:
+        command = project_id(command)
+    return operation, command, bindings
+
 
 class Ogm:
-    def __init__(self, trident_driver=None):
+    def __init__(self,
+                 trident_driver=None,
+                 write_buffer: TridentWriteBuffer = None,
+                 parameterized: bool = False,
+                 http_session=None,
+                 vertex_cache: VertexExistenceCache = None,
+                 probe_vertexes: bool = True,
+                 lean_writes: bool = False,
+                 conflict_retries: int = 3,
+                 conflict_backoff: float = 0.05,
+                 update_properties: bool = False):
+        """
+
+        Args:
+            trident_driver: the driver used to reach the graph, one is created if not provided
+            write_buffer: a buffer shared with other Ogm instances, commands are sent through it if provided
+            parameterized: send upserts as cached gremlin templates plus bindings, rather than literal scripts
+            http_session: an open aiohttp.ClientSession, required by the async methods
+            vertex_cache: the internal_ids known to exist in the graph, upserts for these vertexes are skipped
+            probe_vertexes: with a vertex_cache, check the vertexes missing from it against the reader endpoint,
+                all at once, before sending the upserts
+            lean_writes: end each upsert with .id(), so the database answers with the id of the element rather than
+                the whole element, and do not decode the answer
+            conflict_retries: the most times a write which failed with a ConcurrentModificationException is resent
+            conflict_backoff: the base of the jittered, exponential wait before each resend, in seconds
+            update_properties: bring the properties of vertexes which already exist up to date, rather than leaving
+                them as they were first written, see graph_many
+        """
         if not trident_driver:
             trident_driver = TridentDriver()
         self._trident_driver = trident_driver
+        self._write_buffer = write_buffer
+        self._parameterized = parameterized
+        self._http_session = http_session
+        self._vertex_cache = vertex_cache
+        self._probe_vertexes = probe_vertexes
+        self._lean_writes = lean_writes
+        self._conflict_retries = conflict_retries
+        self._conflict_backoff = conflict_backoff
+        self._update_properties = update_properties
+        self._counters = {
+            'vertex_cache': {'hits': 0, 'misses': 0, 'probed': 0, 'probe_hits': 0, 'skipped': 0},
+            'conflicts': {'retried': 0, 'recovered': 0, 'exhausted': 0},
+            'updates': {
+                'read': 0, 'read_failures': 0, 'upserted': 0, 'updated': 0, 'unchanged': 0, 'properties_sent': 0,
+                'properties_dropped': 0
+            }
+        }
+        self._counter_lock = threading.Lock()
+
+    @property
+    def write_buffer(self) -> TridentWriteBuffer:
+        return self._write_buffer
+
+    @property
+    def vertex_cache_counters(self) -> Dict[str, int]:
+        with self._counter_lock:
+            return dict(self._counters['vertex_cache'])
+
+    @property
+    def conflict_counters(self) -> Dict[str, int]:
+        with self._counter_lock:
+            return dict(self._counters['conflicts'])
+
+    @property
+    def update_counters(self) -> Dict[str, int]:
+        with self._counter_lock:
+            return dict(self._counters['updates'])
 
     def graph_vertex(self, vertex_scalar: InputVertex):
-        command = create_vertex_command_from_scalar(vertex_scalar)
+        if self._update_properties:
+            return self.graph_many([vertex_scalar])[0]
+        return self._graph_command(*_generate_graph_command(vertex_scalar, self._parameterized, self._lean_writes))
+
+    def graph_edge(self, edge_scalar: InputEdge):
+        return self._graph_command(*_generate_graph_command(edge_scalar, self._parameterized, self._lean_writes))
+
+    def graph_many(self, scalars: List[Union[InputVertex, InputEdge]]) -> List[Dict]:
+        """pushes a collection of vertexes and edges to the graph in as few requests as possible
+
+            the traversals are sent through the shared write buffer if the Ogm has one,
+            otherwise through a buffer which lives only as long as this call.
+            traversals are sent in the order given, so vertexes should come before the edges that connect them.
+            traversals which fail with a ConcurrentModificationException are resent, after a jittered exponential
+            backoff, up to conflict_retries times, the upserts are idempotent so a resend can not write twice.
+            with update_properties, the stored property digests of all the vertexes are read in a single request first,
+            and only what changed is sent, see _plan_commands
+
+        Args:
+            scalars: the InputVertex and InputEdge objects to push
+
+        Returns:
+            one graph result per scalar, in the same order as the scalars
+        """
+        contents = self._generate_contents(scalars)
+        known, missed = self._check_vertex_cache(scalars, contents)
+        stored_hashes = None
+        if self._update_properties:
+            stored_hashes = self._read_property_hashes(self._list_vertex_ids(scalars, known))
+        elif missed and self._probe_vertexes:
+            known |= self._record_probe(missed, self._probe(sorted(set(missed.values()))))
+        generated, unchanged, confirmed = self._plan_commands(scalars, known, contents, stored_hashes)
+        outcomes = self._send_buffered(generated)
+        retried = set()
+        for attempt in range(self._conflict_retries):
+            conflicted = {x: y for x, y in generated.items() if _is_conflict(outcomes[x])}
+            if not conflicted:
+                break
+            retried.update(conflicted)
+            time.sleep(_calculate_backoff(self._conflict_backoff, attempt))
+            outcomes.update(self._send_buffered(conflicted))
+        self._count_conflicts(retried, outcomes)
+        results = self._assemble_results(scalars, generated, outcomes, unchanged)
+        self._remember_vertexes(scalars, results, contents, confirmed)
+        return results
+
+    async def graph_many_async(self, scalars: List[Union[InputVertex, InputEdge]]) -> List[Dict]:
+        """the asyncio counterpart of graph_many, the scalars are sent as one packed request
+
+        Args:
+            scalars: the InputVertex and InputEdge objects to push, vertexes before the edges that connect them
+
+        Returns:
+            one graph result per scalar, in the same order as the scalars
+        """
+        if self._http_session is None:
+            raise RuntimeError('the Ogm must be given an http_session to push objects asynchronously')
+        contents = self._generate_contents(scalars)
+        known, missed = self._check_vertex_cache(scalars, contents)
+        stored_hashes = None
+        if self._update_properties:
+            stored_hashes = await self._read_property_hashes_async(self._list_vertex_ids(scalars, known))
+        elif missed and self._probe_vertexes:
+            known |= self._record_probe(missed, await self._probe_async(sorted(set(missed.values()))))
+        generated, unchanged, confirmed = self._plan_commands(scalars, known, contents, stored_hashes)
+        outcomes = await self._send_packed_async(generated)
+        retried = set()
+        for attempt in range(self._conflict_retries):
+            conflicted = {x: y for x, y in generated.items() if _is_conflict(outcomes[x])}
+            if not conflicted:
+                break
+            retried.update(conflicted)
+            await asyncio.sleep(_calculate_backoff(self._conflict_backoff, attempt))
+            outcomes.update(await self._send_packed_async(conflicted))
+        self._count_conflicts(retried, outcomes)
+        results = self._assemble_results(scalars, generated, outcomes, unchanged)
+        self._remember_vertexes(scalars, results, contents, confirmed)
+        return results
+
+    def _send_buffered(self, generated: Dict[int, Tuple[str, str, Dict[str, Any]]]) -> Dict[int, Exception]:
+        """sends the commands through the write buffer, returning the exception each one raised, keyed by position"""
+        write_buffer = self._write_buffer
+        if write_buffer is None:
+            write_buffer = self._trident_driver.buffered(discard_results=self._lean_writes)
+        submitted = {}
         try:
-            self._trident_driver.execute(command)
-            return {
-                'status': 'succeeded',
-                'operation': 'graph_vertex',
-                'details': {
-                    'message': '',
-                    'command': command
-                }
-            }
+            for position, (_, command, bindings) in generated.items():
+                submitted[position] = write_buffer.submit(command, bindings)
+        finally:
+            if write_buffer is not self._write_buffer:
+                write_buffer.close()
+        return {x: y.exception() for x, y in submitted.items()}
+
+    async def _send_packed_async(self, generated: Dict[int, Tuple[str, str, Dict[str, Any]]]) -> Dict[int, Exception]:
+        commands = [(command, bindings) for _, command, bindings in generated.values()]
+        outcomes = await self._trident_driver.execute_many_async(self._http_session, commands)
+        return dict(zip(generated, outcomes))
+
+    def _generate_contents(self, scalars: List[Union[InputVertex, InputEdge]]) -> Dict[int, Tuple[Dict[str, str], str]]:
+        if not self._update_properties:
+            return {}
+        contents = {}
+        for position, scalar in enumerate(scalars):
+            if isinstance(scalar, InputVertex):
+                property_hashes = generate_property_hashes(scalar)
+                contents[position] = (property_hashes, generate_content_hash(scalar.vertex_type, property_hashes))
+        return contents
+
+    @classmethod
+    def _list_vertex_ids(cls, scalars: List[Union[InputVertex, InputEdge]], known: Set[int]) -> List[str]:
+        return sorted({x.internal_id for y, x in enumerate(scalars) if isinstance(x, InputVertex) and y not in known})
+
+    def _plan_commands(self,
+                       scalars: List[Union[InputVertex, InputEdge]],
+                       known: Set[int],
+                       contents: Dict[int, Tuple[Dict[str, str], str]],
+                       stored_hashes: Dict[str, Dict[str, str]] = None):
+        """generates the command for each scalar which needs one
+
+            without update_properties, every scalar not known to exist is upserted. with it, the property digests of
+            each vertex are compared to the ones stored on the vertex in the graph. a vertex the graph does not have is
+            upserted, and stores its digests as it is created. a vertex which has changed gets a single traversal
+            rewriting only the changed properties and dropping the ones it no longer has, and a vertex which has not
+            changed gets no command at all.
+            if the stored digests could not be read, the vertexes are upserted, as they would be without
+            update_properties
+
+        Returns:
+            the operation, command and bindings for each scalar to send keyed by position, the positions of the
+            vertexes which were unchanged, and the positions of the vertexes whose content the graph will hold
+            once their commands succeed
+        """
+        generated, unchanged, confirmed = {}, set(), set()
+        counts = {'upserted': 0, 'updated': 0, 'unchanged': 0, 'properties_sent': 0, 'properties_dropped': 0}
+        for position, scalar in enumerate(scalars):
+            if position in known:
+                continue
+            if position not in contents:
+                generated[position] = _generate_graph_command(scalar, self._parameterized, self._lean_writes)
+                continue
+            property_hashes, _ = contents[position]
+            if stored_hashes is None or scalar.internal_id not in stored_hashes:
+                operation, command, bindings = _generate_graph_command(scalar, self._parameterized)
+                command = record_property_hashes(command, property_hashes)
+                counts['upserted'] += 1
+                if stored_hashes is not None:
+                    confirmed.add(position)
+            else:
+                stored = stored_hashes[scalar.internal_id]
+                changed = [x for x, y in property_hashes.items() if stored.get(x) != y]
+                removed = [x for x in stored if x not in property_hashes]
+                confirmed.add(position)
+                if not changed and not removed:
+                    unchanged.add(position)
+                    counts['unchanged'] += 1
+                    continue
+                operation, bindings = 'graph_vertex', None
+                command = create_vertex_update_command(scalar, changed + removed, property_hashes)
+                counts['updated'] += 1
+                counts['properties_sent'] += len(changed)
+                counts['properties_dropped'] += len(removed)
+            if self._lean_writes:
+                command = project_id(command)
+            generated[position] = (operation, command, bindings)
+        if contents:
+            self._count('updates', **counts)
+        return generated, unchanged, confirmed
+
+    @classmethod
+    def _assemble_results(cls,
+                          scalars: List[Union[InputVertex, InputEdge]],
+                          generated: Dict[int, Tuple[str, str, Dict[str, Any]]],
+                          outcomes: Dict[int, Exception],
+                          unchanged: Set[int] = frozenset()) -> List[Dict]:
+        results = []
+        for position in range(len(scalars)):
+            if position in unchanged:
+                results.append(_generate_skipped_vertex_result('the properties of the vertex are unchanged'))
+                continue
+            if position not in generated:
+                results.append(_generate_skipped_vertex_result())
+                continue
+            results.append(_generate_graph_result(*generated[position], outcomes[position]))
+        return results
+
+    def _count_conflicts(self, retried: Set[int], outcomes: Dict[int, Exception]):
+        if not retried:
+            return
+        exhausted = len([x for x in retried if _is_conflict(outcomes[x])])
+        self._count('conflicts', retried=len(retried), recovered=len(retried) - exhausted, exhausted=exhausted)
+
+    def _check_vertex_cache(self,
+                            scalars: List[Union[InputVertex, InputEdge]],
+                            contents: Dict[int, Tuple[Dict[str, str], str]]) -> Tuple[Set[int], Dict[int, str]]:
+        """splits the vertexes among the scalars into those found in the vertex cache and those missing from it
+
+            when updating properties, a vertex is only found if the cache holds it with the same content
+
+        Returns:
+            the positions of the cached vertexes, and the internal_id of each missed vertex keyed by its position
+        """
+        known, missed = set(), {}
+        if self._vertex_cache is None:
+            return known, missed
+        for position, scalar in enumerate(scalars):
+            if not isinstance(scalar, InputVertex):
+                continue
+            if position in contents:
+                is_known = self._vertex_cache.content_of(scalar.internal_id) == contents[position][1]
+            else:
+                is_known = self._vertex_cache.contains(scalar.internal_id)
+            if is_known:
+                known.add(position)
+                continue
+            missed[position] = scalar.internal_id
+        self._count('vertex_cache', hits=len(known), misses=len(missed), skipped=len(known))
+        return known, missed
+
+    def _record_probe(self, missed: Dict[int, str], probe_hits: Set[str]) -> Set[int]:
+        self._vertex_cache.add(probe_hits)
+        found = {x for x, y in missed.items() if y in probe_hits}
+        self._count('vertex_cache', probed=len(missed), probe_hits=len(found), skipped=len(found))
+        return found
+
+    def _count(self, counter_group: str, **counts: int):
+        with self._counter_lock:
+            for counter_name, count in counts.items():
+                self._counters[counter_group][counter_name] += count
+
+    def _probe(self, internal_ids: List[str]) -> Set[str]:
+        try:
+            return {str(x) for x in self._trident_driver.stream(create_existence_probe(internal_ids))}
         except Exception as e:
-            return {
-                'status': 'failed',
-                'operation': 'graph_vertex',
-                'details': {
-                    'message': e.args,
-                    'command': command
-                }
-            }
+            logging.warning(f'could not probe the graph for existing vertexes, upserting them all: {e.args}')
+            return set()
 
-    def graph_edge(self, edge_scalar: InputEdge):
-        command = create_edge_command_from_scalar(edge_scalar)
+    async def _probe_async(self, internal_ids: List[str]) -> Set[str]:
         try:
-            self._trident_driver.execute(command)
-            return {
-                'status': 'succeeded',
-                'operation': 'graph_edge',
-                'details': {
-                    'message': '',
-                    'command': command
-                }
-            }
+            probe_results = self._trident_driver.stream_async(self._http_session, create_existence_probe(internal_ids))
+            return {str(x) async for x in probe_results}
         except Exception as e:
-            return {
-                'status': 'failed',
-                'operation': 'graph_edge',
-                'details': {
-                    'message': e.args,
-                    'command': command
-                }
-            }
+            logging.warning(f'could not probe the graph for existing vertexes, upserting them all: {e.args}')
+            return set()
+
+    def _read_property_hashes(self, internal_ids: List[str]) -> Dict[str, Dict[str, str]]:
+        if not internal_ids:
+            return {}
+        try:
+            stored_values = self._trident_driver.stream(create_property_hash_probe(internal_ids))
+            stored_hashes = _parse_property_hashes(stored_values)
+        except Exception as e:
+            logging.warning(f'could not read the stored property hashes, upserting the vertexes instead: {e.args}')
+            self._count('updates', read_failures=len(internal_ids))
+            return None
+        self._count('updates', read=len(internal_ids))
+        return stored_hashes
+
+    async def _read_property_hashes_async(self, internal_ids: List[str]) -> Dict[str, Dict[str, str]]:
+        if not internal_ids:
+            return {}
+        try:
+            stored_values = self._trident_driver.stream_async(
+                self._http_session, create_property_hash_probe(internal_ids))
+            stored_hashes = _parse_property_hashes([x async for x in stored_values])
+        except Exception as e:
+            logging.warning(f'could not read the stored property hashes, upserting the vertexes instead: {e.args}')
+            self._count('updates', read_failures=len(internal_ids))
+            return None
+        self._count('updates', read=len(internal_ids))
+        return stored_hashes
+
+    def _remember_vertexes(self,
+                           scalars: List[Union[InputVertex, InputEdge]],
+                           results: List[Dict],
+                           contents: Dict[int, Tuple[Dict[str, str], str]],
+                           confirmed: Set[int]):
+        if self._vertex_cache is None:
+            return
+        succeeded = [
+            x for x, y in enumerate(results) if isinstance(scalars[x], InputVertex) and y['status'] == 'succeeded'
+        ]
+        self._vertex_cache.add(scalars[x].internal_id for x in succeeded if x not in confirmed)
+        self._vertex_cache.remember({scalars[x].internal_id: contents[x][1] for x in succeeded if x in confirmed})
+
+    def _graph_command(self, operation: str, command: str, bindings: Dict[str, Any] = None) -> Dict:
+        exception = self._send_command(command, bindings)
+        attempt = 0
+        while _is_conflict(exception) and attempt < self._conflict_retries:
+            time.sleep(_calculate_backoff(self._conflict_backoff, attempt))
+            exception = self._send_command(command, bindings)
+            attempt += 1
+        if attempt:
+            self._count_conflicts({0}, {0: exception})
+        return _generate_graph_result(operation, command, bindings, exception)
+
+    def _send_command(self, command: str, bindings: Dict[str, Any] = None) -> Exception:
+        try:
+            if self._write_buffer is not None:
+                self._write_buffer.submit(command, bindings).result()
+            else:
+                self._trident_driver.execute(command, bindings=bindings, discard_results=self._lean_writes)
+            return None
+        except Exception as e:
+            return e
@@ -4,71 +4,255 @@ import hmac
 import json
 import logging
 import os
-from typing import Dict, Any
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, List, Tuple, Iterator, AsyncIterator
 import urllib.parse
 
 import rapidjson
 import requests
-from algernon.aws import Opossum
+from requests.adapters import HTTPAdapter
+
+from toll_booth.obj.credentials import get_trident_user_key
+from toll_booth.obj.graph.generators import namespace_bindings
+from toll_booth.obj.graph.graphson import GraphSONStreamDecoder
+
+
+def _pack_commands(commands: List[Tuple[str, Dict[str, Any]]]) -> Tuple[str, Dict[str, Any]]:
+    packed_commands = []
+    packed_bindings = {}
+    for namespace, (command, bindings) in enumerate(commands):
+        if bindings:
+            command, bindings = namespace_bindings(command, bindings, namespace)
+            packed_bindings.update(bindings)
+        packed_commands.append(command)
+    return ';'.join(packed_commands), packed_bindings
+
+
+def _build_pooled_session(pool_size: int, scheme: str) -> requests.Session:
+    session = requests.session()
+    session.mount(f'{scheme}://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return session
 
 
 class TridentNotary:
+    """Signs and sends gremlin commands to a single Neptune endpoint
+
+        notaries are meant to be fetched through for_endpoint, which keeps one notary per endpoint for the life
+        of the process, so warm invocations reuse the pooled keep-alive connections and the day's signing key
+    """
     _region = os.getenv('AWS_REGION', 'us-east-1')
     _service = 'neptune-db'
+    _default_pool_size = int(os.getenv('TRIDENT_POOL_SIZE', 10))
+    _registry = {}
+    _registry_lock = threading.Lock()
 
-    def __init__(self, neptune_endpoint: str, session: requests.session = None):
+    def __init__(self,
+                 neptune_endpoint: str,
+                 session: requests.session = None,
+                 pool_size: int = None,
+                 port: int = None,
+                 scheme: str = None):
         if neptune_endpoint is None:
             raise RuntimeError('must specify neptune endpoint when calling the trident_notary')
+        if pool_size is None:
+            pool_size = self._default_pool_size
+        if port is None:
+            port = int(os.getenv('GRAPH_DB_PORT', 8182))
+        if scheme is None:
+            scheme = os.getenv('GRAPH_DB_SCHEME', 'https')
         if not session:
-            session = requests.session()
+            session = _build_pooled_session(pool_size, scheme)
         self._session = session
+        self._pool_size = pool_size
+        self._scheme = scheme
+        self._signing_key = (None, None)
         self._neptune_endpoint = neptune_endpoint
         self._uri = '/gremlin/'
         self._method = 'POST'
-        self._host = neptune_endpoint + ':8182'
+        self._host = f'{neptune_endpoint}:{port}'
         self._signed_headers = 'host;x-amz-date'
         self._algorithm = 'AWS4-HMAC-SHA256'
-        access_key = os.getenv('AWS_ACCESS_KEY_ID', None)
-        secret_key = os.getenv('AWS_SECRET_ACCESS_KEY', None)
-        self._session_token = os.getenv('AWS_SESSION_TOKEN', None)
-        if access_key is None or secret_key is None:
-            access_key, secret_key = Opossum.get_trident_user_key()
-        self._access_key = access_key
-        self._secret_key = secret_key
-        self._credentials = f"Credentials={self._access_key}"
-        self._request_url = f'https://{neptune_endpoint}:8182{self._uri}'
+        self._request_url = f'{scheme}://{self._host}{self._uri}'
+
+    @classmethod
+    def for_endpoint(cls, neptune_endpoint: str, pool_size: int = None):
+        """returns the process-wide notary for an endpoint, creating it on first use
+
+        Args:
+            neptune_endpoint: the host name of the Neptune endpoint
+            pool_size: the number of keep-alive connections the notary should hold, the pool only ever grows
+
+        Returns:
+            the TridentNotary for the endpoint
+        """
+        if neptune_endpoint is None:
+            raise RuntimeError('must specify neptune endpoint when calling the trident_notary')
+        registry_key = (neptune_endpoint, os.getenv('GRAPH_DB_PORT'), os.getenv('GRAPH_DB_SCHEME'))
+        with cls._registry_lock:
+            notary = cls._registry.get(registry_key)
+            if notary is None:
+                notary = cls(neptune_endpoint, pool_size=pool_size)
+                cls._registry[registry_key] = notary
+            elif pool_size:
+                notary.ensure_pool_size(pool_size)
+            return notary
 
     @classmethod
     def get_for_writer(cls, **kwargs):
         endpoint = kwargs.get('graph_db_endpoint', os.getenv('GRAPH_DB_ENDPOINT', None))
-        return cls(endpoint)
+        return cls.for_endpoint(endpoint, kwargs.get('pool_size'))
 
     @classmethod
     def get_for_reader(cls, **kwargs):
         endpoint = kwargs.get('graph_db_reader_endpoint', os.getenv('GRAPH_DB_READER_ENDPOINT', None))
-        return cls(endpoint)
+        return cls.for_endpoint(endpoint, kwargs.get('pool_size'))
+
+    @property
+    def pool_size(self) -> int:
+        return self._pool_size
+
+    def ensure_pool_size(self, pool_size: int):
+        """grows the connection pool so that pool_size threads can hold a connection at once
+
+            the adapter holding the smaller pool is closed once it has been replaced, so its idle connections are
+            not left open, connections still in use are closed as they are released
+        """
+        if pool_size <= self._pool_size:
+            return
+        prefix = f'{self._scheme}://'
+        previous_adapter = self._session.adapters.get(prefix)
+        self._session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._pool_size = pool_size
+        if previous_adapter is not None:
+            previous_adapter.close()
+
+    def send(self, command: str, bindings: Dict[str, Any] = None, discard_results: bool = False) -> Dict[str, Any]:
+        """signs and sends a command
+
+        Args:
+            command: the gremlin text to send
+            bindings: the bindings for a parameterized command, if any
+            discard_results: only check that the command succeeded, the body of a successful response is not decoded
 
-    def send(self, command: str) -> Dict[str, Any]:
+        Returns:
+            the data portion of the database response, or None if the results were discarded
+        """
+        headers, request_parameters = self._generate_request(command, bindings)
+        logging.debug('sending a command to the remote database: %s', command)
+        get_results = self._session.post(self._request_url, headers=headers, data=request_parameters)
+        return self._parse_results(get_results.status_code, get_results.content, command, discard_results)
+
+    async def send_async(self,
+                         http_session,
+                         command: str,
+                         bindings: Dict[str, Any] = None,
+                         discard_results: bool = False) -> Dict[str, Any]:
+        """signs and sends a command without blocking the event loop
+
+        Args:
+            http_session: an open aiohttp.ClientSession, owned by the caller
+            command: the gremlin text to send
+            bindings: the bindings for a parameterized command, if any
+            discard_results: only check that the command succeeded, the body of a successful response is not decoded
+
+        Returns:
+            the data portion of the database response, or None if the results were discarded
+        """
+        headers, request_parameters = self._generate_request(command, bindings)
+        logging.debug('sending a command to the remote database: %s', command)
+        async with http_session.post(self._request_url, headers=headers, data=request_parameters) as response:
+            response_body = await response.read()
+            return self._parse_results(response.status, response_body, command, discard_results)
+
+    def stream(self, command: str, bindings: Dict[str, Any] = None, chunk_size: int = 65536) -> Iterator[Any]:
+        """signs and sends a command, yielding the elements of its results as the response body arrives
+
+            meant for reads with large results, which never have to be held in memory at once
+
+        Args:
+            command: the gremlin text to send
+            bindings: the bindings for a parameterized command, if any
+            chunk_size: the most bytes of the body read at a time
+
+        Yields:
+            each element of the data list of the response, as raw GraphSON
+        """
+        headers, request_parameters = self._generate_request(command, bindings)
+        logging.debug('streaming a command from the remote database: %s', command)
+        with self._session.post(self._request_url, headers=headers, data=request_parameters, stream=True) as response:
+            if response.status_code != 200:
+                self._raise_failure(response.content, command)
+            decoder = GraphSONStreamDecoder()
+            for chunk in response.iter_content(chunk_size):
+                yield from decoder.feed(chunk)
+            yield from decoder.close()
+
+    async def stream_async(self,
+                           http_session,
+                           command: str,
+                           bindings: Dict[str, Any] = None,
+                           chunk_size: int = 65536) -> AsyncIterator[Any]:
+        """the asyncio counterpart of stream
+
+        Args:
+            http_session: an open aiohttp.ClientSession, owned by the caller
+            command: the gremlin text to send
+            bindings: the bindings for a parameterized command, if any
+            chunk_size: the most bytes of the body read at a time
+
+        Yields:
+            each element of the data list of the response, as raw GraphSON
+        """
+        headers, request_parameters = self._generate_request(command, bindings)
+        logging.debug('streaming a command from the remote database: %s', command)
+        async with http_session.post(self._request_url, headers=headers, data=request_parameters) as response:
+            if response.status != 200:
+                self._raise_failure(await response.read(), command)
+            decoder = GraphSONStreamDecoder()
+            async for chunk in response.content.iter_chunked(chunk_size):
+                for element in decoder.feed(chunk):
+                    yield element
+            for element in decoder.close():
+                yield element
+
+    def _generate_request(self, command: str, bindings: Dict[str, Any] = None) -> Tuple[Dict[str, str], str]:
         t = datetime.datetime.utcnow()
         amz_date = t.strftime('%Y%m%dT%H%M%SZ')
         date_stamp = t.strftime('%Y%m%d')
-        canonical_request, request_parameters = self._generate_canonical_request(amz_date, command)
+        canonical_request, request_parameters = self._generate_canonical_request(amz_date, command, bindings)
+        access_key, secret_key, session_token = self._get_credentials()
         credential_scope = self._generate_scope(date_stamp)
         string_to_sign = self._generate_string_to_sign(canonical_request, amz_date, credential_scope)
-        signature = self._generate_signature(string_to_sign, date_stamp)
-        headers = self._generate_headers(credential_scope, signature, amz_date)
-        logging.debug(f'sending a command to the remote database: {command}')
-        get_results = self._session.post(self._request_url, headers=headers, data=request_parameters)
-        if get_results.status_code != 200:
-            raise RuntimeError(f'error passing command to remote database: {get_results.text}, command: {command}')
-        response_json = rapidjson.loads(get_results.text)
-        results = response_json['result']['data']
-        logging.debug(f'received a response from the graph database: {results}')
-        logging.debug(f'after parsing and transforming the response from the graph database, results: {results}')
+        signature = self._generate_signature(string_to_sign, date_stamp, secret_key)
+        headers = self._generate_headers(credential_scope, signature, amz_date, access_key, session_token)
+        return headers, request_parameters
+
+    @classmethod
+    def _parse_results(cls,
+                       status_code: int,
+                       response_body: bytes,
+                       command: str,
+                       discard_results: bool = False) -> Dict[str, Any]:
+        if status_code != 200:
+            cls._raise_failure(response_body, command)
+        if discard_results:
+            return None
+        results = rapidjson.loads(response_body)['result']['data']
+        logging.debug('received a response from the graph database: %s', results)
         return results
 
-    def _generate_canonical_request(self, amz_date, command):
-        payload = json.dumps({'gremlin': command})
+    @classmethod
+    def _raise_failure(cls, response_body: bytes, command: str):
+        response_text = response_body.decode('utf-8', errors='replace')
+        raise RuntimeError(f'error passing command to remote database: {response_text}, command: {command}')
+
+    def _generate_canonical_request(self, amz_date, command, bindings=None):
+        payload = {'gremlin': command}
+        if bindings:
+            payload['bindings'] = bindings
+        payload = json.dumps(payload)
         canonical_headers = f'host:{self._host}\nx-amz-date:{amz_date}\n'
         payload_hash = hashlib.sha256(payload.encode('utf-8')).hexdigest()
         canon_request = f"{self._method}\n{self._uri}\n\n{canonical_headers}\n{self._signed_headers}\n{payload_hash}"
@@ -81,26 +265,44 @@ class TridentNotary:
     def _generate_scope(self, date_stamp):
         return f"{date_stamp}/{self._region}/{self._service}/aws4_request"
 
-    def _get_signature_key(self, date_stamp):
-        k_date = self._sign(f'AWS4{self._secret_key}'.encode('utf-8'), date_stamp)
+    @classmethod
+    def _get_credentials(cls) -> Tuple[str, str, str]:
+        access_key = os.getenv('AWS_ACCESS_KEY_ID', None)
+        secret_key = os.getenv('AWS_SECRET_ACCESS_KEY', None)
+        session_token = os.getenv('AWS_SESSION_TOKEN', None)
+        if access_key is None or secret_key is None:
+            access_key, secret_key = get_trident_user_key()
+        return access_key, secret_key, session_token
+
+    def _get_signature_key(self, date_stamp, secret_key):
+        cache_key = (date_stamp, secret_key)
+        cached_key, signing_key = self._signing_key
+        if cached_key == cache_key:
+            return signing_key
+        signing_key = self._derive_signature_key(date_stamp, secret_key)
+        self._signing_key = (cache_key, signing_key)
+        return signing_key
+
+    def _derive_signature_key(self, date_stamp, secret_key):
+        k_date = self._sign(f'AWS4{secret_key}'.encode('utf-8'), date_stamp)
         k_region = self._sign(k_date, self._region)
         k_service = self._sign(k_region, self._service)
         k_signing = self._sign(k_service, 'aws4_request')
         return k_signing
 
-    def _generate_signature(self, string_to_sign, date_stamp):
-        signing_key = self._get_signature_key(date_stamp)
+    def _generate_signature(self, string_to_sign, date_stamp, secret_key):
+        signing_key = self._get_signature_key(date_stamp, secret_key)
         signature = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
         return signature
 
-    def _generate_headers(self, credential_scope, signature, amz_date):
-        credentials_entry = f'Credential={self._access_key}/{credential_scope}'
+    def _generate_headers(self, credential_scope, signature, amz_date, access_key, session_token):
+        credentials_entry = f'Credential={access_key}/{credential_scope}'
         headers_entry = f'SignedHeaders={self._signed_headers}'
         signature_entry = f'Signature={signature}'
         authorization_header = f"{self._algorithm} {credentials_entry}, {headers_entry}, {signature_entry}"
         headers = {'x-amz-date': amz_date, 'Authorization': authorization_header}
-        if self._session_token:
-            headers['x-amz-security-token'] = self._session_token
+        if session_token:
+            headers['x-amz-security-token'] = session_token
         return headers
 
     @classmethod
@@ -115,26 +317,288 @@ class TridentNotary:
         return hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
 
 
+class TridentWriteBuffer:
+    """Packs write traversals into shared requests to the writer endpoint
+
+        submitted commands are joined with ';' and sent as one request once the buffer holds max_commands
+        traversals, reaches max_bytes, or the oldest buffered traversal has waited max_wait seconds.
+        every submission gets its own Future, so callers learn the outcome of their traversal alone.
+        the buffer is safe to share between threads, submissions block while max_pending commands are waiting.
+        a batch is taken from the buffer under its lock and sent outside of it, with up to max_sends requests in
+        flight at once. a submitter which finds every send slot taken leaves its batch to the senders and the
+        background flusher, so once max_pending traversals pile up behind slow requests, submissions block
+    """
+    def __init__(self,
+                 notary: TridentNotary,
+                 max_commands: int = 50,
+                 max_bytes: int = 131072,
+                 max_wait: float = 0.05,
+                 max_pending: int = None,
+                 isolate_failures: bool = True,
+                 discard_results: bool = False,
+                 max_sends: int = None):
+        """
+
+        Args:
+            notary: the notary which signs and sends the packed requests
+            max_commands: the most traversals packed into a single request
+            max_bytes: the largest packed request body, in bytes of gremlin text
+            max_wait: the longest a traversal is held in the buffer before it is sent, in seconds
+            max_pending: the most traversals held at once, defaults to four full requests
+            isolate_failures: if a packed request fails, resend its traversals one at a time to find the culprit
+            discard_results: skip decoding the responses, every Future resolves to None once its traversal is applied
+            max_sends: the most packed requests in flight at once, defaults to the connection pool size of the notary
+        """
+        if max_pending is None:
+            max_pending = max_commands * 4
+        if max_sends is None:
+            max_sends = notary.pool_size
+        self._notary = notary
+        self._max_commands = max_commands
+        self._max_bytes = max_bytes
+        self._max_wait = max_wait
+        self._max_pending = max(max_pending, max_commands)
+        self._isolate_failures = isolate_failures
+        self._discard_results = discard_results
+        self._pending = []
+        self._pending_bytes = 0
+        self._condition = threading.Condition()
+        self._send_slots = threading.BoundedSemaphore(max(max_sends, 1))
+        self._in_flight = 0
+        self._flusher = None
+        self._closed = False
+
+    def submit(self, command: str, bindings: Dict[str, Any] = None) -> Future:
+        """adds a write traversal to the buffer
+
+        Args:
+            command: the gremlin text of the traversal
+            bindings: the bindings for a parameterized traversal, if any
+
+        Returns:
+            a Future which resolves once the traversal has been sent, or fails with the error the database raised
+        """
+        future = Future()
+        command_size = len(command.encode('utf-8')) + 1
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('can not submit a command to a closed TridentWriteBuffer')
+            while len(self._pending) >= self._max_pending:
+                self._condition.wait()
+            self._pending.append((command, bindings, command_size, future, time.monotonic()))
+            self._pending_bytes += command_size
+            is_ready = self._is_ready()
+            self._start_flusher()
+            self._condition.notify_all()
+        if is_ready:
+            self._send_ready()
+        return future
+
+    def flush(self):
+        """sends everything currently held in the buffer, regardless of the flush limits, and waits for every
+            request in flight to return"""
+        self._send_ready(force=True)
+        with self._condition:
+            while self._in_flight:
+                self._condition.wait()
+
+    def close(self):
+        """flushes the buffer and stops the background flusher, no further commands are accepted"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            flusher = self._flusher
+        if flusher is not None:
+            flusher.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _is_ready(self) -> bool:
+        if not self._pending:
+            return False
+        if len(self._pending) >= self._max_commands or self._pending_bytes >= self._max_bytes:
+            return True
+        oldest_submission = self._pending[0][4]
+        return time.monotonic() - oldest_submission >= self._max_wait
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._run_flusher, daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                time_remaining = self._pending[0][4] + self._max_wait - time.monotonic()
+                if time_remaining > 0 and not self._is_ready():
+                    self._condition.wait(time_remaining)
+                    continue
+            self._send_ready(wait_for_slot=True)
+
+    def _take_batch(self, force: bool) -> List[Tuple[str, Dict[str, Any], Future]]:
+        with self._condition:
+            if not force and not self._is_ready():
+                return []
+            batch = []
+            batch_bytes = 0
+            while self._pending and len(batch) < self._max_commands:
+                command, bindings, command_size, future, _ = self._pending[0]
+                if batch and batch_bytes + command_size > self._max_bytes:
+                    break
+                self._pending.pop(0)
+                self._pending_bytes -= command_size
+                batch_bytes += command_size
+                batch.append((command, bindings, future))
+            if batch:
+                self._in_flight += 1
+            self._condition.notify_all()
+            return batch
+
+    def _send_ready(self, force: bool = False, wait_for_slot: bool = False):
+        while self._send_slots.acquire(blocking=force or wait_for_slot):
+            batch = []
+            try:
+                batch = self._take_batch(force)
+                if not batch:
+                    return
+                self._send_batch(batch)
+            finally:
+                self._send_slots.release()
+                if batch:
+                    with self._condition:
+                        self._in_flight -= 1
+                        self._condition.notify_all()
+
+    def _send_batch(self, batch: List[Tuple[str, Dict[str, Any], Future]]):
+        logging.debug(f'sending {len(batch)} buffered commands to the remote database')
+        try:
+            if len(batch) == 1:
+                command, bindings, _ = batch[0]
+            else:
+                command, bindings = _pack_commands([(x[0], x[1]) for x in batch])
+            results = self._notary.send(command, bindings, self._discard_results)
+        except Exception as e:
+            if not self._isolate_failures or len(batch) == 1:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                return
+            logging.warning(f'packed request of {len(batch)} commands failed, resending them individually: {e.args}')
+            for command, bindings, future in batch:
+                self._send_single(command, bindings, future)
+            return
+        for _, _, future in batch[:-1]:
+            future.set_result(None)
+        batch[-1][2].set_result(results)
+
+    def _send_single(self, command: str, bindings: Dict[str, Any], future: Future):
+        try:
+            future.set_result(self._notary.send(command, bindings, self._discard_results))
+        except Exception as e:
+            future.set_exception(e)
+
+
 class TridentDriver:
     def __init__(self, **kwargs):
-        self._read_notary = kwargs.get('read_notary', TridentNotary.get_for_reader(**kwargs))
-        self._write_notary = kwargs.get('write_notary', TridentNotary.get_for_writer(**kwargs))
+        read_notary = kwargs.get('read_notary')
+        if read_notary is None:
+            read_notary = TridentNotary.get_for_reader(**kwargs)
+        write_notary = kwargs.get('write_notary')
+        if write_notary is None:
+            write_notary = TridentNotary.get_for_writer(**kwargs)
+        self._read_notary = read_notary
+        self._write_notary = write_notary
         self._batch_mode = False
 
     def get(self, internal_id):
         command = "g.V('%s')" % internal_id
         return self.execute(command, True)
 
-    def execute(self, query_text: str, read_only: bool = False):
+    def execute(self,
+                query_text: str,
+                read_only: bool = False,
+                bindings: Dict[str, Any] = None,
+                discard_results: bool = False):
         if self._batch_mode is True:
-            self._batch_commands.append(query_text)
+            self._batch_commands.append((query_text, bindings))
             return
         notary = self._write_notary
         if read_only:
             notary = self._read_notary
-        results = notary.send(query_text)
+        results = notary.send(query_text, bindings, discard_results)
         return results
 
+    def stream(self, query_text: str, bindings: Dict[str, Any] = None) -> Iterator[Any]:
+        """runs a read against the reader endpoint, yielding the results as they arrive, see TridentNotary.stream"""
+        return self._read_notary.stream(query_text, bindings)
+
+    def stream_async(self, http_session, query_text: str, bindings: Dict[str, Any] = None) -> AsyncIterator[Any]:
+        """the asyncio counterpart of stream"""
+        return self._read_notary.stream_async(http_session, query_text, bindings)
+
+    async def execute_async(self,
+                            http_session,
+                            query_text: str,
+                            read_only: bool = False,
+                            bindings: Dict[str, Any] = None):
+        notary = self._write_notary
+        if read_only:
+            notary = self._read_notary
+        return await notary.send_async(http_session, query_text, bindings)
+
+    async def execute_many_async(self, http_session, commands: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        """sends a group of write commands as one packed request, without blocking the event loop
+
+            if the packed request fails, the commands are resent one at a time, in order,
+            so each command gets its own outcome
+
+        Args:
+            http_session: an open aiohttp.ClientSession, owned by the caller
+            commands: the (gremlin text, bindings) pairs to send, bindings may be None
+
+        Returns:
+            one entry per command, None if it was applied, otherwise the exception it raised
+        """
+        if not commands:
+            return []
+        command, bindings = commands[0]
+        if len(commands) > 1:
+            command, bindings = _pack_commands(commands)
+        try:
+            await self._write_notary.send_async(http_session, command, bindings, True)
+            return [None for _ in commands]
+        except Exception as e:
+            if len(commands) == 1:
+                return [e]
+            logging.warning(f'packed request of {len(commands)} commands failed, resending them individually: {e.args}')
+        outcomes = []
+        for command, bindings in commands:
+            try:
+                await self._write_notary.send_async(http_session, command, bindings, True)
+                outcomes.append(None)
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+
+    def buffered(self, **kwargs) -> TridentWriteBuffer:
+        """creates a thread-safe, auto-flushing write buffer bound to the writer endpoint
+
+        Args:
+            **kwargs: the flush limits for the buffer, see TridentWriteBuffer
+
+        Returns:
+            a TridentWriteBuffer, close it (or use it as a context manager) to send the final partial request
+        """
+        return TridentWriteBuffer(self._write_notary, **kwargs)
+
     def __enter__(self):
         self._batch_commands = []
         self._batch_mode = True
@@ -144,8 +608,8 @@ class TridentDriver:
         if not exc_type and not exc_val:
             self._batch_mode = False
             if self._batch_commands:
-                commands = ';'.join(self._batch_commands)
-                self.execute(commands)
+                commands, bindings = _pack_commands(self._batch_commands)
+                self.execute(commands, bindings=bindings)
             self._batch_commands = []
             return True
         raise (exc_type(exc_val))
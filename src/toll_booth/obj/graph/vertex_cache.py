@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Dict, Optional
+
+
+class VertexExistenceCache:
+    """A bounded, thread-safe record of the internal_ids known to exist in the graph
+
+        entries expire ttl seconds after they were last confirmed, and once max_size is reached the least recently
+        confirmed entry is dropped to make room. a vertex upsert never changes a vertex which already exists, so an
+        upsert for a vertex found here can be skipped without changing what ends up in the graph. vertexes written with
+        their properties are remembered along with a digest of that content, so an unchanged vertex can be passed
+        over by a property update as well
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def contains(self, internal_id: str) -> bool:
+        with self._lock:
+            return self._find_entry(internal_id) is not None
+
+    def content_of(self, internal_id: str) -> Optional[str]:
+        """the digest of the content the vertex was last written with, None if it is not known"""
+        with self._lock:
+            entry = self._find_entry(internal_id)
+            if entry is None:
+                return None
+            return entry[1]
+
+    def add(self, internal_ids: Iterable[str]):
+        self._store((x, None) for x in internal_ids)
+
+    def remember(self, contents: Dict[str, str]):
+        """records vertexes as existing with the given content digests, keyed by internal_id"""
+        self._store(contents.items())
+
+    def _store(self, entries):
+        now = time.monotonic()
+        with self._lock:
+            for internal_id, content in entries:
+                if content is None:
+                    content = self._entries.get(internal_id, (None, None))[1]
+                self._entries[internal_id] = (now, content)
+                self._entries.move_to_end(internal_id)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def _find_entry(self, internal_id: str):
+        entry = self._entries.get(internal_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self._ttl:
+            del self._entries[internal_id]
+            return None
+        return entry
+
+    def invalidate(self, internal_id: str = None):
+        with self._lock:
+            if internal_id is None:
+                self._entries.clear()
+                return
+            self._entries.pop(internal_id, None)
+
+
+_vertex_cache = VertexExistenceCache(
+    int(os.getenv('VERTEX_CACHE_SIZE', 100000)),
+    float(os.getenv('VERTEX_CACHE_TTL_SECONDS', 900))
+)
+
+
+def get_vertex_cache() -> VertexExistenceCache:
+    """the cache shared by every push made in this container"""
+    return _vertex_cache
@@ -0,0 +1,144 @@
+import json
+import math
+import threading
+import time
+from typing import Any, Dict, List, Union
+
+THROTTLE_CODES = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+
+
+def estimate_write_units(item: Dict[str, Any]) -> int:
+    """the write units a put of the item costs the table itself, one for each started kilobyte"""
+    return max(math.ceil(len(json.dumps(item, default=str).encode('utf-8')) / 1024), 1)
+
+
+class CapacityAccount:
+    """A thread-safe tally of the capacity the index requests of one push consumed
+
+        the ConsumedCapacity of each response is added up for the table and for each secondary index, alongside
+        the largest item collection size estimate seen and the requests which were throttled
+    """
+    def __init__(self):
+        self._read_units = 0.0
+        self._write_units = 0.0
+        self._tables = {}
+        self._indexes = {}
+        self._item_collections = {'measured': 0, 'max_size_estimate_gb': 0.0}
+        self._throttles = 0
+        self._lock = threading.Lock()
+
+    def record_consumed(self, consumed_capacity: Union[Dict, List[Dict], None], kind: str):
+        """adds the ConsumedCapacity of a response, kind is either read or write"""
+        if not consumed_capacity:
+            return
+        if isinstance(consumed_capacity, dict):
+            consumed_capacity = [consumed_capacity]
+        with self._lock:
+            for entry in consumed_capacity:
+                units = _find_units(entry, kind)
+                if kind == 'read':
+                    self._read_units += units
+                else:
+                    self._write_units += units
+                table_units = _find_units(entry.get('Table', entry), kind)
+                _add_units(self._tables, entry.get('TableName', 'unknown'), kind, table_units)
+                for index_type in ('GlobalSecondaryIndexes', 'LocalSecondaryIndexes'):
+                    for index_name, index_entry in entry.get(index_type, {}).items():
+                        _add_units(self._indexes, index_name, kind, _find_units(index_entry, kind))
+
+    def record_item_collections(self, item_collection_metrics: Union[Dict, List[Dict], None]):
+        """adds the ItemCollectionMetrics of a response, either one set of metrics or a list of them"""
+        if not item_collection_metrics:
+            return
+        if isinstance(item_collection_metrics, dict):
+            item_collection_metrics = [item_collection_metrics]
+        with self._lock:
+            for entry in item_collection_metrics:
+                size_estimate = entry.get('SizeEstimateRangeGB', [])
+                if not size_estimate:
+                    continue
+                self._item_collections['measured'] += 1
+                self._item_collections['max_size_estimate_gb'] = max(
+                    self._item_collections['max_size_estimate_gb'], float(max(size_estimate)))
+
+    def record_throttle(self, count: int = 1):
+        with self._lock:
+            self._throttles += count
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'read_units': self._read_units,
+                'write_units': self._write_units,
+                'tables': {x: dict(y) for x, y in self._tables.items()},
+                'indexes': {x: dict(y) for x, y in self._indexes.items()},
+                'item_collections': dict(self._item_collections),
+                'throttles': self._throttles
+            }
+
+
+def total_units(consumed_capacity: Union[Dict, List[Dict], None], kind: str) -> float:
+    """the units a response consumed across the table and its indexes, kind is either read or write"""
+    if not consumed_capacity:
+        return 0.0
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    return sum(_find_units(x, kind) for x in consumed_capacity)
+
+
+def _find_units(entry: Dict, kind: str) -> float:
+    return float(entry.get(f'{kind.capitalize()}CapacityUnits', entry.get('CapacityUnits', 0)))
+
+
+def _add_units(totals: Dict[str, Dict[str, float]], name: str, kind: str, units: float):
+    entry = totals.setdefault(name, {'read_units': 0.0, 'write_units': 0.0})
+    entry[f'{kind}_units'] += units
+
+
+class WriteCapacityLimiter:
+    """A token bucket which keeps the writes of a push under a budget of write units per second
+
+        a write takes its estimated cost from the bucket up front, waiting for the bucket to refill if it has to,
+        and once the write returns the difference between the estimate and what was actually consumed is settled,
+        so writes which cost more than expected, such as those with several indexes to update, slow the ones after
+    """
+    def __init__(self, units_per_second: float, burst: float = None):
+        self._rate = float(units_per_second)
+        self._burst = float(burst or units_per_second)
+        self._tokens = self._burst
+        self._updated = time.monotonic()
+        self._waited = 0.0
+        self._lock = threading.Lock()
+        self._settled = threading.Condition(self._lock)
+
+    @property
+    def waited(self) -> float:
+        """the seconds writes have spent waiting on the bucket"""
+        return self._waited
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, units: float):
+        """waits until the bucket holds the units, or all it can hold, then takes them
+
+            the lock is let go for the wait, so other writes can settle meanwhile, and the units a settle hands
+            back wake the waiting writes to check the bucket again rather than sleep out the rest of their wait
+        """
+        with self._settled:
+            self._refill()
+            needed = min(units, self._burst)
+            while self._tokens < needed:
+                started = time.monotonic()
+                self._settled.wait((needed - self._tokens) / self._rate)
+                self._waited += time.monotonic() - started
+                self._refill()
+            self._tokens -= units
+
+    def settle(self, estimated_units: float, consumed_units: float):
+        with self._settled:
+            self._tokens = min(self._burst, self._tokens + estimated_units - consumed_units)
+            if consumed_units < estimated_units:
+                self._settled.notify_all()
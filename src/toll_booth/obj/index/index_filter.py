@@ -0,0 +1,107 @@
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+
+class BloomFilter:
+    """A fixed-size set of keys which can answer that a key is definitely absent, or that it may be present"""
+    def __init__(self, num_bits: int, num_hashes: int):
+        self._num_bits = max(num_bits, 8)
+        self._num_hashes = max(num_hashes, 1)
+        self._bits = bytearray((self._num_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, false_positive_rate: float = 0.01):
+        """sizes the filter to hold capacity keys at the given false positive rate"""
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        return cls(num_bits, round(num_bits / capacity * math.log(2)))
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path: str, false_positive_rate: float = 0.01):
+        """builds a filter from a snapshot file of known keys, one key per line
+
+            a line is either an object key, the sid_value and identifier_stem separated by a tab, or an internal_id
+        """
+        with open(snapshot_path) as snapshot_file:
+            keys = [x.rstrip('\n') for x in snapshot_file if x.strip()]
+        bloom_filter = cls.for_capacity(len(keys), false_positive_rate)
+        for key in keys:
+            bloom_filter.add(key)
+        return bloom_filter
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + x * second) % self._num_bits for x in range(self._num_hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[x // 8] & (1 << (x % 8)) for x in self._positions(key))
+
+
+class IndexedKeyFilter:
+    """A local record of the objects known to be in the index, checked before paying for a conditional write
+
+        the keys indexed or found to be indexed by this container are held in a bounded LRU, a key found there is
+        definitely indexed. a bloom filter loaded from a snapshot of the table can also be given, a key it holds
+        may be indexed and has to be confirmed against the table before the write can be skipped
+    """
+    def __init__(self, max_size: int, bloom_filter: BloomFilter = None):
+        self._max_size = max_size
+        self._bloom_filter = bloom_filter
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def check(self, object_key: str, internal_id: str) -> Optional[bool]:
+        """whether the object is known to be indexed
+
+        Returns:
+            True if it was recently indexed, None if the bloom filter holds it, False if it is not known
+        """
+        with self._lock:
+            if object_key in self._entries:
+                self._entries.move_to_end(object_key)
+                return True
+        if self._bloom_filter is not None and (object_key in self._bloom_filter or internal_id in self._bloom_filter):
+            return None
+        return False
+
+    def add(self, object_keys: Iterable[str]):
+        with self._lock:
+            for object_key in object_keys:
+                self._entries[object_key] = True
+                self._entries.move_to_end(object_key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, object_key: str):
+        with self._lock:
+            self._entries.pop(object_key, None)
+
+
+_index_filter = None
+_index_filter_lock = threading.Lock()
+
+
+def get_index_filter() -> IndexedKeyFilter:
+    """the filter shared by every index push made in this container, the snapshot is loaded on first use"""
+    global _index_filter
+    with _index_filter_lock:
+        if _index_filter is None:
+            bloom_filter = None
+            snapshot_path = os.getenv('INDEX_FILTER_SNAPSHOT')
+            if snapshot_path:
+                false_positive_rate = float(os.getenv('INDEX_FILTER_FALSE_POSITIVE_RATE', 0.01))
+                bloom_filter = BloomFilter.from_snapshot(snapshot_path, false_positive_rate)
+            _index_filter = IndexedKeyFilter(int(os.getenv('INDEX_FILTER_SIZE', 100000)), bloom_filter)
+        return _index_filter
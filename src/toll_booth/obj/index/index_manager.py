@@ -1,30 +1,48 @@
+import json
 import logging
 import os
-from typing import Union, Dict, List
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, Dict, List, Optional, Iterator, Iterable, Tuple
 
-import boto3
-import rapidjson
-from algernon.serializers import ExplosionJson
 from aws_xray_sdk.core import xray_recorder
 from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
 from botocore.exceptions import ClientError
 
-from multiprocessing.dummy import Pool as ThreadPool
-
 
+from toll_booth.obj.clients import get_client, get_resource
 from toll_booth.obj.scalars.object_properties import ObjectProperty
 from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
+from toll_booth.obj.index.capacity import CapacityAccount, WriteCapacityLimiter, THROTTLE_CODES, \
+    estimate_write_units, total_units
+from toll_booth.obj.index.index_filter import IndexedKeyFilter
 from toll_booth.obj.index.indexes import UniqueIndex
+from toll_booth.obj.index.lookups import generate_lookup_key, generate_lookup_keys, PROPERTY_LOOKUPS, INDEXED_OBJECT
 from toll_booth.obj.index.troubles import MissingIndexedPropertyException, UniqueIndexViolationException
 
+_MAX_TRANSACTION_ITEMS = 100
+_MAX_BATCH_WRITE_ITEMS = 25
+_MAX_BATCH_GET_ITEMS = 100
+_SCAN_FINISHED = object()
+_deserializer = TypeDeserializer()
+
+
+def _convert_dynamo_record(dynamo_record: Dict) -> Dict:
+    """converts a record in the low-level DynamoDB attribute format, as returned by the client, to python values"""
+    return {x: _deserializer.deserialize(y) for x, y in dynamo_record.items()}
+
 
 def _generate_gql_property(record_entry):
     record_property_value = record_entry['property_value']
     property_value = {
-        '__typename': record_property_value['property_type']
+        '__typename': record_property_value.get('property_type', record_property_value.get('__typename'))
     }
     for property_name, property_entry in record_property_value.items():
-        if property_name == 'property_type':
+        if property_name in ('property_type', '__typename'):
             continue
         property_value[property_name] = property_entry
     return {
@@ -37,8 +55,8 @@ def _generate_gql_property(record_entry):
 def _generate_gql_vertex(dynamo_record):
     excluded_entries = (
         'object_class', 'sid_value',
-        'internal_id', 'object_type', 'numeric_id_value')
-    vertex_dict = ExplosionJson.loads(rapidjson.dumps(dynamo_record))
+        'internal_id', 'object_type', 'numeric_id_value', PROPERTY_LOOKUPS)
+    vertex_dict = _convert_dynamo_record(dynamo_record)
     potential_vertex = {
         '__typename': 'Vertex',
         'internal_id': vertex_dict['internal_id'],
@@ -63,19 +81,64 @@ def _generate_gql_vertex(dynamo_record):
     return potential_vertex
 
 
+def _list_item_collection_metrics(item_collection_metrics) -> List[Dict]:
+    """a put returns the metrics of its one item collection, a transaction returns lists of them by table"""
+    if not item_collection_metrics:
+        return []
+    if 'SizeEstimateRangeGB' in item_collection_metrics:
+        return [item_collection_metrics]
+    return [y for x in item_collection_metrics.values() for y in x]
+
+
+def _calculate_backoff(base_backoff: float, attempt: int) -> float:
+    return random.uniform(0, base_backoff * 2 ** attempt)
+
+
+def _generate_request_id(typed_body: Dict) -> str:
+    return json.dumps(typed_body, sort_keys=True, default=str)
+
+
+def _estimate_request_units(request: Dict) -> int:
+    if 'PutRequest' in request:
+        return estimate_write_units(request['PutRequest']['Item'])
+    return 1
+
+
+def _put_page(pages: queue.Queue, page, stopped: threading.Event) -> bool:
+    while not stopped.is_set():
+        try:
+            pages.put(page, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
 class IndexManager:
     """Reads and writes values to the index
 
         the index manager interacts with the DynamoDB table to add and read indexed entries
     """
-    def __init__(self, table_name: str = None):
+    def __init__(self,
+                 table_name: str = None,
+                 property_lookups: bool = None,
+                 index_filter: IndexedKeyFilter = None,
+                 write_limiter: WriteCapacityLimiter = None):
         """
 
         Args:
             table_name:
+            property_lookups: write a lookup item for each local property of an indexed vertex, in the same
+                transaction as the vertex, so potential vertexes can be found with a query rather than a scan,
+                defaults to INDEX_PROPERTY_LOOKUPS or False
+            index_filter: a record of the objects known to be indexed, an object found there is reported as
+                already indexed without the conditional write
+            write_limiter: holds the writes of the manager to a budget of write units per second
         """
         if table_name is None:
             table_name = os.environ['INDEX_TABLE_NAME']
+        if property_lookups is None:
+            property_lookups = os.getenv('INDEX_PROPERTY_LOOKUPS', 'false').lower() == 'true'
         object_index = UniqueIndex.for_object_index()
         internal_id_index = UniqueIndex.for_internal_id_index()
         identifier_stem_index = UniqueIndex.for_identifier_stem_index()
@@ -84,8 +147,32 @@ class IndexManager:
         self._object_index = object_index
         self._internal_id_index = internal_id_index
         self._identifier_stem_index = identifier_stem_index
-        self._table = boto3.resource('dynamodb').Table(self._table_name)
         self._indexes = indexes
+        self._property_lookups = property_lookups
+        self._index_filter = index_filter
+        self._filter_counters = {'hits': 0, 'false_positives': 0}
+        self._counter_lock = threading.Lock()
+        self._write_limiter = write_limiter
+        self._capacity = CapacityAccount()
+
+    @property
+    def _table(self):
+        """the index table, resources are not thread-safe so each thread gets its own"""
+        return get_resource('dynamodb').Table(self._table_name)
+
+    @property
+    def filter_counters(self) -> Dict[str, int]:
+        """the writes the index filter skipped, and the bloom filter matches the table did not confirm"""
+        with self._counter_lock:
+            return dict(self._filter_counters)
+
+    @property
+    def capacity_report(self) -> Dict:
+        """the capacity consumed by the requests of the manager, in total and for each table and index"""
+        capacity_report = self._capacity.report()
+        if self._write_limiter is not None:
+            capacity_report['limiter_wait_seconds'] = self._write_limiter.waited
+        return capacity_report
 
     # @xray_recorder.capture()
     def index_object(self, scalar_object: Union[InputEdge, InputVertex]):
@@ -102,76 +189,276 @@ class IndexManager:
                 specified by the index
 
         """
-        for index in self._indexes:
-            if index.check_object_type(scalar_object.object_type):
-                missing_properties = index.check_for_missing_object_properties(scalar_object)
-                if missing_properties:
-                    raise MissingIndexedPropertyException(index.index_name, index.indexed_fields, missing_properties)
-        return self._index_object(scalar_object)
+        self._check_indexed_properties(scalar_object)
+        item = self._generate_index_item(scalar_object)
+        if self._check_index_filter(item):
+            raise self._generate_violation(item)
+        return self._put_index_item(item)
+
+    def index_objects(self, scalar_objects: List[Union[InputEdge, InputVertex]]) -> List[Optional[Exception]]:
+        """adds a group of objects to the index, writing up to 100 of them in each transaction
+
+            every object in a transaction carries the same uniqueness conditions as index_object, so a transaction
+            is cancelled if any one of its objects has already been indexed. the property lookups of an object are
+            written in the same transaction, and count towards its 100 items. the objects of a transaction which
+            fails are then written one at a time, in order, so each object gets its own outcome
+
+        Args:
+            scalar_objects: the objects to index
+
+        Returns:
+            one entry per object, None if it was indexed, otherwise the exception it raised
+        """
+        outcomes = [None for _ in scalar_objects]
+        pending = []
+        for pointer, scalar_object in enumerate(scalar_objects):
+            try:
+                self._check_indexed_properties(scalar_object)
+            except MissingIndexedPropertyException as e:
+                outcomes[pointer] = e
+                continue
+            item = self._generate_index_item(scalar_object)
+            if self._check_index_filter(item):
+                outcomes[pointer] = self._generate_violation(item)
+                continue
+            pending.append((pointer, scalar_object, item))
+        for chunk in self._chunk_transaction_items(pending):
+            if len(chunk) > 1 and self._transact_index_items([x[2] for x in chunk]):
+                self._remember_indexed([x[2] for x in chunk])
+                continue
+            for pointer, _, item in chunk:
+                try:
+                    self._put_index_item(item)
+                except Exception as e:
+                    outcomes[pointer] = e
+        return outcomes
 
     @xray_recorder.capture()
     def find_potential_vertexes(self,
                                 object_type: str,
-                                vertex_properties: List[ObjectProperty]) -> [Dict]:
+                                vertex_properties: List[ObjectProperty],
+                                scan: bool = True) -> [Dict]:
         """checks the index for objects that match on the given object type and vertex properties
 
+            by default the table is scanned. with scan set to False, the candidates are queried from the property
+            lookups written alongside each vertex instead, which only finds the vertexes indexed with
+            property_lookups on, so it is only safe once every vertex in the table has its lookups
+
         Args:
             object_type: the type of the object
             vertex_properties: a list containing the properties to check for in the index
+            scan: scan the whole table, rather than querying the property lookups
 
         Returns:
             a list of all the potential vertexes that were found in the index
 
         """
-        potential_vertexes = []
-        num_scanners = range(os.getenv('num_index_scanners', 10))
-        scanner_args = [
-            {'object_type': object_type,
-             'vertex_properties': vertex_properties,
-             'segment': x,
-             'total_segments': len(num_scanners)} for x in num_scanners]
-        scan_pool = ThreadPool(len(num_scanners))
-        scan_results = scan_pool.map(self._scan_vertexes, scanner_args)
-        scan_pool.close()
-        scan_pool.join()
-        logging.info('completed a scan of the data space to find potential vertexes with properties: %s '
-                     'returned the raw values of: %s' % (vertex_properties, potential_vertexes))
-        for entry in scan_results:
-            for vertex_data in entry:
-                potential_vertex = _generate_gql_vertex(vertex_data)
-                potential_vertexes.append(potential_vertex)
-        return potential_vertexes
+        return list(self.iter_potential_vertexes(object_type, vertex_properties, scan))
+
+    def iter_potential_vertexes(self,
+                                object_type: str,
+                                vertex_properties: List[ObjectProperty],
+                                scan: bool = True,
+                                limit: int = None) -> Iterator[Dict]:
+        """yields the potential vertexes for the given object type and vertex properties as the pages arrive
+
+            only a few pages are held at a time, and once limit vertexes have been yielded, or the generator is
+            closed, no further pages are read
+
+        Args:
+            object_type: the type of the object
+            vertex_properties: a list containing the properties to check for in the index
+            scan: scan the whole table, rather than querying the property lookups, see find_potential_vertexes
+            limit: the most potential vertexes to yield, all of them if None
+
+        Returns:
+            an iterator over the potential vertexes
+        """
+        if scan or not vertex_properties or any(generate_lookup_key(object_type, x) is None for x in vertex_properties):
+            pages = self._scan_pages(object_type, vertex_properties)
+        else:
+            pages = self._query_pages(object_type, vertex_properties)
+        num_found = 0
+        try:
+            for page in pages:
+                for vertex_data in page:
+                    yield _generate_gql_vertex(vertex_data)
+                    num_found += 1
+                    if limit is not None and num_found >= limit:
+                        return
+        finally:
+            pages.close()
+            logging.info(f'found {num_found} potential vertexes with properties: {vertex_properties}')
+
+    def _scan_pages(self, object_type: str, vertex_properties: List[ObjectProperty]) -> Iterator[List[Dict]]:
+        """runs a parallel scan of the index space, yielding each page of raw records as one of the scanners gets it"""
+        total_segments = int(os.getenv('num_index_scanners', 10))
+        pages = queue.Queue(maxsize=total_segments * 2)
+        stopped = threading.Event()
+        scan_args = {'object_type': object_type, 'vertex_properties': vertex_properties}
+        scanners = [
+            threading.Thread(
+                target=self._scan_vertexes,
+                args=({**scan_args, 'segment': x, 'total_segments': total_segments}, pages, stopped),
+                daemon=True
+            ) for x in range(total_segments)]
+        for scanner in scanners:
+            scanner.start()
+        running = total_segments
+        try:
+            while running:
+                page = pages.get()
+                if page is _SCAN_FINISHED:
+                    running -= 1
+                    continue
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            stopped.set()
+
+    def _query_pages(self, object_type: str, vertex_properties: List[ObjectProperty]) -> Iterator[List[Dict]]:
+        """queries the lookups of the first property, keeping the ones whose vertex holds every other property too
+
+            a lookup item carries only the key of its vertex and the lookup keys of all of its properties, the
+            records of the matching vertexes are then read with BatchGetItem
+
+        Returns:
+            an iterator over pages of the raw records of the matching vertexes and stub vertexes
+        """
+        partition_key_name = self._object_index.indexed_fields[0]
+        paginator = get_client('dynamodb').get_paginator('query')
+        for owner in (object_type, 'stub'):
+            lookup_keys = [generate_lookup_key(owner, x) for x in vertex_properties]
+            query_kwargs = {
+                'TableName': self._table_name,
+                'KeyConditionExpression': '#lookup = :lookup',
+                'ExpressionAttributeNames': {'#lookup': partition_key_name},
+                'ExpressionAttributeValues': {':lookup': {'S': lookup_keys[0]}},
+                'ReturnConsumedCapacity': 'INDEXES'
+            }
+            for page in self._track_pages(paginator.paginate(**query_kwargs)):
+                found_keys = []
+                for entry in page.get('Items', []):
+                    indexed_lookups = {x['S'] for x in entry.get(PROPERTY_LOOKUPS, {}).get('L', [])}
+                    if indexed_lookups.issuperset(lookup_keys):
+                        found_keys.append(_convert_dynamo_record(entry[INDEXED_OBJECT]['M']))
+                if found_keys:
+                    records, unread = self._batch_get_records(found_keys)
+                    if unread:
+                        logging.warning(f'could not read {len(unread)} potential vertexes, after retrying')
+                    yield records
 
     def get_object_key(self, internal_id: str):
         response = self._table.query(
             IndexName=self._internal_id_index.index_name,
-            KeyConditionExpression=Key('internal_id').eq(internal_id)
+            KeyConditionExpression=Key('internal_id').eq(internal_id),
+            ReturnConsumedCapacity='INDEXES'
         )
+        self._capacity.record_consumed(response.get('ConsumedCapacity'), 'read')
         if response['Count'] > 1:
             raise RuntimeError(f'internal_id value: {internal_id} has some how been indexed multiple times, '
                                f'big problem: {response["Items"]}')
         for entry in response['Items']:
             return {'identifier_stem': entry['identifier_stem'], 'sid_value': entry['sid_value']}
 
+    def get_object_keys(self, internal_ids: Iterable[str], max_workers: int = 10) -> Dict[str, Optional[Dict]]:
+        """looks up the keys of many objects, querying the internal_id index from up to max_workers threads
+
+        Returns:
+            the key of each object keyed by its internal_id, None for the objects which are not indexed
+
+        Raises:
+            RuntimeError: one of the internal_ids has been indexed more than once
+        """
+        internal_ids = list(dict.fromkeys(internal_ids))
+        if not internal_ids:
+            return {}
+        with ThreadPoolExecutor(min(max_workers, len(internal_ids))) as executor:
+            return dict(zip(internal_ids, executor.map(self.get_object_key, internal_ids)))
+
     @xray_recorder.capture()
-    def delete_object(self, internal_id: str):
-        existing_object_key = self.get_object_key(internal_id)
-        if existing_object_key:
-            self._table.delete_item(Key=existing_object_key)
+    def delete_objects(self, internal_ids: Iterable[str], max_workers: int = 10) -> Dict[str, Dict]:
+        """removes many objects from the index, along with their property lookups
 
-    def _index_object(self, scalar_object: Union[InputVertex, InputEdge]):
-        """Adds an object to the index per the schema
+            the keys are queried concurrently, as for get_object_keys, and the property lookups of the objects
+            are read with BatchGetItem. the lookups are deleted first, then the objects whose lookups are all
+            gone, with BatchWriteItem, 25 at a time, resending the unprocessed deletes with a growing backoff.
+            an object is only deleted once its lookups are, so one which is left can be deleted again later,
+            rather than leaving lookups behind which nothing refers to
 
         Args:
-            scalar_object:
+            internal_ids: the internal_ids of the objects to remove
+            max_workers: the most internal_id index queries to have running at once
 
-        Returns: None
+        Returns:
+            for each internal_id, whether it was found in the index, whether its lookups were deleted, whether it
+            was deleted, and the error when looking it up, reading its lookups or deleting it failed
+        """
+        internal_ids = list(dict.fromkeys(internal_ids))
+        results = {x: {'found': False, 'lookups_deleted': False, 'deleted': False} for x in internal_ids}
+        object_keys = {}
+        if internal_ids:
+            with ThreadPoolExecutor(min(max_workers, len(internal_ids))) as executor:
+                for internal_id, found in zip(internal_ids, executor.map(self._find_object_key, internal_ids)):
+                    object_key, error = found
+                    if error is not None:
+                        results[internal_id]['error'] = error
+                    elif object_key is not None:
+                        results[internal_id]['found'] = True
+                        object_keys[internal_id] = object_key
+        owners = {self._generate_filter_key(y): x for x, y in object_keys.items()}
+        lookup_items, unread = self._batch_get(list(object_keys.values()), PROPERTY_LOOKUPS)
+        for object_key, error in unread:
+            internal_id = owners[self._generate_filter_key(object_key)]
+            results[internal_id]['error'] = error or 'could not read its property lookups, after retrying'
+            del object_keys[internal_id]
+        lookup_requests = self._generate_lookup_requests(
+            [x for x in lookup_items if x.get('internal_id') in object_keys])
+        for internal_id in object_keys:
+            results[internal_id]['lookups_deleted'] = True
+        for request, error in self._batch_write(lookup_requests):
+            internal_id = request['DeleteRequest']['Key'][self._object_index.indexed_fields[1]]
+            results[internal_id]['lookups_deleted'] = False
+            results[internal_id]['error'] = error or 'could not delete its property lookups, after retrying'
+        object_keys = {x: y for x, y in object_keys.items() if results[x]['lookups_deleted']}
+        if self._index_filter is not None:
+            for object_key in object_keys.values():
+                self._index_filter.discard(self._generate_filter_key(object_key))
+        for internal_id in object_keys:
+            results[internal_id]['deleted'] = True
+        for request, error in self._batch_write([{'DeleteRequest': {'Key': x}} for x in object_keys.values()]):
+            internal_id = owners[self._generate_filter_key(request['DeleteRequest']['Key'])]
+            results[internal_id]['deleted'] = False
+            results[internal_id]['error'] = error or 'could not delete it, after retrying'
+        return results
 
-        Raises:
-            UniqueIndexViolationException: The object to be graphed is already in the index
+    @xray_recorder.capture()
+    def delete_object(self, internal_id: str):
+        existing_object_key = self.get_object_key(internal_id)
+        if existing_object_key:
+            if self._index_filter is not None:
+                self._index_filter.discard(self._generate_filter_key(existing_object_key))
+            response = self._write(
+                1, self._table.delete_item,
+                Key=existing_object_key, ReturnValues='ALL_OLD', ReturnConsumedCapacity='INDEXES')
+            self._delete_property_lookups([response.get('Attributes', {})])
+
+    def _find_object_key(self, internal_id: str):
+        try:
+            return self.get_object_key(internal_id), None
+        except Exception as e:
+            return None, str(e)
 
-        """
-        item = scalar_object.for_index
+    def _check_indexed_properties(self, scalar_object: Union[InputVertex, InputEdge]):
+        for index in self._indexes:
+            if index.check_object_type(scalar_object.object_type):
+                missing_properties = index.check_for_missing_object_properties(scalar_object)
+                if missing_properties:
+                    raise MissingIndexedPropertyException(index.index_name, index.indexed_fields, missing_properties)
+
+    def _generate_index_item(self, scalar_object: Union[InputVertex, InputEdge]) -> Dict:
+        item = scalar_object.copy_for_index()
         try:
             item.update({
                 'from_internal_id': scalar_object.source_vertex_internal_id,
@@ -180,30 +467,378 @@ class IndexManager:
             })
         except AttributeError:
             item['object_class'] = 'Vertex'
-        args = {
-            'Item': item,
-            'ReturnValues': 'ALL_OLD',
-            'ReturnConsumedCapacity': 'INDEXES',
-            'ReturnItemCollectionMetrics': 'SIZE'
+        if self._property_lookups:
+            lookup_keys = generate_lookup_keys(scalar_object)
+            if lookup_keys:
+                item[PROPERTY_LOOKUPS] = lookup_keys
+        return item
+
+    def _generate_lookup_items(self, item: Dict) -> List[Dict]:
+        """the lookup item for each of the lookup keys of an index item
+
+            the lookup item is keyed by the lookup key and the internal_id of the indexed object, and carries only
+            the key of the indexed object and the lookup keys of all of its properties, so a query on one lookup key
+            can be narrowed down to the vertexes matching every property before any of them are read
+        """
+        partition_key_name, hash_key_name = self._object_index.indexed_fields
+        object_key = {x: item[x] for x in self._object_index.indexed_fields}
+        return [{
+            partition_key_name: x,
+            hash_key_name: item['internal_id'],
+            PROPERTY_LOOKUPS: item[PROPERTY_LOOKUPS],
+            INDEXED_OBJECT: object_key
+        } for x in item.get(PROPERTY_LOOKUPS, [])]
+
+    def _split_lookup_items(self, item: Dict) -> Tuple[List[Dict], List[Dict]]:
+        """the lookup items which fit in the transaction of their object, and those left over for after it"""
+        lookup_items = self._generate_lookup_items(item)
+        return lookup_items[:_MAX_TRANSACTION_ITEMS - 1], lookup_items[_MAX_TRANSACTION_ITEMS - 1:]
+
+    def _delete_property_lookups(self, items: List[Dict]):
+        unprocessed = self._batch_write(self._generate_lookup_requests(items))
+        if unprocessed:
+            logging.warning(f'could not delete {len(unprocessed)} property lookups, after retrying')
+
+    def _generate_lookup_requests(self, items: List[Dict]) -> List[Dict]:
+        """the delete requests for the lookup items of each of the index items"""
+        partition_key_name, hash_key_name = self._object_index.indexed_fields
+        requests = []
+        for item in items:
+            for lookup_key in item.get(PROPERTY_LOOKUPS, []):
+                lookup_item = {partition_key_name: lookup_key, hash_key_name: item['internal_id']}
+                requests.append({'DeleteRequest': {'Key': lookup_item}})
+        return requests
+
+    def _batch_write(self, requests: List[Dict]) -> List[Tuple[Dict, Optional[str]]]:
+        """sends put and delete requests with BatchWriteItem, 25 at a time
+
+            the requests DynamoDB leaves unprocessed, and those of a batch which is throttled outright, are resent
+            with a growing, jittered backoff, up to INDEX_BATCH_RETRIES times. a batch which fails in any other
+            way is given up on, without stopping the batches after it
 
-        }
+        Returns:
+            each request which was not written, with the error of its batch, or None if it was still unprocessed
+            once the retries ran out
+        """
+        serializer = TypeSerializer()
+        max_retries = int(os.getenv('INDEX_BATCH_RETRIES', 5))
+        base_backoff = float(os.getenv('INDEX_BATCH_BACKOFF', 0.05))
+        unprocessed = []
+        for pointer in range(0, len(requests), _MAX_BATCH_WRITE_ITEMS):
+            pending = {}
+            for request in requests[pointer:pointer + _MAX_BATCH_WRITE_ITEMS]:
+                request_type, request_body = next(iter(request.items()))
+                typed_body = {x: {y: serializer.serialize(z) for y, z in v.items()} for x, v in request_body.items()}
+                pending[_generate_request_id(typed_body)] = (request, {request_type: typed_body})
+            error = None
+            for attempt in range(max_retries + 1):
+                if attempt:
+                    time.sleep(_calculate_backoff(base_backoff, attempt - 1))
+                try:
+                    response = self._write(
+                        sum(_estimate_request_units(x[0]) for x in pending.values()),
+                        get_client('dynamodb').batch_write_item,
+                        RequestItems={self._table_name: [x[1] for x in pending.values()]},
+                        ReturnConsumedCapacity='INDEXES',
+                        ReturnItemCollectionMetrics='SIZE'
+                    )
+                except ClientError as e:
+                    if e.response['Error']['Code'] in THROTTLE_CODES:
+                        continue
+                    error = str(e)
+                    break
+                except Exception as e:
+                    error = str(e)
+                    break
+                returned = response.get('UnprocessedItems', {}).get(self._table_name, [])
+                self._capacity.record_throttle(len(returned))
+                returned_ids = {_generate_request_id(next(iter(x.values()))) for x in returned}
+                pending = {x: y for x, y in pending.items() if x in returned_ids}
+                if not pending:
+                    break
+            if error is not None:
+                logging.warning(f'could not write a batch of {len(pending)} index requests: {error}')
+            unprocessed.extend((x[0], error) for x in pending.values())
+        return unprocessed
+
+    def _batch_get(self,
+                   keys: List[Dict],
+                   projected_attribute: str) -> Tuple[List[Dict], List[Tuple[Dict, Optional[str]]]]:
+        """reads the projected attribute and the internal_id of each key with BatchGetItem, 100 at a time"""
+        records, unread = self._batch_get_records(keys, projected_attribute)
+        return [_convert_dynamo_record(x) for x in records], unread
+
+    def _batch_get_records(self,
+                           keys: List[Dict],
+                           projected_attribute: str = None) -> Tuple[List[Dict], List[Tuple[Dict, Optional[str]]]]:
+        """reads the raw record of each key with BatchGetItem, 100 at a time, resending the unprocessed keys
+
+            a key with no item in the index is neither read nor unread, it is simply not there. a batch which
+            fails is given up on, without stopping the batches after it
+
+        Args:
+            keys: the keys of the index items to read
+            projected_attribute: read only this attribute and the internal_id, rather than the whole item
+
+        Returns:
+            the raw records which were read, and each key which was not, with the error of its batch, or None if
+            it was still unprocessed once the retries ran out
+        """
+        serializer = TypeSerializer()
+        max_retries = int(os.getenv('INDEX_BATCH_RETRIES', 5))
+        base_backoff = float(os.getenv('INDEX_BATCH_BACKOFF', 0.05))
+        items, unread = [], []
+        for pointer in range(0, len(keys), _MAX_BATCH_GET_ITEMS):
+            chunk = keys[pointer:pointer + _MAX_BATCH_GET_ITEMS]
+            pending = [{x: serializer.serialize(y) for x, y in z.items()} for z in chunk]
+            error = None
+            for attempt in range(max_retries + 1):
+                if attempt:
+                    time.sleep(_calculate_backoff(base_backoff, attempt - 1))
+                request = {'Keys': pending}
+                if projected_attribute is not None:
+                    request.update({
+                        'ProjectionExpression': '#internal_id, #projected',
+                        'ExpressionAttributeNames': {'#internal_id': 'internal_id', '#projected': projected_attribute}
+                    })
+                try:
+                    response = get_client('dynamodb').batch_get_item(
+                        RequestItems={self._table_name: request}, ReturnConsumedCapacity='INDEXES')
+                except ClientError as e:
+                    if e.response['Error']['Code'] in THROTTLE_CODES:
+                        self._capacity.record_throttle()
+                        continue
+                    error = str(e)
+                    break
+                except Exception as e:
+                    error = str(e)
+                    break
+                self._capacity.record_consumed(response.get('ConsumedCapacity'), 'read')
+                items.extend(response.get('Responses', {}).get(self._table_name, []))
+                pending = response.get('UnprocessedKeys', {}).get(self._table_name, {}).get('Keys', [])
+                if not pending:
+                    break
+            if pending:
+                logging.warning(f'could not read {len(pending)} index items: {error or "unprocessed after retrying"}')
+            unread.extend((_convert_dynamo_record(x), error) for x in pending)
+        return items, unread
+
+    def _generate_filter_key(self, item: Dict) -> str:
+        return '\t'.join(str(item[x]) for x in self._object_index.indexed_fields)
+
+    def _check_index_filter(self, item: Dict) -> bool:
+        """whether the item is known to be indexed already, a bloom filter match is confirmed with a read"""
+        if self._index_filter is None:
+            return False
+        filter_key = self._generate_filter_key(item)
+        is_indexed = self._index_filter.check(filter_key, str(item['internal_id']))
+        if is_indexed is None:
+            item_key = {x: item[x] for x in self._object_index.indexed_fields}
+            response = self._table.get_item(
+                Key=item_key, ProjectionExpression='internal_id', ReturnConsumedCapacity='INDEXES')
+            self._capacity.record_consumed(response.get('ConsumedCapacity'), 'read')
+            is_indexed = 'Item' in response
+            if is_indexed:
+                self._index_filter.add([filter_key])
+            else:
+                self._count_filter('false_positives')
+        if is_indexed:
+            self._count_filter('hits')
+        return is_indexed
+
+    def _generate_unique_condition(self):
         condition_expressions = set()
         unique_index_names = []
         for index in self._indexes:
             if index.is_unique:
                 condition_expressions.update(index.conditional_statement)
                 unique_index_names.append(index.index_name)
-        if condition_expressions:
-            args['ConditionExpression'] = ' AND '.join(condition_expressions)
+        return ' AND '.join(sorted(condition_expressions)), unique_index_names
+
+    def _chunk_transaction_items(self, pending: List) -> List[List]:
+        """splits the items into transactions
+
+            a transaction holds at most 100 writes, counting the lookup items written with each object, and may
+            only write to a given key once
+        """
+        key_names = self._object_index.indexed_fields
+        chunks, chunk, chunk_keys = [], [], set()
+        for entry in pending:
+            written_items = [entry[2], *self._split_lookup_items(entry[2])[0]]
+            item_keys = {tuple(str(x.get(y)) for y in key_names) for x in written_items}
+            if chunk and (len(chunk_keys) + len(item_keys) > _MAX_TRANSACTION_ITEMS or item_keys & chunk_keys):
+                chunks.append(chunk)
+                chunk, chunk_keys = [], set()
+            chunk.append(entry)
+            chunk_keys.update(item_keys)
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _transact_index_items(self, items: List[Dict]) -> bool:
+        """writes the items in a single transaction
+
+        Returns:
+            True if every item was written, False if the transaction was cancelled or otherwise failed,
+            in which case none of them were
+        """
+        try:
+            self._write_transaction(items)
+            return True
+        except ClientError as e:
+            logging.info(f'transaction of {len(items)} index items failed, writing them one at a time: '
+                         f'{e.response["Error"]["Code"]}')
+            return False
+
+    def _write_transaction(self, items: List[Dict]) -> Dict:
+        """writes the items, and the lookup items of each, with TransactWriteItems
+
+            each item is put under the uniqueness conditions, its lookup items are put unconditionally alongside it,
+            so an object is never left without its lookups, nor a lookup without its object. only the first 99
+            lookup items of an object fit in with it, see _put_index_item_with_lookups for the rest
+        """
+        condition_expression, _ = self._generate_unique_condition()
+        puts = []
+        for item in items:
+            puts.append((item, condition_expression))
+            puts.extend((x, None) for x in self._split_lookup_items(item)[0])
+        return self._transact_puts(puts)
+
+    def _transact_puts(self, puts: List[Tuple[Dict, Optional[str]]]) -> Dict:
+        """puts each item, under its condition expression if it has one, in a single TransactWriteItems"""
+        serializer = TypeSerializer()
+        transact_items = []
+        for item, condition_expression in puts:
+            put = {
+                'TableName': self._table_name,
+                'Item': {x: serializer.serialize(y) for x, y in item.items()}
+            }
+            if condition_expression:
+                put['ConditionExpression'] = condition_expression
+            transact_items.append({'Put': put})
+        estimated_units = 2 * sum(estimate_write_units(x[0]) for x in puts)
         try:
-            results = self._table.put_item(**args)
+            return self._write(
+                estimated_units, get_client('dynamodb').transact_write_items,
+                TransactItems=transact_items,
+                ReturnConsumedCapacity='INDEXES',
+                ReturnItemCollectionMetrics='SIZE'
+            )
+        except ClientError as e:
+            cancellation_reasons = e.response.get('CancellationReasons', [])
+            self._capacity.record_throttle(len([x for x in cancellation_reasons if x.get('Code') == 'ThrottlingError']))
+            raise e
+
+    def _put_index_item(self, item: Dict):
+        """Adds an object to the index per the schema
+
+        Args:
+            item: the index item of the object, as generated by _generate_index_item
+
+        Returns: None
+
+        Raises:
+            UniqueIndexViolationException: The object to be graphed is already in the index
+
+        """
+        if item.get(PROPERTY_LOOKUPS):
+            return self._put_index_item_with_lookups(item)
+        args = {
+            'Item': item,
+            'ReturnValues': 'ALL_OLD',
+            'ReturnConsumedCapacity': 'INDEXES',
+            'ReturnItemCollectionMetrics': 'SIZE'
+
+        }
+        condition_expression, _ = self._generate_unique_condition()
+        if condition_expression:
+            args['ConditionExpression'] = condition_expression
+        try:
+            results = self._write(estimate_write_units(item), self._table.put_item, **args)
+            self._remember_indexed([item])
             return results
         except ClientError as e:
             if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
                 raise e
-            raise UniqueIndexViolationException(', '.join(unique_index_names), item)
+            self._remember_indexed([item])
+            raise self._generate_violation(item)
 
-    def _scan_vertexes(self, scan_args: Dict) -> List[Dict]:
+    def _put_index_item_with_lookups(self, item: Dict):
+        """adds an object and its lookup items to the index in a single transaction
+
+            the transaction is cancelled with a ConditionalCheckFailed reason for the object, its first item,
+            when the object is already in the index. the lookup items of an object with more than 99 of them are
+            written in further transactions once the object is in, and should one of those fail, the object and
+            its lookups are taken out again before the error is raised, so it is never left in the index with
+            lookups missing, and can be indexed again later
+        """
+        _, remaining_lookups = self._split_lookup_items(item)
+        try:
+            results = self._write_transaction([item])
+        except ClientError as e:
+            cancellation_reasons = e.response.get('CancellationReasons') or [{}]
+            if e.response['Error']['Code'] != 'TransactionCanceledException' \
+                    or cancellation_reasons[0].get('Code') != 'ConditionalCheckFailed':
+                raise e
+            self._remember_indexed([item])
+            raise self._generate_violation(item)
+        try:
+            for pointer in range(0, len(remaining_lookups), _MAX_TRANSACTION_ITEMS):
+                self._transact_puts([(x, None) for x in remaining_lookups[pointer:pointer + _MAX_TRANSACTION_ITEMS]])
+        except Exception as e:
+            self._remove_index_item(item)
+            raise e
+        self._remember_indexed([item])
+        return results
+
+    def _remove_index_item(self, item: Dict):
+        """takes an object which was only partly indexed back out of the index, its lookup items first"""
+        object_key = {x: item[x] for x in self._object_index.indexed_fields}
+        requests = self._generate_lookup_requests([item]) + [{'DeleteRequest': {'Key': object_key}}]
+        unprocessed = self._batch_write(requests)
+        if unprocessed:
+            logging.warning(f'could not take {len(unprocessed)} items of {item["internal_id"]} back out of the index, '
+                            f'after retrying')
+
+    def _write(self, estimated_units: float, write_function, **kwargs) -> Dict:
+        """makes a write request within the budget of the write limiter, and records what it consumed
+
+            a write which fails is taken to have consumed its estimate, a conditional write which fails its
+            condition is still charged for by the table
+        """
+        if self._write_limiter is not None:
+            self._write_limiter.acquire(estimated_units)
+        try:
+            response = write_function(**kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] in THROTTLE_CODES:
+                self._capacity.record_throttle()
+            raise e
+        self._capacity.record_consumed(response.get('ConsumedCapacity'), 'write')
+        self._capacity.record_item_collections(_list_item_collection_metrics(response.get('ItemCollectionMetrics')))
+        if self._write_limiter is not None:
+            consumed_units = total_units(response.get('ConsumedCapacity'), 'write') or estimated_units
+            self._write_limiter.settle(estimated_units, consumed_units)
+        return response
+
+    def _track_pages(self, pages: Iterator[Dict]) -> Iterator[Dict]:
+        for page in pages:
+            self._capacity.record_consumed(page.get('ConsumedCapacity'), 'read')
+            yield page
+
+    def _generate_violation(self, item: Dict) -> UniqueIndexViolationException:
+        _, unique_index_names = self._generate_unique_condition()
+        return UniqueIndexViolationException(', '.join(unique_index_names), item)
+
+    def _remember_indexed(self, items: List[Dict]):
+        if self._index_filter is not None:
+            self._index_filter.add(self._generate_filter_key(x) for x in items)
+
+    def _count_filter(self, counter_name: str):
+        with self._counter_lock:
+            self._filter_counters[counter_name] += 1
+
+    def _scan_vertexes(self, scan_args: Dict, pages: queue.Queue, stopped: threading.Event):
         """conducts a single paginated scan of the index space
 
         Args:
@@ -212,14 +847,12 @@ class IndexManager:
                 vertex_properties: a list containing the vertex properties to check for
                 segment: the assigned segment for the scanner
                 total_segments: the total number of scanners running
-
-        Returns:
-            a list of the items found in the index for the assigned segment
+            pages: each page of items found in the assigned segment is put here, followed by _SCAN_FINISHED
+            stopped: set once the pages are no longer wanted, the scanner gives up at its next page
         """
-        found_vertexes = []
         object_type, vertex_properties = scan_args['object_type'], scan_args['vertex_properties']
         segment, total_segments = scan_args['segment'], scan_args['total_segments']
-        paginator = boto3.client('dynamodb').get_paginator('scan')
+        paginator = get_client('dynamodb').get_paginator('scan')
         filter_properties = [f'(object_type = :ot OR begins_with(identifier_stem, :stub))']
         expression_names = {}
         expression_values = {
@@ -244,12 +877,17 @@ class IndexManager:
         scan_kwargs = {
             'TableName': self._table_name,
             'FilterExpression': ' AND '.join(filter_properties),
-            'ExpressionAttributeNames': expression_names,
             'ExpressionAttributeValues': expression_values,
             'Segment': segment,
-            'TotalSegments': total_segments
+            'TotalSegments': total_segments,
+            'ReturnConsumedCapacity': 'INDEXES'
         }
-        iterator = paginator.paginate(**scan_kwargs)
-        for entry in iterator:
-            found_vertexes.extend(entry.get('Items', []))
-        return found_vertexes
+        if expression_names:
+            scan_kwargs['ExpressionAttributeNames'] = expression_names
+        try:
+            for entry in self._track_pages(paginator.paginate(**scan_kwargs)):
+                if not _put_page(pages, entry.get('Items', []), stopped):
+                    return
+        except Exception as e:
+            _put_page(pages, e, stopped)
+        _put_page(pages, _SCAN_FINISHED, stopped)
@@ -0,0 +1,54 @@
+import hashlib
+import json
+from typing import List, Optional, Union
+
+from toll_booth.obj.scalars.object_properties import ObjectProperty, LocalPropertyValue
+from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
+
+LOOKUP_PREFIX = '#lookup#'
+STUB_IDENTIFIER_PREFIX = '#vertex#stub#'
+PROPERTY_LOOKUPS = 'property_lookups'
+INDEXED_OBJECT = 'indexed_object'
+
+
+def is_stub(identifier_stem: str) -> bool:
+    return str(identifier_stem).startswith(STUB_IDENTIFIER_PREFIX)
+
+
+def generate_lookup_key(owner: str, object_property: ObjectProperty) -> Optional[str]:
+    """the partition key under which the vertexes of a type with the given property value can be queried
+
+        only local values can be matched, so sensitive and stored properties have no lookup key. stub vertexes are
+        looked up under the owner stub, whatever their type, as they are a potential match for a vertex of any type
+
+    Args:
+        owner: the object_type of the vertex, or stub for a stub vertex
+        object_property: the property to be matched on
+
+    Returns:
+        the lookup key, None if the property can not be looked up
+    """
+    property_value = object_property.property_value
+    if not isinstance(property_value, LocalPropertyValue):
+        return None
+    content = json.dumps(
+        [object_property.property_name, property_value.data_type, str(property_value.search_property_value)])
+    return f'{LOOKUP_PREFIX}{owner}#{hashlib.sha1(content.encode("utf-8")).hexdigest()}'
+
+
+def generate_lookup_keys(scalar_object: Union[InputVertex, InputEdge]) -> List[str]:
+    """the lookup keys of every local property of a vertex, edges are not looked up and get none"""
+    if not isinstance(scalar_object, InputVertex):
+        return []
+    owner = scalar_object.object_type
+    if is_stub(scalar_object.identifier_stem.property_value.property_value):
+        owner = 'stub'
+    lookup_keys, property_names = [], set()
+    for object_property in [scalar_object.id_value] + scalar_object.object_properties:
+        if object_property.property_name in property_names:
+            continue
+        property_names.add(object_property.property_name)
+        lookup_key = generate_lookup_key(owner, object_property)
+        if lookup_key is not None:
+            lookup_keys.append(lookup_key)
+    return lookup_keys
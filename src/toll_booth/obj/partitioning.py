@@ -0,0 +1,49 @@
+import zlib
+from collections import Counter
+from typing import Any, List, Optional
+
+from toll_booth.obj.scalars.inputs import InputEdge
+
+
+def _get_internal_id(object_data: Any) -> Optional[str]:
+    if isinstance(object_data, dict):
+        return object_data.get('internal_id')
+    return None
+
+
+def _find_endpoint_ids(item: Any) -> List[str]:
+    if isinstance(item, tuple):
+        scalar_class, object_data = item
+        if scalar_class is InputEdge:
+            endpoint_ids = [object_data.get('source_vertex_internal_id'), object_data.get('target_vertex_internal_id')]
+        else:
+            endpoint_ids = [object_data.get('internal_id')]
+    elif isinstance(item, dict):
+        endpoint_ids = [_get_internal_id(item.get('source_vertex')), _get_internal_id(item.get('other_vertex'))]
+    else:
+        endpoint_ids = []
+    return [x for x in endpoint_ids if x is not None]
+
+
+def find_partition_keys(items: List[Any]) -> List[Optional[str]]:
+    """picks the vertex which owns each item, so that items which write to the same vertex can be kept apart
+
+        an item is owned by whichever of its vertexes is referenced by the most items in the batch, ties going to the
+        lowest internal_id, so the pushes which pile onto a hub vertex all share the hub as their key
+
+    Args:
+        items: leech results, or the (scalar class, arguments) pairs of a PushPlan
+
+    Returns:
+        the internal_id of the owning vertex for each item, None for items with no vertex to go by
+    """
+    endpoint_ids = [_find_endpoint_ids(x) for x in items]
+    references = Counter(x for item_ids in endpoint_ids for x in set(item_ids))
+    return [min(x, key=lambda y: (-references[y], y)) if x else None for x in endpoint_ids]
+
+
+def assign_partition(partition_key: Optional[str], position: int, num_partitions: int) -> int:
+    """the partition for an item, stable for a given key, items without a key are dealt out by position"""
+    if partition_key is None:
+        return position % num_partitions
+    return zlib.crc32(partition_key.encode('utf-8')) % num_partitions
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-import boto3
+from toll_booth.obj.clients import get_resource
 
 
 class Overseer:
@@ -19,9 +19,7 @@ class Overseer:
     def mark_stage_completed(self, stage_name, stage_results=None):
         if not stage_results:
             stage_results = {}
-        session = boto3.session.Session()
-        dynamo = session.resource('dynamodb')
-        table = dynamo.Table(self._table_name)
+        table = get_resource('dynamodb').Table(self._table_name)
         update_entry = {
             'completed_at': datetime.now().isoformat(),
             'stage_results': stage_results
@@ -1,7 +1,29 @@
 from decimal import Decimal
-from typing import List
+from types import MappingProxyType
+from typing import List, Dict, Mapping, Any
+
+import rapidjson
 
 from toll_booth.obj.scalars.object_properties import ObjectProperty
+from toll_booth.obj.serializers import FireHoseEncoder
+
+
+def _freeze(value):
+    """a read-only copy of the value, all the way down, mappings become MappingProxyType and lists become tuples"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({x: _freeze(y) for x, y in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(x) for x in value)
+    return value
+
+
+def _thaw(value):
+    """a plain copy of a value made by _freeze, all the way down, mappings become dicts and tuples become lists"""
+    if isinstance(value, Mapping):
+        return {x: _thaw(y) for x, y in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_thaw(x) for x in value]
+    return value
 
 
 class GraphScalar:
@@ -18,6 +40,8 @@ class GraphScalar:
         self._id_value = id_value
         self._identifier_stem = identifier_stem
         self._object_properties = object_properties
+        self._index_value = None
+        self._index_json = None
 
     @property
     def internal_id(self) -> str:
@@ -64,5 +88,28 @@ class GraphScalar:
         raise NotImplementedError()
 
     @property
-    def for_index(self):
+    def for_index(self) -> Mapping[str, Any]:
+        """the object as it is written to the index
+
+            it is built on first use and then shared by everything which reads it, so it is frozen all the way
+            down, the mappings inside it are read-only too and its lists are tuples. use copy_for_index to get a
+            copy which can be changed
+        """
+        if self._index_value is None:
+            self._index_value = _freeze(self._generate_for_index())
+        return self._index_value
+
+    def copy_for_index(self) -> Dict[str, Any]:
+        """a copy of for_index made of plain dicts and lists, which is the caller's own to change"""
+        return _thaw(self.for_index)
+
+    @property
+    def for_index_json(self) -> bytes:
+        """for_index serialized as JSON, built on first use"""
+        if self._index_json is None:
+            index_json = rapidjson.dumps(self.copy_for_index(), default=FireHoseEncoder.default)
+            self._index_json = index_json.encode('utf-8')
+        return self._index_json
+
+    def _generate_for_index(self) -> Dict[str, Any]:
         raise NotImplementedError()
@@ -55,8 +55,7 @@ class InputVertex(AlgObject, GraphScalar):
     def object_class(self):
         return 'Vertex'
 
-    @property
-    def for_index(self):
+    def _generate_for_index(self):
         index_value = self._for_index
         if self.numeric_id_value:
             index_value['numeric_id_value'] = self.numeric_id_value
@@ -121,8 +120,7 @@ class InputEdge(AlgObject, GraphScalar):
     def object_class(self):
         return 'Edge'
 
-    @property
-    def for_index(self):
+    def _generate_for_index(self):
         index_value = self._for_index
         index_value.update({
             'from_internal_id': self._source_vertex_internal_id,
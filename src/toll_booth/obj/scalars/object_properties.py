@@ -4,11 +4,11 @@ from datetime import timezone, datetime
 from decimal import Decimal
 from typing import Dict, Union
 
-import boto3
 import dateutil
 from algernon import AlgObject
 from botocore.exceptions import ClientError
 
+from toll_booth.obj.clients import get_resource
 from toll_booth.obj.troubles import SensitiveValueAlreadyStored
 
 
@@ -215,8 +215,7 @@ def _update_sensitive_data(source_internal_id: str,
         import os
         sensitive_table_name = os.environ['SENSITIVES_TABLE_NAME']
     logging.debug(f'starting an update_sensitive_data function: {source_internal_id}, {property_name}')
-    resource = boto3.resource('dynamodb')
-    table = resource.Table(sensitive_table_name)
+    table = get_resource('dynamodb').Table(sensitive_table_name)
     logging.debug(f'starting to create the sensitive pointer: {source_internal_id}, {property_name}')
     insensitive_value = _create_sensitive_pointer(property_name, source_internal_id)
     logging.debug(f'created the sensitive pointer: {source_internal_id}, {property_name}, {insensitive_value}')
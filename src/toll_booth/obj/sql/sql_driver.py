@@ -1,6 +1,6 @@
-from algernon.aws import Opossum
 from mysql import connector
 
+from toll_booth.obj.credentials import get_secrets
 from toll_booth.obj.scalars.inputs import InputVertex
 
 
@@ -16,7 +16,7 @@ class SqlDriver:
 
     @classmethod
     def generate(cls, sql_host, sql_port, db_name):
-        credentials = Opossum.get_secrets('rds')
+        credentials = get_secrets('rds')
         return cls(sql_host, sql_port, db_name, credentials['username'], credentials['password'])
 
     def __enter__(self):
@@ -1,6 +1,8 @@
 from toll_booth.tasks.rds_pusher import rds_handler
-from toll_booth.tasks.graph_pusher import graph_handler
-from toll_booth.tasks.index_pusher import index_handler
+from toll_booth.tasks.graph_pusher import graph_handler, graph_session, graph_handler_async, graph_async_session, \
+    graph_requires_endpoints
+from toll_booth.tasks.index_pusher import index_handler, index_handler_async, index_session, index_async_session
 from toll_booth.tasks.redshift_pusher import redshift_handler
-from toll_booth.tasks.s3_pusher import s3_handler
-from toll_booth.tasks.event_pusher import event_handler
+from toll_booth.tasks.s3_pusher import s3_handler, s3_handler_async
+from toll_booth.tasks.event_pusher import event_handler, event_handler_async
+from toll_booth.tasks.graph_bulk_pusher import graph_bulk_handler, graph_bulk_session, graph_bulk_async_session
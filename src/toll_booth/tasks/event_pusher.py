@@ -1,9 +1,8 @@
+import asyncio
 import logging
-import boto3
-import rapidjson
 
-from toll_booth.obj.scalars.inputs import InputVertex
-from toll_booth.obj.serializers import FireHoseEncoder
+from toll_booth.obj.clients import get_client
+from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
 
 
 def _generate_new_object_event(new_object, is_edge=False):
@@ -13,23 +12,39 @@ def _generate_new_object_event(new_object, is_edge=False):
     event_entry = {
         'Source': 'algernon',
         'DetailType': detail_type,
-        'Detail': rapidjson.dumps(new_object.for_index, default=FireHoseEncoder.default),
+        'Detail': new_object.for_index_json.decode('utf-8'),
         'Resources': []
     }
     logging.debug(f'generated event for {new_object}: {event_entry}')
     return event_entry
 
 
-def event_handler(source_vertex: InputVertex, **kwargs):
-    logging.info(f'received a call to the event_handler: {source_vertex}, {kwargs}')
-    session = boto3.session.Session()
-    event_client = session.client('events')
-    entries = [_generate_new_object_event(source_vertex)]
+def _generate_entries(source_vertex: InputVertex, kwargs):
+    entries = [_generate_new_object_event(source_vertex, is_edge=isinstance(source_vertex, InputEdge))]
     if kwargs.get('edge'):
         entries.append(_generate_new_object_event(kwargs['edge'], is_edge=True))
     if kwargs.get('target_vertex'):
         entries.append(_generate_new_object_event(kwargs['target_vertex']))
-    response = event_client.put_events(Entries=entries)
+    return entries
+
+
+def _check_response(response):
     failed = [x for x in response['Entries'] if 'ErrorCode' in x]
     if failed:
         raise RuntimeError(f'failed to publish some events to AWS: {failed}')
+
+
+def event_handler(source_vertex: InputVertex, **kwargs):
+    logging.info(f'received a call to the event_handler: {source_vertex}, {kwargs}')
+    event_client = get_client('events')
+    response = event_client.put_events(Entries=_generate_entries(source_vertex, kwargs))
+    _check_response(response)
+
+
+async def event_handler_async(source_vertex: InputVertex, **kwargs):
+    logging.info(f'received a call to the event_handler_async: {source_vertex}, {kwargs}')
+    event_client = get_client('events')
+    entries = _generate_entries(source_vertex, kwargs)
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(None, lambda: event_client.put_events(Entries=entries))
+    _check_response(response)
@@ -0,0 +1,72 @@
+import logging
+import os
+from contextlib import contextmanager, asynccontextmanager
+
+from toll_booth.obj.graph.bulk_load import BulkLoadWriter
+
+
+def _build_bulk_writer(**kwargs) -> BulkLoadWriter:
+    destination = kwargs.get('bulk_destination', os.getenv('GRAPH_BULK_DESTINATION'))
+    if not destination:
+        raise RuntimeError('a graph_bulk push needs a bulk_destination, either in push_kwargs or the environment')
+    chunk_size = int(kwargs.get('bulk_chunk_size', os.getenv('GRAPH_BULK_CHUNK_SIZE', 10000)))
+    return BulkLoadWriter(destination, chunk_size, kwargs.get('bulk_export_id'))
+
+
+@contextmanager
+def graph_bulk_session(num_workers: int, **kwargs):
+    """shares a single BulkLoadWriter between every graph_bulk_handler call made inside the block
+
+    Args:
+        num_workers: the number of threads which will push through the session
+        **kwargs: the push_kwargs of the event, bulk_destination is the local directory or s3://bucket/prefix
+            to write to, bulk_chunk_size the most rows in a file and bulk_export_id names the files of the export
+
+    Yields:
+        the extra kwargs to pass along to each graph_bulk_handler call
+    """
+    with _build_bulk_writer(**kwargs) as bulk_writer:
+        yield {'bulk_writer': bulk_writer}
+
+
+@asynccontextmanager
+async def graph_bulk_async_session(max_in_flight: int, **kwargs):
+    with graph_bulk_session(max_in_flight, **kwargs) as session_kwargs:
+        yield session_kwargs
+
+
+def _write_object(bulk_writer: BulkLoadWriter, scalar):
+    try:
+        kind, label = bulk_writer.write(scalar)
+        return {
+            'status': 'succeeded',
+            'operation': 'bulk_load_object',
+            'details': {
+                'message': '',
+                'export_id': bulk_writer.export_id,
+                'kind': kind,
+                'label': label
+            }
+        }
+    except Exception as e:
+        return {
+            'status': 'failed',
+            'operation': 'bulk_load_object',
+            'details': {
+                'message': e.args
+            }
+        }
+
+
+def graph_bulk_handler(source_vertex, **kwargs):
+    logging.info(f'received a call to the graph_bulk_handler: {source_vertex}, {kwargs}')
+    bulk_writer = kwargs.get('bulk_writer')
+    if bulk_writer is None:
+        with _build_bulk_writer(**kwargs) as bulk_writer:
+            return graph_bulk_handler(source_vertex, **{**kwargs, 'bulk_writer': bulk_writer})
+    pushed = [('source_vertex', source_vertex)]
+    if kwargs.get('target_vertex'):
+        pushed.append(('target_vertex', kwargs['target_vertex']))
+    if kwargs.get('edge'):
+        pushed.append(('edge', kwargs['edge']))
+    return {x[0]: _write_object(bulk_writer, x[1]) for x in pushed}
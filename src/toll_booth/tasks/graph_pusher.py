@@ -1,18 +1,101 @@
 import logging
+from contextlib import contextmanager, asynccontextmanager
+
+import aiohttp
 
 from toll_booth.obj.graph.ogm import Ogm
+from toll_booth.obj.graph.trident_driver import TridentDriver
+from toll_booth.obj.graph.vertex_cache import get_vertex_cache
+
+graph_requires_endpoints = True
+
+
+def _build_ogm(trident_driver=None, write_buffer=None, http_session=None, **kwargs) -> Ogm:
+    vertex_cache = None
+    if kwargs.get('vertex_cache', False):
+        vertex_cache = get_vertex_cache()
+    return Ogm(
+        trident_driver, write_buffer, kwargs.get('parameterized', False), http_session,
+        vertex_cache, kwargs.get('probe_vertexes', True), kwargs.get('lean_writes', False),
+        kwargs.get('conflict_retries', 3), kwargs.get('conflict_backoff', 0.05), kwargs.get('update_properties', False)
+    )
+
+
+def _generate_session_kwargs(ogm: Ogm, **kwargs):
+    def _report():
+        session_report = {'conflicts': ogm.conflict_counters}
+        if kwargs.get('vertex_cache', False):
+            session_report['vertex_cache'] = ogm.vertex_cache_counters
+        if kwargs.get('update_properties', False):
+            session_report['updates'] = ogm.update_counters
+        return session_report
+    return {'ogm': ogm, 'session_report': _report}
+
+
+@contextmanager
+def graph_session(num_workers: int, **kwargs):
+    """shares a single buffered Ogm between every graph_handler call made inside the block
+
+    Args:
+        num_workers: the number of threads which will push through the session, sizes the connection pool and
+            the number of requests the write buffer sends at once
+        **kwargs: the push_kwargs of the event, graph_buffer holds the flush limits for the write buffer,
+            parameterized sends the upserts as gremlin templates with bindings, vertex_cache skips the upserts for
+            vertexes known to exist and probe_vertexes (on by default) checks the rest against the reader first,
+            lean_writes asks only for the ids of the upserted elements and skips decoding them, conflict_retries and
+            conflict_backoff control the resending of writes which hit a ConcurrentModificationException and
+            update_properties rewrites the properties of existing vertexes which changed
+
+    Yields:
+        the extra kwargs to pass along to each graph_handler call
+    """
+    trident_driver = TridentDriver(pool_size=num_workers)
+    buffer_kwargs = {'max_sends': num_workers, 'discard_results': kwargs.get('lean_writes', False)}
+    buffer_kwargs.update(kwargs.get('graph_buffer', {}))
+    with trident_driver.buffered(**buffer_kwargs) as write_buffer:
+        yield _generate_session_kwargs(_build_ogm(trident_driver, write_buffer, **kwargs), **kwargs)
+
+
+@asynccontextmanager
+async def graph_async_session(max_in_flight: int, **kwargs):
+    """shares a single aiohttp session between every graph_handler_async call made inside the block
+
+    Args:
+        max_in_flight: the most requests the session may have open at once
+        **kwargs: the push_kwargs of the event, as for graph_session
+
+    Yields:
+        the extra kwargs to pass along to each graph_handler_async call
+    """
+    connector = aiohttp.TCPConnector(limit=max_in_flight)
+    async with aiohttp.ClientSession(connector=connector) as http_session:
+        ogm = _build_ogm(TridentDriver(), http_session=http_session, **kwargs)
+        yield _generate_session_kwargs(ogm, **kwargs)
+
+
+def _collect_pushed(source_vertex, kwargs):
+    pushed = [('source_vertex', source_vertex)]
+    if kwargs.get('target_vertex'):
+        pushed.append(('target_vertex', kwargs['target_vertex']))
+    if kwargs.get('edge'):
+        pushed.append(('edge', kwargs['edge']))
+    return pushed
 
 
 def graph_handler(source_vertex, **kwargs):
     logging.info(f'received a call to the graph_handler: {source_vertex}, {kwargs}')
-    graph_results = {}
-    ogm = Ogm()
-    logging.info(f'created ogm: {ogm}')
-    edge = kwargs.get('edge')
-    target_vertex = kwargs.get('target_vertex')
-    graph_results['source_vertex'] = ogm.graph_vertex(source_vertex)
-    if target_vertex:
-        graph_results['target_vertex'] = ogm.graph_vertex(target_vertex)
-    if edge:
-        graph_results['edge'] = ogm.graph_edge(edge)
-    return graph_results
+    ogm = kwargs.get('ogm')
+    if ogm is None:
+        ogm = _build_ogm(**kwargs)
+    logging.info(f'using ogm: {ogm}')
+    pushed = _collect_pushed(source_vertex, kwargs)
+    graph_results = ogm.graph_many([x[1] for x in pushed])
+    return {x[0]: graph_result for x, graph_result in zip(pushed, graph_results)}
+
+
+async def graph_handler_async(source_vertex, **kwargs):
+    logging.info(f'received a call to the graph_handler_async: {source_vertex}, {kwargs}')
+    ogm = kwargs['ogm']
+    pushed = _collect_pushed(source_vertex, kwargs)
+    graph_results = await ogm.graph_many_async([x[1] for x in pushed])
+    return {x[0]: graph_result for x, graph_result in zip(pushed, graph_results)}
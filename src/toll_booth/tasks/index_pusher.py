@@ -1,14 +1,18 @@
+import asyncio
+import functools
 import logging
-from typing import Union
+from contextlib import contextmanager, asynccontextmanager
+from typing import Union, Optional
 
+from toll_booth.obj.index.capacity import WriteCapacityLimiter
+from toll_booth.obj.index.index_filter import get_index_filter
 from toll_booth.obj.index.index_manager import IndexManager
 from toll_booth.obj.index.troubles import UniqueIndexViolationException
 from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
 
 
-def _index_object(index_manager: IndexManager, scalar: Union[InputVertex, InputEdge]):
-    try:
-        index_manager.index_object(scalar)
+def _generate_index_result(scalar: Union[InputVertex, InputEdge], outcome: Optional[Exception]):
+    if outcome is None:
         return {
             'status': 'succeeded',
             'operation': 'index_object',
@@ -16,33 +20,94 @@ def _index_object(index_manager: IndexManager, scalar: Union[InputVertex, InputE
                 'message': ''
             }
         }
-    except UniqueIndexViolationException as e:
-        logging.warning(f'attempted to index {scalar}, it seems it has already been indexed: {e.index_name}')
+    if isinstance(outcome, UniqueIndexViolationException):
+        logging.warning(f'attempted to index {scalar}, it seems it has already been indexed: {outcome.index_name}')
         return {
             'status': 'failed',
             'operation': 'index_object',
             'details': {
-                'message': f'attempted to index {scalar}, it seems it has already been indexed: {e.index_name}'
+                'message': f'attempted to index {scalar}, it seems it has already been indexed: {outcome.index_name}'
             }
         }
-    except Exception as e:
-        return {
-            'status': 'failed',
-            'operation': 'index_object',
-            'details': {
-                'message': e.args
-            }
+    return {
+        'status': 'failed',
+        'operation': 'index_object',
+        'details': {
+            'message': outcome.args
         }
+    }
+
+
+def _build_index_manager(**kwargs) -> IndexManager:
+    index_filter = None
+    if kwargs.get('index_filter', False):
+        index_filter = get_index_filter()
+    write_limiter = None
+    if kwargs.get('index_wcu_budget'):
+        write_limiter = WriteCapacityLimiter(kwargs['index_wcu_budget'], kwargs.get('index_wcu_burst'))
+    return IndexManager(
+        index_filter=index_filter, write_limiter=write_limiter, property_lookups=kwargs.get('property_lookups'))
+
+
+def _generate_session_kwargs(index_manager: IndexManager, **kwargs):
+    def _report():
+        session_report = {'capacity': index_manager.capacity_report}
+        if kwargs.get('index_filter', False):
+            session_report['index_filter'] = index_manager.filter_counters
+        return session_report
+    return {'index_manager': index_manager, 'session_report': _report}
+
+
+@contextmanager
+def index_session(num_workers: int, **kwargs):
+    """shares a single IndexManager between every index_handler call made inside the block
+
+    Args:
+        num_workers: the number of threads which will push through the session
+        **kwargs: the push_kwargs of the event, index_filter skips the conditional writes for objects known to
+            be indexed already, per the shared filter, and index_wcu_budget holds the writes of the push to that
+            many write units per second, with bursts of up to index_wcu_burst
+
+    Yields:
+        the extra kwargs to pass along to each index_handler call
+    """
+    yield _generate_session_kwargs(_build_index_manager(**kwargs), **kwargs)
+
+
+@asynccontextmanager
+async def index_async_session(max_in_flight: int, **kwargs):
+    """shares a single IndexManager between every index_handler_async call made inside the block
+
+    Args:
+        max_in_flight: the most pushes the session may have open at once
+        **kwargs: the push_kwargs of the event, as for index_session
+
+    Yields:
+        the extra kwargs to pass along to each index_handler_async call
+    """
+    yield _generate_session_kwargs(_build_index_manager(**kwargs), **kwargs)
+
+
+def _index_objects(source_vertex, **kwargs):
+    pushed = [('source_vertex', source_vertex)]
+    if kwargs.get('target_vertex'):
+        pushed.append(('target_vertex', kwargs['target_vertex']))
+    if kwargs.get('edge'):
+        pushed.append(('edge', kwargs['edge']))
+    index_manager = kwargs.get('index_manager')
+    if index_manager is None:
+        index_manager = _build_index_manager(**kwargs)
+    try:
+        outcomes = index_manager.index_objects([x[1] for x in pushed])
+    except Exception as e:
+        outcomes = [e for _ in pushed]
+    return {x[0]: _generate_index_result(x[1], outcome) for x, outcome in zip(pushed, outcomes)}
 
 
 def index_handler(source_vertex, **kwargs):
-    index_results = {}
-    index_manager = IndexManager()
-    edge = kwargs.get('edge')
-    target_vertex = kwargs.get('target_vertex')
-    index_results['source_vertex'] = _index_object(index_manager, source_vertex)
-    if target_vertex:
-        index_results['target_vertex'] = _index_object(index_manager, target_vertex)
-    if edge:
-        index_results['edge'] = _index_object(index_manager, edge)
-    return index_results
+    return _index_objects(source_vertex, **kwargs)
+
+
+async def index_handler_async(source_vertex, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(_index_objects, source_vertex, **kwargs))
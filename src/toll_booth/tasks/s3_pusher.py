@@ -1,15 +1,14 @@
+import asyncio
 import json
 import os
 from datetime import datetime
 from decimal import Decimal
 from typing import Union
 
-import boto3
-import rapidjson
 from botocore.exceptions import ClientError
 
+from toll_booth.obj.clients import get_resource
 from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
-from toll_booth.obj.serializers import FireHoseEncoder
 
 
 def _check_for_object(s3_object):
@@ -24,7 +23,7 @@ def _check_for_object(s3_object):
 
 def _store_to_s3(bucket_name, base_file_key, scalar: Union[InputVertex, InputEdge]):
     file_key = f'{base_file_key}/{scalar.internal_id}.json'
-    s3_resource = boto3.resource('s3')
+    s3_resource = get_resource('s3')
     s3_object = s3_resource.Object(bucket_name, file_key)
     if _check_for_object(s3_object):
         return {
@@ -36,7 +35,7 @@ def _store_to_s3(bucket_name, base_file_key, scalar: Union[InputVertex, InputEdg
                 'file_key': file_key
             }
         }
-    s3_object.put(Body=rapidjson.dumps(scalar.for_index, default=FireHoseEncoder.default))
+    s3_object.put(Body=scalar.for_index_json)
     return {
             'status': 'succeeded',
             'operation': 'store_to_s3',
@@ -58,3 +57,20 @@ def s3_handler(source_vertex: InputVertex, edge: InputEdge = None, target_vertex
     if edge:
         s3_results['edge'] = _store_to_s3(bucket_name, base_file_key, edge)
     return s3_results
+
+
+async def s3_handler_async(source_vertex: InputVertex,
+                           edge: InputEdge = None,
+                           target_vertex: InputVertex = None,
+                           **kwargs):
+    loop = asyncio.get_running_loop()
+    bucket_name = kwargs['bucket_name']
+    base_file_key = kwargs['base_file_key']
+    pushed = [('source_vertex', source_vertex)]
+    if target_vertex:
+        pushed.append(('target_vertex', target_vertex))
+    if edge:
+        pushed.append(('edge', edge))
+    s3_results = await asyncio.gather(
+        *(loop.run_in_executor(None, _store_to_s3, bucket_name, base_file_key, x[1]) for x in pushed))
+    return {x[0]: s3_result for x, s3_result in zip(pushed, s3_results)}
@@ -0,0 +1,124 @@
+import json
+import re
+import time
+
+import pytest
+from algernon import ajson
+
+from toll_booth.obj.graph.generators import create_vertex_command_from_scalar, create_edge_command_from_scalar
+from toll_booth.obj.scalars.inputs import InputVertex, InputEdge
+from toll_booth.obj.scalars.object_properties import ObjectProperty, LocalPropertyValue, SensitivePropertyValue, \
+    StoredPropertyValue
+
+
+def _reference_property_value(object_property: ObjectProperty) -> str:
+    property_value = object_property.property_value
+    if isinstance(property_value, SensitivePropertyValue):
+        stored_value = f'"{property_value.property_value}"'
+        property_map = {
+            '__typename': 'SensitivePropertyValue',
+            'data_type': property_value.data_type,
+            'pointer': property_value.property_value
+        }
+    elif isinstance(property_value, StoredPropertyValue):
+        stored_value = f'"{property_value.property_value}"'
+        property_map = {
+            '__type_name': 'StoredPropertyValue',
+            'data_type': property_value.data_type,
+            'storage_class': property_value.storage_class,
+            'storage_uri': property_value.storage_uri
+        }
+    else:
+        stored_value = property_value.property_value
+        if property_value.data_type == 'S':
+            stored_value = json.dumps(stored_value)
+        property_map = {
+            '__typename': 'LocalPropertyValue',
+            'data_type': property_value.data_type,
+            'property_value': property_value.property_value
+        }
+    property_name = object_property.property_name
+    return f"property('{property_name}', {stored_value}).property('{property_name}', '{ajson.dumps(property_map)}')"
+
+
+def _reference_vertex_command(vertex: InputVertex) -> str:
+    """the command text as the generator built it before the fragments were precompiled"""
+    object_properties = list(vertex.vertex_properties or []) + [vertex.id_value, vertex.identifier_stem]
+    property_commands = '.'.join(_reference_property_value(x) for x in object_properties)
+    command = f"g.V('{vertex.internal_id}').fold().coalesce(unfold(), addV('{vertex.vertex_type}')" \
+        f".property(id, '{vertex.internal_id}').{property_commands})"
+    return re.sub(r'\s+', ' ', command)
+
+
+def _reference_edge_command(edge: InputEdge) -> str:
+    object_properties = list(edge.edge_properties or []) + [edge.id_value, edge.identifier_stem]
+    property_commands = '.'.join(_reference_property_value(x) for x in object_properties)
+    command = f"g.E('{edge.internal_id}').fold().coalesce(unfold(), addE('{edge.edge_label}')" \
+        f".from(g.V('{edge.source_vertex_internal_id}')).to(g.V('{edge.target_vertex_internal_id}'))" \
+        f".property(id, '{edge.internal_id}').{property_commands})"
+    return re.sub(r'\s+', ' ', command)
+
+
+def _generate_property(pointer: int) -> ObjectProperty:
+    property_name = f'property_{pointer}'
+    property_kind = pointer % 5
+    if property_kind == 0:
+        return ObjectProperty(property_name, LocalPropertyValue(f'some  string value {pointer}', 'S'))
+    if property_kind == 1:
+        return ObjectProperty(property_name, LocalPropertyValue(str(pointer * 1.5), 'N'))
+    if property_kind == 2:
+        return ObjectProperty(property_name, LocalPropertyValue('true', 'B'))
+    if property_kind == 3:
+        return ObjectProperty(property_name, SensitivePropertyValue(property_name, '', f'pointer_{pointer}', 'S'))
+    return ObjectProperty(property_name, StoredPropertyValue(f's3://bucket/{pointer}.json', 's3', 'S'))
+
+
+def _generate_vertex(num_properties: int) -> InputVertex:
+    id_value = ObjectProperty('id_value', LocalPropertyValue('1001', 'S'))
+    identifier_stem = ObjectProperty('identifier_stem', LocalPropertyValue('#vertex#Synthetic#', 'S'))
+    vertex_properties = [_generate_property(x) for x in range(num_properties)]
+    return InputVertex('synthetic_internal_id', id_value, identifier_stem, 'Synthetic', vertex_properties)
+
+
+def _time_generator(generator, vertex: InputVertex, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        generator(vertex)
+    return time.perf_counter() - start
+
+
+@pytest.mark.generator_b
+class TestGeneratorThroughput:
+    @pytest.mark.parametrize('num_properties', [5, 50, 500])
+    def test_commands_per_second(self, num_properties):
+        vertex = _generate_vertex(num_properties)
+        iterations = max(50, 25000 // num_properties)
+        elapsed = _time_generator(create_vertex_command_from_scalar, vertex, iterations)
+        reference_elapsed = _time_generator(_reference_vertex_command, vertex, iterations)
+        assert len(vertex.vertex_properties) == num_properties
+        assert create_vertex_command_from_scalar(vertex) == _reference_vertex_command(vertex)
+        assert elapsed < reference_elapsed * 2
+
+    @pytest.mark.parametrize('num_properties', [0, 1, 5, 50])
+    def test_matches_reference_generator(self, num_properties):
+        vertex = _generate_vertex(num_properties)
+        assert create_vertex_command_from_scalar(vertex) == _reference_vertex_command(vertex)
+        edge = InputEdge('synthetic_edge_id', '_received_', 'synthetic_internal_id', 'other_internal_id',
+                         vertex.vertex_properties)
+        assert create_edge_command_from_scalar(edge) == _reference_edge_command(edge)
+
+    def test_command_text(self):
+        vertex = _generate_vertex(2)
+        string_map = {'__typename': 'LocalPropertyValue', 'data_type': 'S', 'property_value': 'some  string value 0'}
+        number_value = vertex.vertex_properties[1].property_value.property_value
+        number_map = {'__typename': 'LocalPropertyValue', 'data_type': 'N', 'property_value': number_value}
+        id_map = {'__typename': 'LocalPropertyValue', 'data_type': 'S', 'property_value': '1001'}
+        stem_map = {'__typename': 'LocalPropertyValue', 'data_type': 'S', 'property_value': '#vertex#Synthetic#'}
+        expected = "g.V('synthetic_internal_id').fold().coalesce(unfold(), addV('Synthetic')" \
+            ".property(id, 'synthetic_internal_id')" \
+            f".property('property_0', \"some string value 0\").property('property_0', '{ajson.dumps(string_map)}')" \
+            f".property('property_1', 1.5).property('property_1', '{ajson.dumps(number_map)}')" \
+            f".property('id_value', \"1001\").property('id_value', '{ajson.dumps(id_map)}')" \
+            f".property('identifier_stem', \"#vertex#Synthetic#\")" \
+            f".property('identifier_stem', '{ajson.dumps(stem_map)}'))"
+        assert create_vertex_command_from_scalar(vertex) == expected.replace('  ', ' ')
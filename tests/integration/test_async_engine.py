@@ -0,0 +1,364 @@
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+import toll_booth
+from toll_booth.obj.graph.vertex_cache import get_vertex_cache
+
+
+class _StubNeptuneHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.received.append(payload)
+        with self._track_hub(payload['gremlin']):
+            time.sleep(self.server.delay)
+        if 'broken' in payload['gremlin']:
+            self.send_response(500)
+            response = {'code': 'InternalFailureException', 'detailedMessage': 'stub failure'}
+        elif self._take_conflict(payload['gremlin']):
+            self.send_response(500)
+            response = {'code': 'ConcurrentModificationException', 'detailedMessage': 'stub conflict'}
+        else:
+            self.send_response(200)
+            response = {'result': {'data': {'@type': 'g:List', '@value': self._find_existing(payload['gremlin'])}}}
+        body = json.dumps(response).encode('utf-8')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @contextmanager
+    def _track_hub(self, command):
+        is_hub = "'hub'" in command
+        with self.server.lock:
+            self.server.hub_in_flight += is_hub
+            self.server.max_hub_in_flight = max(self.server.max_hub_in_flight, self.server.hub_in_flight)
+        try:
+            yield
+        finally:
+            with self.server.lock:
+                self.server.hub_in_flight -= is_hub
+
+    def _take_conflict(self, command):
+        with self.server.lock:
+            for internal_id, remaining in self.server.conflicts.items():
+                if remaining and f"'{internal_id}'" in command:
+                    self.server.conflicts[internal_id] -= 1
+                    return True
+        return False
+
+    def _find_existing(self, command):
+        if 'coalesce' in command or not command.startswith('g.V('):
+            return []
+        if 'union(id()' in command:
+            stored_hashes = self.server.stored_hashes
+            found_ids = [x for x in re.findall(r"'(\w+)'", command) if x in stored_hashes]
+            return [{'@type': 'g:List', '@value': [x, stored_hashes[x]]} for x in found_ids]
+        return [x for x in re.findall(r"'(\w+)'", command) if x in self.server.existing]
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubEventsClient:
+    def __init__(self):
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def put_events(self, Entries):
+        with self._lock:
+            self.entries.extend(Entries)
+        return {'FailedEntryCount': 0, 'Entries': [{'EventId': str(x)} for x, _ in enumerate(Entries)]}
+
+
+def _generate_vertex(internal_id):
+    return {
+        'internal_id': internal_id,
+        'vertex_type': 'Patient',
+        'id_value': {'property_value': internal_id, 'data_type': 'S'},
+        'identifier_stem': {'property_value': '#vertex#Patient#', 'data_type': 'S'},
+        'vertex_properties': {
+            'local_properties': [{'property_name': 'first_name', 'property_value': 'Harold', 'data_type': 'S'}]
+        }
+    }
+
+
+def _generate_event(num_leech_results):
+    leech_results = []
+    for pointer in range(num_leech_results):
+        source_id, target_id = f'source_{pointer}', f'target_{pointer}'
+        if pointer % 7 == 3:
+            target_id = f'broken_{pointer}'
+        leech_results.append({
+            'source_vertex': _generate_vertex(source_id),
+            'other_vertex': _generate_vertex(target_id),
+            'edge': {
+                'internal_id': f'edge_{pointer}',
+                'edge_label': '_received_',
+                'source_vertex_internal_id': source_id,
+                'target_vertex_internal_id': target_id
+            }
+        })
+    return {'aio': leech_results, 'num_workers': 4}
+
+
+@pytest.fixture
+def stub_neptune(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubNeptuneHandler)
+    server.received = []
+    server.existing = set()
+    server.conflicts = {}
+    server.stored_hashes = {}
+    server.delay = 0
+    server.lock = threading.Lock()
+    server.hub_in_flight = 0
+    server.max_hub_in_flight = 0
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    monkeypatch.setenv('GRAPH_DB_ENDPOINT', '127.0.0.1')
+    monkeypatch.setenv('GRAPH_DB_READER_ENDPOINT', '127.0.0.1')
+    monkeypatch.setenv('GRAPH_DB_PORT', str(server.server_address[1]))
+    monkeypatch.setenv('GRAPH_DB_SCHEME', 'http')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'stub_access_key')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'stub_secret_key')
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def skip_config():
+    with patch('toll_booth.handler._load_config'):
+        yield
+
+
+@pytest.mark.pusher_i
+class TestAsyncEngine:
+    def test_graph_engines_match(self, stub_neptune, mock_context):
+        event = _generate_event(40)
+        threaded_results = toll_booth.handler({**event, 'push_type': 'graph'}, mock_context)
+        async_results = toll_booth.handler(
+            {**event, 'push_type': 'graph', 'engine': 'asyncio', 'max_in_flight': 200}, mock_context)
+        assert threaded_results == async_results
+        for pointer, leech_result in enumerate(async_results['results']):
+            assert f"g.V('source_{pointer}')" in leech_result['source_vertex']['details']['command']
+            expected_status = 'failed' if pointer % 7 == 3 else 'succeeded'
+            assert leech_result['target_vertex']['status'] == expected_status
+            assert leech_result['source_vertex']['status'] == 'succeeded'
+
+    def test_event_engines_match(self, mock_context):
+        event = _generate_event(25)
+        events_client = _StubEventsClient()
+        with patch('toll_booth.tasks.event_pusher.get_client', return_value=events_client):
+            threaded_results = toll_booth.handler({**event, 'push_type': 'event'}, mock_context)
+            async_results = toll_booth.handler({**event, 'push_type': 'event', 'engine': 'asyncio'}, mock_context)
+        assert threaded_results == async_results
+        assert len(events_client.entries) == 2 * 25 * 3
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_adaptive_concurrency(self, stub_neptune, mock_context, engine):
+        event = _generate_event(40)
+        fixed_results = toll_booth.handler({**event, 'push_type': 'graph', 'engine': engine}, mock_context)
+        adaptive_results = toll_booth.handler({
+            **event, 'push_type': 'graph', 'engine': engine, 'max_in_flight': 4,
+            'adaptive_concurrency': {'min_limit': 1, 'max_limit': 8}
+        }, mock_context)
+        assert adaptive_results['results'] == fixed_results['results']
+        concurrency = adaptive_results['concurrency']
+        assert concurrency['initial_limit'] == 4
+        assert concurrency['outcomes']['error'] == 6
+        assert sum(concurrency['outcomes'].values()) == 40
+        assert any(x['reason'] == 'error' for x in concurrency['decisions'])
+        assert 1 <= concurrency['final_limit'] <= 8
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_continuation(self, stub_neptune, mock_context, engine):
+        event = {**_generate_event(10), 'push_type': 'graph', 'engine': engine}
+        mock_context.get_remaining_time_in_millis.side_effect = [5000, 500000]
+        stopped_results = toll_booth.handler(event, mock_context)
+        assert stopped_results['results'] == [None for _ in event['aio']]
+        assert not stub_neptune.received
+        continuation = stopped_results['continuation']
+        assert continuation == event
+        resumed_results = toll_booth.handler(continuation, mock_context)
+        assert 'continuation' not in resumed_results
+        assert all(x is not None for x in resumed_results['results'])
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_fan_out(self, stub_neptune, mock_context, engine):
+        event = {**_generate_event(20), 'engine': engine}
+        events_client = _StubEventsClient()
+        push_targets = [
+            {'push_type': 'event', 'depends_on': ['graph']},
+            {'push_type': 'graph', 'push_kwargs': {'parameterized': True}}
+        ]
+        with patch('toll_booth.tasks.event_pusher.get_client', return_value=events_client):
+            graph_results = toll_booth.handler(
+                {**event, 'push_type': 'graph', 'push_kwargs': {'parameterized': True}}, mock_context)
+            event_results = toll_booth.handler({**event, 'push_type': 'event'}, mock_context)
+            fan_out_results = toll_booth.handler({**event, 'push_targets': push_targets}, mock_context)
+        assert fan_out_results['results'] == {'graph': graph_results['results'], 'event': event_results['results']}
+        assert len(events_client.entries) == 2 * 20 * 3
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_deduplicate(self, stub_neptune, mock_context, engine):
+        event = {**_generate_event(20), 'push_type': 'graph', 'engine': engine}
+        for pointer, leech_result in enumerate(event['aio']):
+            leech_result['source_vertex'] = _generate_vertex('hub')
+            leech_result['other_vertex'] = _generate_vertex(f'target_{pointer}')
+            leech_result['edge']['source_vertex_internal_id'] = 'hub'
+            leech_result['edge']['target_vertex_internal_id'] = f'target_{pointer}'
+        expected_results = toll_booth.handler(event, mock_context)
+        stub_neptune.received.clear()
+        deduplicated_results = toll_booth.handler({**event, 'deduplicate': True}, mock_context)
+        assert deduplicated_results['results'] == expected_results['results']
+        assert deduplicated_results['deduplication'] == {'references': 60, 'objects': 41, 'collapsed': 19}
+        sent = ';'.join(x['gremlin'] for x in stub_neptune.received)
+        assert sent.count("g.V('hub')") == 1 + 20
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_batch_schedule(self, stub_neptune, mock_context, engine):
+        event = {**_generate_event(20), 'push_type': 'graph', 'engine': engine, 'schedule': 'batch'}
+        batch_results = toll_booth.handler(event, mock_context)
+        sent = ';'.join(x['gremlin'] for x in stub_neptune.received)
+        for pointer, leech_result in enumerate(batch_results['results']):
+            assert leech_result['source_vertex']['status'] == 'succeeded'
+            if pointer % 7 == 3:
+                assert leech_result['target_vertex']['status'] == 'failed'
+                assert leech_result['edge']['status'] == 'skipped'
+                assert f"g.E('edge_{pointer}')" not in sent
+                continue
+            assert leech_result['target_vertex']['status'] == 'succeeded'
+            assert leech_result['edge']['status'] == 'succeeded'
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_vertex_cache(self, stub_neptune, mock_context, engine):
+        get_vertex_cache().invalidate()
+        event = {**_generate_event(20), 'push_type': 'graph', 'engine': engine, 'push_kwargs': {'vertex_cache': True}}
+        first_results = toll_booth.handler(event, mock_context)
+        assert first_results['reports']['graph']['vertex_cache']['hits'] == 0
+        stub_neptune.received.clear()
+        second_results = toll_booth.handler(event, mock_context)
+        counters = second_results['reports']['graph']['vertex_cache']
+        assert counters['hits'] == counters['skipped'] == 37
+        assert counters['misses'] == counters['probed'] == 3
+        sent = ';'.join(x['gremlin'] for x in stub_neptune.received)
+        upserted = set(re.findall(r"addV\('Patient'\)\.property\(id, '(\w+)'\)", sent))
+        assert upserted == {'broken_3', 'broken_10', 'broken_17'}
+        for pointer, leech_result in enumerate(second_results['results']):
+            assert leech_result['source_vertex']['details']['skipped'] is True
+            assert leech_result['edge'] == first_results['results'][pointer]['edge']
+        get_vertex_cache().invalidate()
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_vertex_probe(self, stub_neptune, mock_context, engine):
+        get_vertex_cache().invalidate()
+        stub_neptune.existing.update(f'source_{x}' for x in range(20))
+        push_kwargs = {'vertex_cache': True, 'lean_writes': True}
+        event = {**_generate_event(20), 'push_type': 'graph', 'engine': engine, 'push_kwargs': push_kwargs}
+        for pointer, leech_result in enumerate(event['aio']):
+            leech_result['other_vertex'] = _generate_vertex(f'target_{pointer}')
+            leech_result['edge']['target_vertex_internal_id'] = f'target_{pointer}'
+        results = toll_booth.handler(event, mock_context)
+        counters = results['reports']['graph']['vertex_cache']
+        assert counters['probed'] == 40
+        assert counters['probe_hits'] == counters['skipped'] == 20
+        upserts = [x['gremlin'] for x in stub_neptune.received if 'coalesce' in x['gremlin']]
+        assert all(x.endswith('.id()') for x in ';'.join(upserts).split(';'))
+        assert not any("property(id, 'source_" in x for x in upserts)
+        get_vertex_cache().invalidate()
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_lean_writes_opt_in(self, stub_neptune, mock_context, engine):
+        event = {**_generate_event(5), 'push_type': 'graph', 'engine': engine}
+        toll_booth.handler(event, mock_context)
+        upserts = ';'.join(x['gremlin'] for x in stub_neptune.received if 'coalesce' in x['gremlin']).split(';')
+        assert upserts and not any(x.endswith('.id()') for x in upserts)
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_conflict_retries(self, stub_neptune, mock_context, engine):
+        stub_neptune.conflicts['edge_5'] = 3
+        event = {
+            **_generate_event(10), 'push_type': 'graph', 'engine': engine, 'push_kwargs': {'conflict_backoff': 0.001}
+        }
+        results = toll_booth.handler(event, mock_context)
+        assert results['results'][5]['edge']['status'] == 'succeeded'
+        assert results['reports']['graph']['conflicts'] == {'retried': 1, 'recovered': 1, 'exhausted': 0}
+        stub_neptune.conflicts['edge_5'] = 100
+        results = toll_booth.handler(event, mock_context)
+        assert results['results'][5]['edge']['status'] == 'failed'
+        assert results['reports']['graph']['conflicts'] == {'retried': 1, 'recovered': 0, 'exhausted': 1}
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_partition(self, stub_neptune, mock_context, engine):
+        event = {**_generate_event(16), 'push_type': 'graph', 'engine': engine, 'partition': True}
+        for pointer, leech_result in enumerate(event['aio']):
+            other_id = f'target_{pointer}' if pointer % 2 else 'hub'
+            leech_result['other_vertex'] = _generate_vertex(other_id)
+            leech_result['edge']['target_vertex_internal_id'] = other_id
+        stub_neptune.delay = 0.01
+        results = toll_booth.handler(event, mock_context)
+        assert stub_neptune.max_hub_in_flight == 1
+        assert all(x['edge']['status'] == 'succeeded' for x in results['results'])
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_update_properties(self, stub_neptune, mock_context, engine):
+        event = {
+            **_generate_event(6), 'push_type': 'graph', 'engine': engine, 'push_kwargs': {'update_properties': True}
+        }
+        for pointer, leech_result in enumerate(event['aio']):
+            leech_result['other_vertex'] = _generate_vertex(f'target_{pointer}')
+            leech_result['edge']['target_vertex_internal_id'] = f'target_{pointer}'
+        first_results = toll_booth.handler(event, mock_context)
+        assert first_results['reports']['graph']['updates']['upserted'] == 12
+        sent = ';'.join(x['gremlin'] for x in stub_neptune.received)
+        hashes_pattern = r"addV\('Patient'\)\.property\(id, '(\w+)'\).*?property\(single, '_property_hashes', '(.*?)'\)"
+        stub_neptune.stored_hashes.update(re.findall(hashes_pattern, sent))
+        assert len(stub_neptune.stored_hashes) == 12
+        stub_neptune.received.clear()
+        for leech_result in event['aio'][:2]:
+            leech_result['other_vertex']['vertex_properties']['local_properties'][0]['property_value'] = 'Maude'
+        second_results = toll_booth.handler(event, mock_context)
+        assert second_results['reports']['graph']['updates'] == {
+            'read': 12, 'read_failures': 0, 'upserted': 0, 'updated': 2, 'unchanged': 10, 'properties_sent': 2,
+            'properties_dropped': 0
+        }
+        sent = ';'.join(x['gremlin'] for x in stub_neptune.received).split(';')
+        vertex_writes = [x for x in sent if x.startswith('g.V(') and 'union(id()' not in x]
+        assert sorted(x[:len("g.V('target_0')")] for x in vertex_writes) == ["g.V('target_0')", "g.V('target_1')"]
+        assert all("sideEffect(properties('first_name').drop())" in x and 'Maude' in x for x in vertex_writes)
+        assert all(".property('id_value'" not in x for x in vertex_writes)
+        for leech_result in second_results['results'][2:]:
+            assert leech_result['target_vertex']['details']['skipped'] is True
+
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_update_drops_removed_properties(self, stub_neptune, mock_context, engine):
+        event = {
+            **_generate_event(2), 'push_type': 'graph', 'engine': engine, 'push_kwargs': {'update_properties': True}
+        }
+        for pointer, leech_result in enumerate(event['aio']):
+            leech_result['other_vertex'] = _generate_vertex(f'target_{pointer}')
+            leech_result['other_vertex']['vertex_properties']['local_properties'].append(
+                {'property_name': 'last_name', 'property_value': 'Bishop', 'data_type': 'S'})
+            leech_result['edge']['target_vertex_internal_id'] = f'target_{pointer}'
+        toll_booth.handler(event, mock_context)
+        sent = ';'.join(x['gremlin'] for x in stub_neptune.received)
+        hashes_pattern = r"addV\('Patient'\)\.property\(id, '(\w+)'\).*?property\(single, '_property_hashes', '(.*?)'\)"
+        stub_neptune.stored_hashes.update(re.findall(hashes_pattern, sent))
+        stub_neptune.received.clear()
+        event['aio'][0]['other_vertex']['vertex_properties']['local_properties'].pop()
+        results = toll_booth.handler(event, mock_context)
+        counters = results['reports']['graph']['updates']
+        assert counters['updated'] == 1 and counters['unchanged'] == 3
+        assert counters['properties_sent'] == 0 and counters['properties_dropped'] == 1
+        sent = ';'.join(x['gremlin'] for x in stub_neptune.received).split(';')
+        vertex_writes = [x for x in sent if x.startswith('g.V(') and 'union(id()' not in x]
+        assert len(vertex_writes) == 1 and vertex_writes[0].startswith("g.V('target_0')")
+        assert "sideEffect(properties('last_name').drop())" in vertex_writes[0]
+        assert ".property('first_name'" not in vertex_writes[0] and 'Bishop' not in vertex_writes[0]
+        assert '"last_name"' not in vertex_writes[0].split("'_property_hashes'")[1]
@@ -0,0 +1,77 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from toll_booth.obj.clients import ClientRegistry
+
+
+class MockSession:
+    """stands in for a boto3 session, handing out a new object for every client or resource built"""
+    def __init__(self):
+        self.built = []
+        self._lock = threading.Lock()
+
+    def client(self, service_name, config=None):
+        return self._build('client', service_name)
+
+    def resource(self, service_name, config=None):
+        return self._build('resource', service_name)
+
+    def _build(self, kind, service_name):
+        with self._lock:
+            built = (kind, service_name, len(self.built))
+            self.built.append(built)
+            return built
+
+
+@pytest.fixture
+def registry():
+    client_registry = ClientRegistry(10, 'standard', 3)
+    with patch.object(client_registry, '_get_session', return_value=MockSession()):
+        yield client_registry
+
+
+def _run_threads(registry, service_name, num_threads):
+    """fetches the resource for service_name from num_threads threads which are all alive at once"""
+    barrier = threading.Barrier(num_threads)
+    fetched = []
+
+    def _fetch():
+        fetched.append(registry.resource(service_name))
+        barrier.wait(2)
+    threads = [threading.Thread(target=_fetch) for _ in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(2)
+    return fetched
+
+
+@pytest.mark.pusher_i
+class TestClientRegistry:
+    def test_one_client_per_service(self, registry):
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(registry.client('dynamodb'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+        assert len(set(clients)) == 1
+        assert registry.client('s3') != clients[0]
+        assert len(registry._get_session().built) == 2
+
+    def test_resources_are_per_thread(self, registry):
+        resources = _run_threads(registry, 'dynamodb', 4)
+        assert len(set(resources)) == 4
+        assert registry.resource('dynamodb') == registry.resource('dynamodb')
+        assert registry.resource('s3') != registry.resource('dynamodb')
+
+    def test_resources_outlive_their_threads(self, registry):
+        first_invocation = _run_threads(registry, 'dynamodb', 4)
+        second_invocation = _run_threads(registry, 'dynamodb', 4)
+        assert set(second_invocation) == set(first_invocation)
+        third_invocation = _run_threads(registry, 'dynamodb', 6)
+        assert set(first_invocation) < set(third_invocation)
+        assert len(set(third_invocation)) == 6
+        assert len(registry._get_session().built) == 6
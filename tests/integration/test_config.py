@@ -0,0 +1,91 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from toll_booth.obj.config import ConfigurationCache
+
+_VARIABLE_NAMES = ['GRAPH_DB_ENDPOINT', 'INDEX_TABLE_NAME']
+
+
+class MockSsmClient:
+    """answers get_parameters with the current values, bumping the version of a parameter on each change"""
+    def __init__(self, values):
+        self.calls = 0
+        self._values = {}
+        self._versions = {}
+        for name, value in values.items():
+            self.set(name, value)
+
+    def set(self, name, value):
+        self._values[name] = value
+        self._versions[name] = self._versions.get(name, 0) + 1
+
+    def get_parameters(self, Names):
+        self.calls += 1
+        return {
+            'Parameters': [
+                {'Name': x, 'Value': self._values[x], 'Version': self._versions[x]} for x in Names if x in self._values
+            ],
+            'InvalidParameters': [x for x in Names if x not in self._values]
+        }
+
+
+@pytest.fixture
+def clock():
+    clock = {'now': 1000.0}
+    with patch('toll_booth.obj.config.time.monotonic', lambda: clock['now']):
+        yield clock
+
+
+@pytest.fixture
+def ssm_client():
+    ssm_client = MockSsmClient({'GRAPH_DB_ENDPOINT': 'writer.neptune', 'INDEX_TABLE_NAME': 'Indexes'})
+    with patch('toll_booth.obj.config.get_client', return_value=ssm_client), patch.dict(os.environ):
+        yield ssm_client
+
+
+@pytest.mark.pusher_i
+class TestConfigurationCache:
+    def test_loaded_once_within_ttl(self, clock, ssm_client):
+        configuration = ConfigurationCache(_VARIABLE_NAMES, ttl=300)
+        assert configuration.load() is True
+        clock['now'] += 299
+        assert configuration.load() is False
+        assert configuration.get('GRAPH_DB_ENDPOINT') == 'writer.neptune'
+        assert os.environ['INDEX_TABLE_NAME'] == 'Indexes'
+        assert ssm_client.calls == 1
+
+    def test_reloaded_once_ttl_passes(self, clock, ssm_client):
+        configuration = ConfigurationCache(_VARIABLE_NAMES, ttl=300)
+        configuration.load()
+        ssm_client.set('GRAPH_DB_ENDPOINT', 'new_writer.neptune')
+        clock['now'] += 300
+        assert configuration.get('GRAPH_DB_ENDPOINT') == 'new_writer.neptune'
+        assert os.environ['GRAPH_DB_ENDPOINT'] == 'new_writer.neptune'
+        assert configuration.parameter_versions == {'GRAPH_DB_ENDPOINT': 2, 'INDEX_TABLE_NAME': 1}
+        assert ssm_client.calls == 2
+
+    def test_reloaded_when_config_version_changes(self, clock, ssm_client):
+        configuration = ConfigurationCache(_VARIABLE_NAMES, ttl=300)
+        assert configuration.load('v1') is True
+        assert configuration.load('v1') is False
+        assert configuration.load() is False
+        ssm_client.set('GRAPH_DB_ENDPOINT', 'new_writer.neptune')
+        assert configuration.load('v2') is True
+        assert configuration.get('GRAPH_DB_ENDPOINT', 'v2') == 'new_writer.neptune'
+        assert configuration.load('v1') is True
+        assert ssm_client.calls == 3
+
+    def test_invalidate(self, clock, ssm_client):
+        configuration = ConfigurationCache(_VARIABLE_NAMES, ttl=300)
+        configuration.load()
+        configuration.invalidate()
+        assert configuration.load() is True
+        assert ssm_client.calls == 2
+
+    def test_invalid_parameters(self, clock, ssm_client):
+        configuration = ConfigurationCache(_VARIABLE_NAMES + ['MISSING_PARAMETER'], ttl=300)
+        configuration.load()
+        assert configuration.get('MISSING_PARAMETER') is None
+        assert configuration.get('INDEX_TABLE_NAME') == 'Indexes'
@@ -0,0 +1,106 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from toll_booth.obj.credentials import CredentialCache
+
+
+class MockClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class MockSecretStore:
+    """hands out a new secret on each fetch, failing while failing is set"""
+    def __init__(self):
+        self.fetches = 0
+        self.failing = False
+
+    def fetch(self):
+        self.fetches += 1
+        if self.failing:
+            raise RuntimeError('could not reach the secret store')
+        return f'secret_{self.fetches}'
+
+
+def _wait_for_refresh(cache: CredentialCache, credential_name: str):
+    credential = cache._credentials[credential_name]
+    stop_time = time.monotonic() + 2
+    while credential._refresh_lock.locked():
+        if time.monotonic() > stop_time:
+            raise AssertionError('the background refresh did not finish in time')
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def clock():
+    mock_clock = MockClock()
+    with patch('toll_booth.obj.credentials.time.monotonic', mock_clock.monotonic):
+        yield mock_clock
+
+
+@pytest.mark.pusher_i
+class TestCredentialCache:
+    def test_fetched_once_within_ttl(self, clock):
+        store, cache = MockSecretStore(), CredentialCache(ttl=60, refresh_ahead=10)
+        assert cache.get('trident_user_key', store.fetch) == 'secret_1'
+        clock.now += 30
+        assert cache.get('trident_user_key', store.fetch) == 'secret_1'
+        assert store.fetches == 1
+
+    def test_fetched_again_once_expired(self, clock):
+        store, cache = MockSecretStore(), CredentialCache(ttl=60, refresh_ahead=0)
+        cache.get('trident_user_key', store.fetch)
+        clock.now += 60
+        assert cache.get('trident_user_key', store.fetch) == 'secret_2'
+        assert store.fetches == 2
+
+    def test_refreshed_ahead_of_expiry(self, clock):
+        store, cache = MockSecretStore(), CredentialCache(ttl=60, refresh_ahead=10)
+        cache.get('trident_user_key', store.fetch)
+        clock.now += 55
+        assert cache.get('trident_user_key', store.fetch) == 'secret_1'
+        _wait_for_refresh(cache, 'trident_user_key')
+        assert cache.get('trident_user_key', store.fetch) == 'secret_2'
+        clock.now += 40
+        assert cache.get('trident_user_key', store.fetch) == 'secret_2'
+        assert store.fetches == 2
+
+    def test_failed_refresh_keeps_current_value(self, clock):
+        store, cache = MockSecretStore(), CredentialCache(ttl=60, refresh_ahead=10)
+        cache.get('trident_user_key', store.fetch)
+        store.failing = True
+        clock.now += 55
+        assert cache.get('trident_user_key', store.fetch) == 'secret_1'
+        _wait_for_refresh(cache, 'trident_user_key')
+        assert store.fetches == 2
+        assert cache.get('trident_user_key', store.fetch) == 'secret_1'
+        _wait_for_refresh(cache, 'trident_user_key')
+        assert store.fetches == 3
+        store.failing = False
+        clock.now += 5
+        assert cache.get('trident_user_key', store.fetch) == 'secret_4'
+
+    def test_failed_fetch_once_expired_raises(self, clock):
+        store, cache = MockSecretStore(), CredentialCache(ttl=60, refresh_ahead=0)
+        cache.get('trident_user_key', store.fetch)
+        store.failing = True
+        clock.now += 60
+        with pytest.raises(RuntimeError):
+            cache.get('trident_user_key', store.fetch)
+        store.failing = False
+        assert cache.get('trident_user_key', store.fetch) == 'secret_3'
+
+    def test_invalidate(self, clock):
+        store, cache = MockSecretStore(), CredentialCache(ttl=60, refresh_ahead=10)
+        cache.get('trident_user_key', store.fetch)
+        cache.get('secrets#rds', store.fetch)
+        cache.invalidate('trident_user_key')
+        assert cache.get('trident_user_key', store.fetch) == 'secret_3'
+        assert cache.get('secrets#rds', store.fetch) == 'secret_2'
+        cache.invalidate()
+        assert cache.get('secrets#rds', store.fetch) == 'secret_4'
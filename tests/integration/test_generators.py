@@ -0,0 +1,109 @@
+import re
+import threading
+
+import pytest
+
+from toll_booth.obj.graph.generators import create_vertex_template_from_scalar, namespace_bindings, \
+    create_vertex_command_from_scalar, create_vertex_update_command, generate_property_hashes
+from toll_booth.obj.graph.trident_driver import TridentWriteBuffer, _pack_commands
+from toll_booth.obj.scalars.inputs import InputVertex
+from toll_booth.obj.scalars.object_properties import ObjectProperty, LocalPropertyValue
+
+_VERTEX_ID_PATTERN = re.compile(r'^g\.V\((_b\w+)\)')
+
+
+def _generate_vertex(internal_id: str, vertex_type: str = 'Patient', property_name: str = 'first_name'):
+    id_value = ObjectProperty('id_value', LocalPropertyValue(internal_id, 'S'))
+    identifier_stem = ObjectProperty('identifier_stem', LocalPropertyValue(f'#vertex#{vertex_type}#', 'S'))
+    vertex_properties = [ObjectProperty(property_name, LocalPropertyValue(f'name of {internal_id}', 'S'))]
+    return InputVertex(internal_id, id_value, identifier_stem, vertex_type, vertex_properties)
+
+
+class MockTemplateNotary:
+    """resolves the vertex id binding of each traversal in a request, failing any which targets a bad vertex"""
+    pool_size = 1
+
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, command, bindings=None, discard_results=False):
+        with self._lock:
+            self.sent.append((command, bindings))
+        internal_ids = [bindings[_VERTEX_ID_PATTERN.match(x).group(1)] for x in command.split(';')]
+        if any(x.startswith('bad') for x in internal_ids):
+            raise RuntimeError(f'error passing command to remote database: {command}')
+        return internal_ids
+
+
+@pytest.mark.pusher_i
+class TestNamespacedBindings:
+    def test_colliding_bindings_are_renamed(self):
+        first_command, first_bindings = create_vertex_template_from_scalar(_generate_vertex('vertex_1'))
+        second_command, second_bindings = create_vertex_template_from_scalar(_generate_vertex('vertex_2'))
+        assert first_command == second_command
+        assert set(first_bindings) == set(second_bindings)
+        packed_command, packed_bindings = _pack_commands(
+            [(first_command, first_bindings), (second_command, second_bindings)])
+        assert len(packed_bindings) == len(first_bindings) + len(second_bindings)
+        first_packed, second_packed = packed_command.split(';')
+        assert first_packed.startswith('g.V(_b0_0)') and second_packed.startswith('g.V(_b1_0)')
+        assert packed_bindings['_b0_0'] == 'vertex_1' and packed_bindings['_b1_0'] == 'vertex_2'
+        for namespace, bindings in enumerate((first_bindings, second_bindings)):
+            for name, value in bindings.items():
+                assert packed_bindings[f'_b{namespace}_{name[2:]}'] == value
+
+    def test_every_binding_in_the_command_is_renamed(self):
+        command, bindings = create_vertex_template_from_scalar(_generate_vertex('vertex_1'))
+        renamed_command, renamed_bindings = namespace_bindings(command, bindings, 7)
+        assert set(re.findall(r'\b_b\d+(?:_\d+)?\b', renamed_command)) == set(renamed_bindings)
+        assert all(x.startswith('_b7_') for x in renamed_bindings)
+
+    def test_quoted_names_are_left_alone(self):
+        command, bindings = create_vertex_template_from_scalar(_generate_vertex('vertex_1', property_name='_b1'))
+        renamed_command, _ = namespace_bindings(command, bindings, 3)
+        assert "property('_b1', _b3_1)" in renamed_command
+
+    def test_results_map_to_their_traversal(self):
+        notary = MockTemplateNotary()
+        internal_ids = ['vertex_1', 'bad_vertex', 'vertex_3']
+        with TridentWriteBuffer(notary, max_commands=3, max_wait=60) as write_buffer:
+            futures = [
+                write_buffer.submit(*create_vertex_template_from_scalar(_generate_vertex(x))) for x in internal_ids
+            ]
+        assert len(notary.sent) == 4
+        assert futures[0].result() == ['vertex_1']
+        assert futures[2].result() == ['vertex_3']
+        with pytest.raises(RuntimeError):
+            futures[1].result()
+
+    def test_packed_results_map_to_their_traversal(self):
+        notary = MockTemplateNotary()
+        with TridentWriteBuffer(notary, max_commands=2, max_wait=60) as write_buffer:
+            futures = [
+                write_buffer.submit(*create_vertex_template_from_scalar(_generate_vertex(x)))
+                for x in ('vertex_1', 'vertex_2')
+            ]
+        assert len(notary.sent) == 1
+        assert futures[0].result() is None
+        assert futures[1].result() == ['vertex_1', 'vertex_2']
+
+
+@pytest.mark.pusher_i
+class TestVertexUpdateCommand:
+    def test_removed_properties_are_only_dropped(self):
+        vertex = _generate_vertex('vertex_1')
+        command = create_vertex_update_command(vertex, ['first_name', 'last_name'], generate_property_hashes(vertex))
+        assert ".sideEffect(properties('first_name').drop())" in command
+        assert ".sideEffect(properties('last_name').drop())" in command
+        assert ".property('first_name', \"name of vertex_1\")" in command
+        assert ".property('last_name'" not in command
+
+    def test_names_quoted_alike(self):
+        vertex = _generate_vertex('vertex_1', property_name="patient's \\ name")
+        quoted_name = "'patient\\'s \\\\ name'"
+        update_command = create_vertex_update_command(
+            vertex, ["patient's \\ name"], generate_property_hashes(vertex))
+        assert f'.sideEffect(properties({quoted_name}).drop())' in update_command
+        assert f'.property({quoted_name}, ' in update_command
+        assert f'.property({quoted_name}, ' in create_vertex_command_from_scalar(vertex)
@@ -0,0 +1,78 @@
+import csv
+import json
+from unittest.mock import patch
+
+import pytest
+
+import toll_booth
+
+
+def _generate_vertex(internal_id, vertex_type):
+    return {
+        'internal_id': internal_id,
+        'vertex_type': vertex_type,
+        'id_value': {'property_value': internal_id, 'data_type': 'S'},
+        'identifier_stem': {'property_value': f'#vertex#{vertex_type}#', 'data_type': 'S'},
+        'vertex_properties': {
+            'local_properties': [
+                {'property_name': 'first_name', 'property_value': 'Harold', 'data_type': 'S'},
+                {'property_name': 'visit_count', 'property_value': '12', 'data_type': 'N'},
+                {'property_name': 'active', 'property_value': 'true', 'data_type': 'B'}
+            ],
+            'stored_properties': [
+                {'property_name': 'notes', 'storage_uri': 's3://notes/note.txt', 'storage_class': 's3',
+                 'data_type': 'S'}
+            ]
+        }
+    }
+
+
+def _generate_event(num_leech_results, destination):
+    leech_results = []
+    for pointer in range(num_leech_results):
+        source_id, target_id = f'patient_{pointer}', f'provider_{pointer}'
+        leech_results.append({
+            'source_vertex': _generate_vertex(source_id, 'Patient'),
+            'other_vertex': _generate_vertex(target_id, 'Provider'),
+            'edge': {
+                'internal_id': f'edge_{pointer}',
+                'edge_label': '_treated_by_',
+                'source_vertex_internal_id': source_id,
+                'target_vertex_internal_id': target_id
+            }
+        })
+    push_kwargs = {'bulk_destination': str(destination), 'bulk_chunk_size': 4, 'bulk_export_id': 'test_export'}
+    return {'aio': leech_results, 'push_type': 'graph_bulk', 'push_kwargs': push_kwargs, 'num_workers': 3}
+
+
+def _read_rows(file_path):
+    with open(file_path) as csv_file:
+        return list(csv.DictReader(csv_file))
+
+
+@pytest.fixture(autouse=True)
+def skip_config():
+    with patch('toll_booth.handler._load_config'):
+        yield
+
+
+@pytest.mark.pusher_i
+class TestGraphBulk:
+    def test_graph_bulk(self, tmp_path, mock_context):
+        results = toll_booth.handler(_generate_event(10, tmp_path), mock_context)
+        assert all(y['status'] == 'succeeded' for x in results['results'] for y in x.values())
+        with open(tmp_path / 'manifest-test_export.json') as manifest_file:
+            manifest = json.load(manifest_file)
+        assert sorted((x['label'], x['rows']) for x in manifest['vertex_files']) == [
+            ('Patient', 2), ('Patient', 4), ('Patient', 4), ('Provider', 2), ('Provider', 4), ('Provider', 4)]
+        assert sum(x['rows'] for x in manifest['edge_files']) == 10
+        patient_rows = [y for x in sorted((tmp_path / 'vertices' / 'Patient').iterdir()) for y in _read_rows(x)]
+        assert sorted(x['~id'] for x in patient_rows) == sorted(f'patient_{x}' for x in range(10))
+        assert patient_rows[0]['~label'] == 'Patient'
+        assert patient_rows[0]['visit_count:Double'] == '12'
+        assert patient_rows[0]['active:Bool'] == 'true'
+        assert patient_rows[0]['notes:String'] == 's3://notes/note.txt'
+        assert patient_rows[0]['identifier_stem:String'] == '#vertex#Patient#'
+        edge_rows = [y for x in (tmp_path / 'edges' / '_treated_by_').iterdir() for y in _read_rows(x)]
+        edge = next(x for x in edge_rows if x['~id'] == 'edge_3')
+        assert (edge['~from'], edge['~to'], edge['~label']) == ('patient_3', 'provider_3', '_treated_by_')
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from toll_booth.obj.graph.graphson import GraphSONStreamDecoder
+
+
+def _generate_response(data):
+    return json.dumps({
+        'requestId': 'some_request_id',
+        'status': {'message': '', 'code': 200, 'attributes': {'@type': 'g:Map', '@value': []}},
+        'result': {'data': data, 'meta': {'@type': 'g:Map', '@value': []}}
+    }).encode('utf-8')
+
+
+def _decode(response_body, chunk_size):
+    decoder = GraphSONStreamDecoder()
+    elements = []
+    for pointer in range(0, len(response_body), chunk_size):
+        elements.extend(decoder.feed(response_body[pointer:pointer + chunk_size]))
+    elements.extend(decoder.close())
+    return elements
+
+
+@pytest.mark.pusher_i
+class TestGraphSONStreamDecoder:
+    @pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+    def test_list_elements(self, chunk_size):
+        elements = [
+            {'@type': 'g:Vertex', '@value': {'id': f'vertex_{x}', 'label': 'Patient', 'name': 'Ĥarold ]['}}
+            for x in range(50)
+        ]
+        elements.extend([12345, 'plain_id', True, None, 1.5])
+        response_body = _generate_response({'@type': 'g:List', '@value': elements})
+        assert _decode(response_body, chunk_size) == elements
+
+    def test_elements_arrive_early(self):
+        response_body = _generate_response({'@type': 'g:List', '@value': ['vertex_1', 'vertex_2', 'vertex_3']})
+        decoder = GraphSONStreamDecoder()
+        assert decoder.feed(response_body[:response_body.index(b'vertex_3')]) == ['vertex_1', 'vertex_2']
+
+    def test_data_which_is_not_a_list(self):
+        data = {'@type': 'g:Map', '@value': ['count', 3]}
+        assert _decode(_generate_response(data), 5) == [data]
+
+    def test_truncated_response(self):
+        response_body = _generate_response({'@type': 'g:List', '@value': ['vertex_1', 'vertex_2']})
+        decoder = GraphSONStreamDecoder()
+        decoder.feed(response_body[:response_body.index(b'vertex_2')])
+        with pytest.raises(RuntimeError):
+            decoder.close()
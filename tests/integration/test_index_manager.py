@@ -0,0 +1,537 @@
+import json
+import threading
+import time
+import zlib
+from unittest.mock import patch
+
+import pytest
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+import toll_booth
+from toll_booth.obj.index import index_filter
+from toll_booth.obj.index.capacity import WriteCapacityLimiter
+from toll_booth.obj.index.index_filter import BloomFilter, IndexedKeyFilter
+from toll_booth.obj.index.index_manager import IndexManager
+from toll_booth.obj.index.troubles import UniqueIndexViolationException
+from toll_booth.obj.scalars.inputs import InputVertex
+
+
+def _consumed_capacity(num_items, units_per_item=1.0, indexes=('internal_id_index', 'identifier_stem_index')):
+    table_units = num_items * units_per_item
+    return {
+        'TableName': 'test_index',
+        'CapacityUnits': table_units * (1 + len(indexes)),
+        'Table': {'CapacityUnits': table_units},
+        'GlobalSecondaryIndexes': {x: {'CapacityUnits': table_units} for x in indexes}
+    }
+
+
+class _StubDynamoTable:
+    """a local stand-in for the index table, keyed on sid_value and identifier_stem like the real one
+
+        a put conditioned on attribute_not_exists can only see the item stored under its own key, so that is the
+        only uniqueness the stand-in enforces, the same as DynamoDB
+    """
+    def __init__(self):
+        self.items = {}
+        self.put_calls = 0
+        self.transactions = []
+        self.paginated = []
+        self.pages_served = 0
+        self.get_calls = 0
+        self.throttle_puts = 0
+        self.throttle_transactions = 0
+        self.batch_writes = []
+        self.unprocess_requests = 0
+        self.unprocess_keys = 0
+        self.fail_batch_writes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(item):
+        return item['sid_value'], item['identifier_stem']
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        with self._lock:
+            self.put_calls += 1
+            if self.throttle_puts:
+                self.throttle_puts -= 1
+                raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'PutItem')
+            if ConditionExpression and self._key(Item) in self.items:
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem')
+            self.items[self._key(Item)] = Item
+        return {'ConsumedCapacity': _consumed_capacity(1)}
+
+    def delete_item(self, Key, ReturnValues='NONE', **kwargs):
+        with self._lock:
+            item = self.items.pop(self._key(Key), None)
+        if ReturnValues == 'ALL_OLD' and item is not None:
+            return {'Attributes': item}
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        with self._lock:
+            self.get_calls += 1
+            item = self.items.get(self._key(Key))
+        response = {'ConsumedCapacity': _consumed_capacity(1, 0.5, ())}
+        if item is not None:
+            response['Item'] = item
+        return response
+
+    def query(self, IndexName, KeyConditionExpression, **kwargs):
+        assert IndexName == 'internal_id_index'
+        key, internal_id = KeyConditionExpression.get_expression()['values']
+        with self._lock:
+            items = [x for x in self.items.values() if x.get(key.name) == internal_id]
+        return {'Count': len(items), 'Items': items, 'ConsumedCapacity': _consumed_capacity(1, 0.5, ())}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        deserializer = TypeDeserializer()
+        requests = RequestItems['test_index']
+        assert len(requests) <= 25
+        with self._lock:
+            self.batch_writes.append(len(requests))
+            if self.fail_batch_writes:
+                self.fail_batch_writes -= 1
+                raise ClientError({'Error': {'Code': 'InternalServerError'}}, 'BatchWriteItem')
+            unprocessed, requests = requests[:self.unprocess_requests], requests[self.unprocess_requests:]
+            self.unprocess_requests = max(self.unprocess_requests - len(unprocessed), 0)
+            for request in requests:
+                if 'PutRequest' in request:
+                    item = {x: deserializer.deserialize(y) for x, y in request['PutRequest']['Item'].items()}
+                    self.items[self._key(item)] = item
+                    continue
+                key = {x: deserializer.deserialize(y) for x, y in request['DeleteRequest']['Key'].items()}
+                self.items.pop(self._key(key), None)
+        response = {'ConsumedCapacity': [_consumed_capacity(len(requests), indexes=())]}
+        if unprocessed:
+            response['UnprocessedItems'] = {'test_index': unprocessed}
+        return response
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        deserializer = TypeDeserializer()
+        request = RequestItems['test_index']
+        keys = request['Keys']
+        assert len(keys) <= 100
+        projected = None
+        if 'ProjectionExpression' in request:
+            projected = {request['ExpressionAttributeNames'][x] for x in request['ProjectionExpression'].split(', ')}
+        serializer = TypeSerializer()
+        with self._lock:
+            unprocessed, keys = keys[:self.unprocess_keys], keys[self.unprocess_keys:]
+            self.unprocess_keys = max(self.unprocess_keys - len(unprocessed), 0)
+            items = [self.items.get(self._key({x: deserializer.deserialize(y) for x, y in z.items()})) for z in keys]
+        response = {
+            'Responses': {'test_index': [
+                {x: serializer.serialize(y) for x, y in z.items() if projected is None or x in projected}
+                for z in items if z is not None
+            ]},
+            'ConsumedCapacity': [_consumed_capacity(len(keys), 0.5, ())]
+        }
+        if unprocessed:
+            response['UnprocessedKeys'] = {'test_index': {'Keys': unprocessed}}
+        return response
+
+    def get_paginator(self, operation_name):
+        self.paginated.append(operation_name)
+        return _StubPaginator(self, operation_name)
+
+    def transact_write_items(self, TransactItems, **kwargs):
+        deserializer = TypeDeserializer()
+        puts = [x['Put'] for x in TransactItems]
+        items = [{x: deserializer.deserialize(y) for x, y in put['Item'].items()} for put in puts]
+        with self._lock:
+            self.transactions.append(len(items))
+            if self.throttle_transactions:
+                self.throttle_transactions -= 1
+                raise ClientError(
+                    {'Error': {'Code': 'TransactionCanceledException'},
+                     'CancellationReasons': [{'Code': 'ThrottlingError'} for _ in items]},
+                    'TransactWriteItems')
+            if len(items) > 100 or len({self._key(x) for x in items}) != len(items):
+                raise ClientError({'Error': {'Code': 'ValidationException'}}, 'TransactWriteItems')
+            reasons = [
+                {'Code': 'ConditionalCheckFailed'}
+                if put.get('ConditionExpression') and self._key(item) in self.items else {'Code': 'None'}
+                for put, item in zip(puts, items)
+            ]
+            if any(x['Code'] != 'None' for x in reasons):
+                raise ClientError(
+                    {'Error': {'Code': 'TransactionCanceledException'}, 'CancellationReasons': reasons},
+                    'TransactWriteItems')
+            for item in items:
+                self.items[self._key(item)] = item
+        return {'ConsumedCapacity': [_consumed_capacity(len(items), 2.0)]}
+
+
+class _StubPaginator:
+    """pages of two items, a scan filters on object_type alone and hands each segment the keys which hash to it"""
+    def __init__(self, table, operation_name):
+        self._table = table
+        self._operation_name = operation_name
+
+    def paginate(self, ExpressionAttributeValues, **kwargs):
+        with self._table._lock:
+            items = sorted(self._table.items.items())
+        if self._operation_name == 'query':
+            assert kwargs['KeyConditionExpression'] == '#lookup = :lookup'
+            assert kwargs['ExpressionAttributeNames'] == {'#lookup': 'sid_value'}
+            items = [y for x, y in items if x[0] == ExpressionAttributeValues[':lookup']['S']]
+        else:
+            object_type = ExpressionAttributeValues[':ot']['S']
+            items = [
+                y for x, y in items
+                if y.get('object_type') == object_type and zlib.crc32(x[0].encode()) % kwargs['TotalSegments'] ==
+                kwargs['Segment']
+            ]
+        serializer = TypeSerializer()
+        for pointer in range(0, max(len(items), 1), 2):
+            with self._table._lock:
+                self._table.pages_served += 1
+            yield {
+                'Items': [{x: serializer.serialize(y) for x, y in z.items()} for z in items[pointer:pointer + 2]],
+                'ConsumedCapacity': _consumed_capacity(1, 0.5, ())
+            }
+
+
+class _StubDynamoResource:
+    def __init__(self, table):
+        self._table = table
+
+    def Table(self, table_name):
+        return self._table
+
+
+def _generate_vertex(internal_id, first_name='Harold', vertex_type='Patient', identifier_stem='#vertex#Patient#'):
+    return {
+        'internal_id': internal_id,
+        'vertex_type': vertex_type,
+        'id_value': {'property_value': internal_id, 'data_type': 'S'},
+        'identifier_stem': {'property_value': identifier_stem, 'data_type': 'S'},
+        'vertex_properties': {
+            'local_properties': [
+                {'property_name': 'first_name', 'property_value': first_name, 'data_type': 'S'},
+                {'property_name': 'visit_count', 'property_value': '12', 'data_type': 'N'}
+            ]
+        }
+    }
+
+
+def _generate_scalars(internal_ids):
+    return [InputVertex.from_arguments(_generate_vertex(x)) for x in internal_ids]
+
+
+def _indexed_objects(table):
+    return {x: y for x, y in table.items.items() if not x[0].startswith('#lookup#')}
+
+
+@pytest.fixture
+def stub_table(monkeypatch):
+    table = _StubDynamoTable()
+    monkeypatch.setenv('INDEX_TABLE_NAME', 'test_index')
+    monkeypatch.setenv('INDEX_PROPERTY_LOOKUPS', 'true')
+    with patch('toll_booth.obj.index.index_manager.get_resource', return_value=_StubDynamoResource(table)), \
+            patch('toll_booth.obj.index.index_manager.get_client', return_value=table):
+        yield table
+
+
+@pytest.fixture(autouse=True)
+def skip_config():
+    with patch('toll_booth.handler._load_config'):
+        yield
+
+
+@pytest.mark.pusher_i
+class TestIndexManager:
+    def test_index_objects(self, stub_table):
+        outcomes = IndexManager().index_objects(_generate_scalars(f'patient_{x}' for x in range(250)))
+        assert outcomes == [None] * 250
+        assert stub_table.transactions == [100] * 10
+        assert stub_table.put_calls == 0
+        assert len(_indexed_objects(stub_table)) == 250
+        assert len(stub_table.items) == 250 * 4
+        stored = stub_table.items[('patient_7', '#vertex#Patient#')]
+        assert (stored['internal_id'], stored['object_class']) == ('patient_7', 'Vertex')
+
+    def test_index_objects_violation(self, stub_table):
+        index_manager = IndexManager()
+        index_manager.index_objects(_generate_scalars(['patient_3', 'patient_150']))
+        outcomes = index_manager.index_objects(_generate_scalars(f'patient_{x}' for x in range(200)))
+        assert [x for x, outcome in enumerate(outcomes) if outcome is not None] == [3, 150]
+        assert all(isinstance(outcomes[x], UniqueIndexViolationException) for x in (3, 150))
+        assert stub_table.transactions == [8, 100] + [4] * 25 + [100] * 6 + [4] * 25 + [100]
+        assert stub_table.put_calls == 0
+        assert len(_indexed_objects(stub_table)) == 200
+
+    def test_index_objects_repeated_key(self, stub_table):
+        outcomes = IndexManager().index_objects(_generate_scalars(['patient_1', 'patient_2', 'patient_1']))
+        assert outcomes[:2] == [None, None]
+        assert isinstance(outcomes[2], UniqueIndexViolationException)
+        assert len(_indexed_objects(stub_table)) == 2
+
+    def test_index_handler(self, stub_table, mock_context):
+        leech_results = [{
+            'source_vertex': _generate_vertex(f'patient_{x}'),
+            'other_vertex': _generate_vertex(f'patient_{x + 1}'),
+            'edge': {
+                'internal_id': f'edge_{x}',
+                'edge_label': '_referred_',
+                'source_vertex_internal_id': f'patient_{x}',
+                'target_vertex_internal_id': f'patient_{x + 1}'
+            }
+        } for x in range(0, 20, 2)]
+        event = {'aio': leech_results, 'push_type': 'index', 'num_workers': 1}
+        threaded_results = toll_booth.handler(event, mock_context)
+        assert all(y['status'] == 'succeeded' for x in threaded_results['results'] for y in x.values())
+        assert len(_indexed_objects(stub_table)) == 30
+        assert stub_table.put_calls == 0
+        async_results = toll_booth.handler({**event, 'engine': 'asyncio'}, mock_context)
+        assert all(y['status'] == 'failed' for x in async_results['results'] for y in x.values())
+        assert 'already been indexed' in async_results['results'][0]['source_vertex']['details']['message']
+
+    def test_find_potential_vertexes(self, stub_table):
+        index_manager = IndexManager()
+        index_manager.index_objects([
+            InputVertex.from_arguments(_generate_vertex('patient_1')),
+            InputVertex.from_arguments(_generate_vertex('patient_2', 'Maude')),
+            InputVertex.from_arguments(_generate_vertex('provider_1', vertex_type='Provider')),
+            InputVertex.from_arguments(_generate_vertex(
+                'stub_1', vertex_type='Unknown', identifier_stem='#vertex#stub#{"first_name": "Harold"}#'))
+        ])
+        properties = InputVertex.from_arguments(_generate_vertex('wanted')).vertex_properties
+        found = index_manager.find_potential_vertexes('Patient', properties, scan=False)
+        assert sorted(x['internal_id'] for x in found) == ['patient_1', 'stub_1']
+        patient = next(x for x in found if x['internal_id'] == 'patient_1')
+        assert patient['vertex_type'] == 'Patient'
+        assert patient['id_value']['property_value']['property_value'] == 'patient_1'
+        assert sorted(x['property_name'] for x in patient['vertex_properties']) == ['first_name', 'visit_count']
+        assert 'scan' not in stub_table.paginated
+        index_manager.delete_object('patient_1')
+        found = index_manager.find_potential_vertexes('Patient', properties, scan=False)
+        assert [x['internal_id'] for x in found] == ['stub_1']
+        assert not [x for x in stub_table.items if x[1] == 'patient_1']
+
+    def test_iter_potential_vertexes(self, stub_table, monkeypatch):
+        monkeypatch.setenv('num_index_scanners', '3')
+        index_manager = IndexManager()
+        index_manager.index_objects(_generate_scalars(f'patient_{x}' for x in range(60)))
+        scanned = index_manager.find_potential_vertexes('Patient', [], scan=True)
+        assert sorted(x['internal_id'] for x in scanned) == sorted(f'patient_{x}' for x in range(60))
+        assert stub_table.pages_served >= 30
+        stub_table.pages_served = 0
+        first = list(index_manager.iter_potential_vertexes('Patient', [], scan=True, limit=3))
+        assert len(first) == 3
+        assert stub_table.pages_served < 30
+        properties = InputVertex.from_arguments(_generate_vertex('wanted')).vertex_properties
+        assert len(list(index_manager.iter_potential_vertexes('Patient', properties, scan=False, limit=5))) == 5
+
+    def test_index_filter(self, stub_table):
+        index_manager = IndexManager(index_filter=IndexedKeyFilter(100))
+        assert index_manager.index_objects(_generate_scalars(f'patient_{x}' for x in range(10))) == [None] * 10
+        outcomes = index_manager.index_objects(_generate_scalars(f'patient_{x}' for x in range(12)))
+        assert all(isinstance(x, UniqueIndexViolationException) for x in outcomes[:10])
+        assert outcomes[10:] == [None, None]
+        assert stub_table.transactions == [40, 8]
+        assert stub_table.put_calls == 0
+        assert index_manager.filter_counters == {'hits': 10, 'false_positives': 0}
+        index_manager.delete_object('patient_3')
+        assert index_manager.index_objects(_generate_scalars(['patient_3'])) == [None]
+
+    def test_index_filter_snapshot(self, stub_table, tmp_path):
+        IndexManager().index_objects(_generate_scalars(f'patient_{x}' for x in range(5)))
+        snapshot_path = tmp_path / 'snapshot.txt'
+        snapshot_path.write_text(
+            ''.join(f'patient_{x}\t#vertex#Patient#\n' for x in range(4)) + 'patient_4\n' + 'patient_8\n')
+        bloom_filter = BloomFilter.from_snapshot(str(snapshot_path))
+        assert 'patient_8' in bloom_filter
+        assert sum(f'patient_{x}' in bloom_filter for x in range(100, 1100)) < 50
+        index_manager = IndexManager(index_filter=IndexedKeyFilter(100, bloom_filter))
+        outcomes = index_manager.index_objects(_generate_scalars(f'patient_{x}' for x in range(10)))
+        assert [x for x, outcome in enumerate(outcomes) if outcome is not None] == [0, 1, 2, 3, 4]
+        assert index_manager.filter_counters['hits'] == 5
+        assert index_manager.filter_counters['false_positives'] >= 1
+        assert stub_table.put_calls == 0
+
+    def test_index_handler_filter(self, stub_table, mock_context, monkeypatch):
+        monkeypatch.setattr(index_filter, '_index_filter', None)
+        event = {
+            'aio': [{'source_vertex': _generate_vertex(f'patient_{x}')} for x in range(6)],
+            'push_type': 'index', 'push_kwargs': {'index_filter': True}, 'num_workers': 2
+        }
+        first_results = toll_booth.handler(event, mock_context)
+        assert first_results['reports']['index']['index_filter'] == {'hits': 0, 'false_positives': 0}
+        second_results = toll_booth.handler({**event, 'engine': 'asyncio'}, mock_context)
+        assert all(x['source_vertex']['status'] == 'failed' for x in second_results['results'])
+        assert second_results['reports']['index']['index_filter'] == {'hits': 6, 'false_positives': 0}
+        assert stub_table.transactions == [4] * 6
+
+    def test_capacity_accounting(self, stub_table):
+        index_manager = IndexManager(property_lookups=False, write_limiter=WriteCapacityLimiter(100, 10))
+        started = time.monotonic()
+        for scalar in _generate_scalars(f'patient_{x}' for x in range(20)):
+            index_manager.index_object(scalar)
+        assert time.monotonic() - started >= 0.4
+        index_manager.index_objects(_generate_scalars(f'provider_{x}' for x in range(5)))
+        stub_table.throttle_puts = 1
+        with pytest.raises(ClientError):
+            index_manager.index_object(_generate_scalars(['patient_99'])[0])
+        index_manager.find_potential_vertexes('Patient', [], scan=True)
+        capacity = index_manager.capacity_report
+        assert capacity['write_units'] == 20 * 3 + 5 * 2 * 3
+        assert capacity['tables']['test_index']['write_units'] == 20 + 5 * 2
+        assert capacity['indexes'] == {
+            'internal_id_index': {'read_units': 0.0, 'write_units': 30.0},
+            'identifier_stem_index': {'read_units': 0.0, 'write_units': 30.0}
+        }
+        assert capacity['read_units'] > 0
+        assert capacity['throttles'] == 1
+        assert capacity['limiter_wait_seconds'] > 0
+
+    def test_limiter_settle_shortens_wait(self):
+        write_limiter = WriteCapacityLimiter(10, 10)
+        write_limiter.acquire(10)
+        waits = []
+
+        def _acquire():
+            started = time.monotonic()
+            write_limiter.acquire(5)
+            waits.append(time.monotonic() - started)
+        waiter = threading.Thread(target=_acquire)
+        waiter.start()
+        time.sleep(0.05)
+        write_limiter.settle(10, 2)
+        waiter.join(2)
+        assert waits and waits[0] < 0.25
+        assert 0 < write_limiter.waited < 0.25
+
+    def test_index_handler_capacity(self, stub_table, mock_context):
+        event = {
+            'aio': [{'source_vertex': _generate_vertex(f'patient_{x}')} for x in range(6)],
+            'push_type': 'index', 'push_kwargs': {'index_wcu_budget': 1000}, 'num_workers': 2
+        }
+        results = toll_booth.handler(event, mock_context)
+        assert results['reports']['index']['capacity']['write_units'] == 6 * 4 * 2 * 3
+        assert 'index_filter' not in results['reports']['index']
+
+    def test_delete_objects(self, stub_table, monkeypatch):
+        monkeypatch.setenv('INDEX_BATCH_BACKOFF', '0.001')
+        index_manager = IndexManager(index_filter=IndexedKeyFilter(100))
+        index_manager.index_objects(_generate_scalars(f'patient_{x}' for x in range(40)))
+        assert index_manager.get_object_keys(['patient_3', 'missing_1']) == {
+            'patient_3': {'identifier_stem': '#vertex#Patient#', 'sid_value': 'patient_3'}, 'missing_1': None}
+        stub_table.batch_writes.clear()
+        stub_table.unprocess_requests = 30
+        results = index_manager.delete_objects([f'patient_{x}' for x in range(30)] + ['missing_1'])
+        assert results['missing_1'] == {'found': False, 'lookups_deleted': False, 'deleted': False}
+        assert all(
+            results[f'patient_{x}'] == {'found': True, 'lookups_deleted': True, 'deleted': True} for x in range(30))
+        assert max(stub_table.batch_writes) == 25
+        assert sum(stub_table.batch_writes) == 30 * 3 + 30 + 30
+        assert len(stub_table.items) == 10 * 4
+        assert {y.get('internal_id', x[1]) for x, y in stub_table.items.items()} == {
+            f'patient_{x}' for x in range(30, 40)}
+        assert index_manager.capacity_report['throttles'] == 30
+        assert index_manager.index_objects(_generate_scalars(['patient_3'])) == [None]
+
+    def test_delete_objects_partial(self, stub_table, monkeypatch):
+        monkeypatch.setenv('INDEX_BATCH_BACKOFF', '0.001')
+        monkeypatch.setenv('INDEX_BATCH_RETRIES', '0')
+        index_manager = IndexManager()
+        index_manager.index_objects(_generate_scalars(f'patient_{x}' for x in range(40)))
+        stub_table.unprocess_keys = 2
+        stub_table.fail_batch_writes = 1
+        results = index_manager.delete_objects([f'patient_{x}' for x in range(40)])
+        undeleted = {x: y['error'] for x, y in results.items() if not y['lookups_deleted']}
+        unread = [x for x, y in undeleted.items() if 'read its property lookups' in y]
+        failed = [x for x, y in undeleted.items() if 'InternalServerError' in y]
+        assert len(unread) == 2
+        assert len(failed) == 9
+        assert all(results[x]['found'] and not results[x]['deleted'] for x in unread + failed)
+        assert sum(x['deleted'] for x in results.values()) == 40 - 2 - 9
+        assert {x[1] for x in stub_table.items if x[1].startswith('patient_')} == set(unread + failed)
+        assert len(stub_table.items) == 4 * 2 + 9 + 25
+        stub_table.fail_batch_writes = 1
+        results = index_manager.delete_objects(unread + failed)
+        assert 'InternalServerError' in results[unread[0]]['error']
+
+    def test_property_lookups_written_with_their_object(self, stub_table):
+        index_manager = IndexManager()
+        stub_table.throttle_transactions = 2
+        outcomes = index_manager.index_objects(_generate_scalars(['patient_1', 'patient_2']))
+        assert outcomes[1] is None
+        assert isinstance(outcomes[0], ClientError)
+        assert not [x for x in stub_table.items if x[1] == 'patient_1']
+        assert index_manager.capacity_report['throttles'] == 8 + 4
+        assert index_manager.index_objects(_generate_scalars(['patient_1'])) == [None]
+        properties = InputVertex.from_arguments(_generate_vertex('wanted')).vertex_properties
+        found = index_manager.find_potential_vertexes('Patient', properties, scan=False)
+        assert sorted(x['internal_id'] for x in found) == ['patient_1', 'patient_2']
+        lookup_items = [y for x, y in stub_table.items.items() if x[1] == 'patient_1' and x[0].startswith('#lookup#')]
+        assert len(lookup_items) == 3
+        lookup_attributes = {'sid_value', 'identifier_stem', 'property_lookups', 'indexed_object'}
+        assert all(set(x) == lookup_attributes for x in lookup_items)
+        assert lookup_items[0]['indexed_object'] == {'sid_value': 'patient_1', 'identifier_stem': '#vertex#Patient#'}
+
+    def test_lookups_past_a_transaction(self, stub_table):
+        vertex = _generate_vertex('patient_1')
+        vertex['vertex_properties']['local_properties'].extend(
+            {'property_name': f'code_{x}', 'property_value': f'value_{x}', 'data_type': 'S'} for x in range(118))
+        index_manager = IndexManager()
+        assert index_manager.index_objects([InputVertex.from_arguments(vertex)]) == [None]
+        assert stub_table.transactions == [100, 22]
+        assert len(stub_table.items) == 1 + 121
+        wanted = InputVertex.from_arguments(vertex).vertex_properties
+        past_cutoff = [x for x in wanted if x.property_name == 'code_110']
+        found = index_manager.find_potential_vertexes('Patient', past_cutoff, scan=False)
+        assert [x['internal_id'] for x in found] == ['patient_1']
+
+    def test_lookups_past_a_transaction_failed(self, stub_table):
+        vertex = _generate_vertex('patient_1')
+        vertex['vertex_properties']['local_properties'].extend(
+            {'property_name': f'code_{x}', 'property_value': f'value_{x}', 'data_type': 'S'} for x in range(118))
+        transact_write_items = stub_table.transact_write_items
+
+        def _fail_follow_up(TransactItems, **kwargs):
+            if stub_table.transactions:
+                stub_table.transactions.append(len(TransactItems))
+                raise ClientError({'Error': {'Code': 'InternalServerError'}}, 'TransactWriteItems')
+            return transact_write_items(TransactItems, **kwargs)
+        stub_table.transact_write_items = _fail_follow_up
+        index_manager = IndexManager(index_filter=IndexedKeyFilter(100))
+        outcomes = index_manager.index_objects([InputVertex.from_arguments(vertex)])
+        assert isinstance(outcomes[0], ClientError)
+        assert stub_table.transactions == [100, 22]
+        assert stub_table.items == {}
+        stub_table.transact_write_items = transact_write_items
+        assert index_manager.index_objects([InputVertex.from_arguments(vertex)]) == [None]
+        assert len(stub_table.items) == 1 + 121
+
+    def test_property_lookups_are_opt_in(self, stub_table, monkeypatch):
+        monkeypatch.delenv('INDEX_PROPERTY_LOOKUPS')
+        index_manager = IndexManager()
+        index_manager.index_objects(_generate_scalars(['patient_1', 'patient_2']))
+        assert stub_table.transactions == [2]
+        assert len(stub_table.items) == 2
+        properties = InputVertex.from_arguments(_generate_vertex('wanted')).vertex_properties
+        assert len(index_manager.find_potential_vertexes('Patient', properties)) == 2
+        assert 'query' not in stub_table.paginated
+
+    def test_for_index_is_shared(self, stub_table):
+        scalar = _generate_scalars(['patient_1'])[0]
+        for_index = scalar.for_index
+        assert scalar.for_index is for_index
+        with pytest.raises(TypeError):
+            for_index['object_class'] = 'Edge'
+        with pytest.raises(TypeError):
+            for_index['id_value']['property_value']['property_value'] = 'patient_2'
+        with pytest.raises(TypeError):
+            for_index['first_name']['property_value'] = 'Maude'
+        index_item = scalar.copy_for_index()
+        index_item['id_value']['property_value']['property_value'] = 'patient_2'
+        assert for_index['id_value']['property_value']['property_value'] == 'patient_1'
+        IndexManager().index_object(scalar)
+        assert 'property_lookups' not in scalar.for_index
+        assert 'property_lookups' in stub_table.items[('patient_1', '#vertex#Patient#')]
+        assert scalar.for_index_json is scalar.for_index_json
+        assert json.loads(scalar.for_index_json)['internal_id'] == 'patient_1'
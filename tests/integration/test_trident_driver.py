@@ -0,0 +1,194 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from toll_booth.obj.graph.trident_driver import TridentNotary, TridentWriteBuffer
+
+
+class MockNotary:
+    """stands in for a TridentNotary, recording each request and failing any which carries a bad traversal"""
+    def __init__(self, pool_size: int = 10, gate: threading.Event = None):
+        self.pool_size = pool_size
+        self.sent = []
+        self.peak_in_flight = 0
+        self._in_flight = 0
+        self._gate = gate
+        self._lock = threading.Lock()
+
+    def send(self, command, bindings=None, discard_results=False):
+        with self._lock:
+            self.sent.append((command, bindings))
+            self._in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+        try:
+            if self._gate is not None:
+                self._gate.wait(5)
+            if 'bad' in command:
+                raise RuntimeError(f'error passing command to remote database: {command}')
+            return None if discard_results else [command]
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+def _submit_in_thread(write_buffer, command):
+    submitted = []
+    thread = threading.Thread(target=lambda: submitted.append(write_buffer.submit(command)), daemon=True)
+    thread.start()
+    return thread, submitted
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    stop_time = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > stop_time:
+            raise AssertionError('condition was not met in time')
+        time.sleep(0.005)
+
+
+@pytest.mark.pusher_i
+class TestTridentWriteBuffer:
+    def test_flush_by_count(self):
+        notary = MockNotary()
+        with TridentWriteBuffer(notary, max_commands=3, max_wait=60) as write_buffer:
+            futures = [write_buffer.submit(f'g.V("{x}")') for x in range(3)]
+            assert len(notary.sent) == 1
+            assert notary.sent[0][0] == 'g.V("0");g.V("1");g.V("2")'
+            assert all(x.done() for x in futures)
+
+    def test_flush_by_bytes(self):
+        notary = MockNotary()
+        with TridentWriteBuffer(notary, max_commands=50, max_bytes=20, max_wait=60) as write_buffer:
+            first = write_buffer.submit('g.V("vertex_1")')
+            assert not notary.sent
+            second = write_buffer.submit('g.V("vertex_2")')
+            assert [x[0] for x in notary.sent] == ['g.V("vertex_1")']
+            assert first.done() and not second.done()
+        assert [x[0] for x in notary.sent] == ['g.V("vertex_1")', 'g.V("vertex_2")']
+
+    def test_flush_by_max_wait(self):
+        notary = MockNotary()
+        with TridentWriteBuffer(notary, max_commands=50, max_wait=0.05) as write_buffer:
+            future = write_buffer.submit('g.V("vertex_1")')
+            assert future.result(timeout=2) == ['g.V("vertex_1")']
+            assert notary.sent == [('g.V("vertex_1")', None)]
+
+    def test_results_kept(self):
+        notary = MockNotary()
+        with TridentWriteBuffer(notary, max_commands=2, max_wait=60) as write_buffer:
+            futures = [write_buffer.submit(f'g.V("{x}")') for x in range(2)]
+        assert [x.result() for x in futures] == [None, ['g.V("0");g.V("1")']]
+
+    def test_results_discarded(self):
+        notary = MockNotary()
+        with TridentWriteBuffer(notary, max_commands=2, max_wait=60, discard_results=True) as write_buffer:
+            futures = [write_buffer.submit(f'g.V("{x}")') for x in range(2)]
+        assert [x.result() for x in futures] == [None, None]
+
+    def test_sends_concurrently(self):
+        gate = threading.Event()
+        notary = MockNotary(gate=gate)
+        with TridentWriteBuffer(notary, max_commands=1, max_wait=60, max_sends=3) as write_buffer:
+            threads = [_submit_in_thread(write_buffer, f'g.V("{x}")')[0] for x in range(3)]
+            _wait_for(lambda: notary.peak_in_flight == 3)
+            gate.set()
+            for thread in threads:
+                thread.join(2)
+        assert len(notary.sent) == 3
+
+    def test_back_pressure(self):
+        gate = threading.Event()
+        notary = MockNotary(gate=gate)
+        write_buffer = TridentWriteBuffer(notary, max_commands=1, max_wait=60, max_pending=2, max_sends=1)
+        _submit_in_thread(write_buffer, 'g.V("vertex_1")')
+        _wait_for(lambda: len(notary.sent) == 1)
+        write_buffer.submit('g.V("vertex_2")')
+        write_buffer.submit('g.V("vertex_3")')
+        blocked_thread, submitted = _submit_in_thread(write_buffer, 'g.V("vertex_4")')
+        time.sleep(0.1)
+        assert blocked_thread.is_alive() and not submitted
+        gate.set()
+        blocked_thread.join(2)
+        assert submitted
+        write_buffer.close()
+        assert sorted(x[0] for x in notary.sent) == [f'g.V("vertex_{x}")' for x in range(1, 5)]
+        assert submitted[0].done()
+
+    def test_isolate_failures(self):
+        notary = MockNotary()
+        with TridentWriteBuffer(notary, max_commands=3, max_wait=60) as write_buffer:
+            futures = [write_buffer.submit(x) for x in ('g.V("good_1")', 'g.V("bad")', 'g.V("good_2")')]
+        assert [x[0] for x in notary.sent] == [
+            'g.V("good_1");g.V("bad");g.V("good_2")', 'g.V("good_1")', 'g.V("bad")', 'g.V("good_2")']
+        assert futures[0].result() == ['g.V("good_1")'] and futures[2].result() == ['g.V("good_2")']
+        with pytest.raises(RuntimeError):
+            futures[1].result()
+
+    def test_failures_not_isolated(self):
+        notary = MockNotary()
+        with TridentWriteBuffer(notary, max_commands=2, max_wait=60, isolate_failures=False) as write_buffer:
+            futures = [write_buffer.submit(x) for x in ('g.V("good_1")', 'g.V("bad")')]
+        assert len(notary.sent) == 1
+        assert all(isinstance(x.exception(), RuntimeError) for x in futures)
+
+    def test_closed_buffer(self):
+        write_buffer = TridentWriteBuffer(MockNotary())
+        write_buffer.close()
+        with pytest.raises(RuntimeError):
+            write_buffer.submit('g.V("vertex_1")')
+
+
+@pytest.fixture
+def notary_registry():
+    with patch.object(TridentNotary, '_registry', {}):
+        yield TridentNotary._registry
+
+
+@pytest.mark.pusher_i
+class TestTridentNotary:
+    def test_signing_key_cached_per_day_and_secret(self):
+        notary = TridentNotary('some.neptune.endpoint')
+        with patch.object(notary, '_derive_signature_key', wraps=notary._derive_signature_key) as derive:
+            first_key = notary._get_signature_key('20261017', 'secret_key')
+            assert notary._get_signature_key('20261017', 'secret_key') is first_key
+            assert derive.call_count == 1
+            assert notary._get_signature_key('20261018', 'secret_key') != first_key
+            assert notary._get_signature_key('20261018', 'rotated_secret_key') is not None
+            assert derive.call_count == 3
+
+    def test_cached_signing_key_matches_derived(self):
+        notary = TridentNotary('some.neptune.endpoint')
+        notary._get_signature_key('20261017', 'secret_key')
+        cached_signature = notary._generate_signature('string_to_sign', '20261017', 'secret_key')
+        uncached_signature = TridentNotary('some.neptune.endpoint')._generate_signature(
+            'string_to_sign', '20261017', 'secret_key')
+        assert cached_signature == uncached_signature
+
+    def test_one_notary_per_endpoint(self, notary_registry):
+        notary = TridentNotary.for_endpoint('some.neptune.endpoint')
+        assert TridentNotary.for_endpoint('some.neptune.endpoint') is notary
+        assert TridentNotary.for_endpoint('other.neptune.endpoint') is not notary
+        assert len(notary_registry) == 2
+
+    def test_registry_keyed_by_port(self, notary_registry):
+        notary = TridentNotary.for_endpoint('some.neptune.endpoint')
+        with patch.dict('os.environ', {'GRAPH_DB_PORT': '8183'}):
+            assert TridentNotary.for_endpoint('some.neptune.endpoint') is not notary
+
+    def test_missing_endpoint(self, notary_registry):
+        with pytest.raises(RuntimeError):
+            TridentNotary.for_endpoint(None)
+
+    def test_pool_only_grows(self, notary_registry):
+        notary = TridentNotary.for_endpoint('some.neptune.endpoint', pool_size=4)
+        first_adapter = notary._session.adapters[f'{notary._scheme}://']
+        assert TridentNotary.for_endpoint('some.neptune.endpoint', pool_size=2) is notary
+        assert notary.pool_size == 4
+        assert notary._session.adapters[f'{notary._scheme}://'] is first_adapter
+        with patch.object(first_adapter, 'close', wraps=first_adapter.close) as close:
+            TridentNotary.for_endpoint('some.neptune.endpoint', pool_size=8)
+            close.assert_called_once()
+        assert notary.pool_size == 8
+        assert notary._session.adapters[f'{notary._scheme}://'] is not first_adapter